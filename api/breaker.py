@@ -0,0 +1,285 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Awaitable, Callable, Deque, Dict, Iterator, Tuple, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar('T')
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+# Numeric form for /metrics
+STATE_CODES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+
+class BreakerOpen(Exception):
+    """Raised instead of calling a dependency whose breaker is open"""
+
+    def __init__(self, name: str, retry_in: float):
+        super().__init__(f"{name} circuit is open (next probe in {retry_in:.1f}s)")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class _Call:
+    """One guarded call: carries its timeout and reports the outcome to the breaker on exit"""
+
+    __slots__ = ('breaker', 'op', 'timeout', 'probe', 'started', 'bad', 'away')
+
+    def __init__(self, breaker: 'CircuitBreaker', op: str, timeout: float, probe: bool):
+        self.breaker = breaker
+        self.op = op
+        self.timeout = timeout
+        self.probe = probe
+        self.bad = False
+        self.away = False
+
+    def fail(self):
+        """Count the call as failed even though it returned (e.g. an HTTP 5xx)"""
+        self.bad = True
+
+    @contextmanager
+    def outside(self) -> Iterator[None]:
+        """Our own work in the middle of a call (e.g. forwarding a streamed chunk): its time is left
+        out of the call's latency, and an error raised in it says nothing about the dependency"""
+        left = time.monotonic()
+        self.away = True
+        yield
+        self.away = False
+        self.started += time.monotonic() - left
+
+    def __enter__(self) -> '_Call':
+        self.started = time.monotonic()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None and (self.away or issubclass(exc_type, asyncio.CancelledError)):
+            # The caller gave up or failed on its own; that says nothing about the dependency
+            self.breaker._abandon(self)
+        else:
+            timed_out = exc_type is not None and issubclass(exc_type, asyncio.TimeoutError)
+            self.breaker._record(self, time.monotonic() - self.started, failed=self.bad or exc_type is not None,
+                                 timed_out=timed_out)
+        return False
+
+
+class CircuitBreaker:
+    """Per-dependency circuit breaker with adaptive timeouts.
+
+    Outcomes from the last `window` seconds are kept. Once there are at least `min_calls`, the
+    breaker opens when the share of failures reaches `error_rate`, or the share of calls slower
+    than `slow_call` seconds reaches `slow_rate`. While open, calls fail at once with BreakerOpen.
+    After `open_seconds` a few probe calls are let through (half-open): if they all succeed the
+    breaker closes, if any fails it opens again for twice as long, up to `max_open_seconds`.
+
+    Timeouts follow observed latency: `multiplier` times the recent p99 for that operation,
+    clamped to [min_timeout, the operation's max_timeout].
+    """
+
+    LATENCY_SAMPLES = 200
+
+    def __init__(self, name: str, window: float = 60.0, min_calls: int = 10, error_rate: float = 0.5,
+                 slow_call: float = 5.0, slow_rate: float = 0.8, open_seconds: float = 15.0,
+                 max_open_seconds: float = 300.0, probes: int = 2, min_timeout: float = 1.0,
+                 max_timeout: float = 10.0, multiplier: float = 2.0, min_samples: int = 20,
+                 enabled: bool = True):
+        self.name = name
+        self.window = window
+        self.min_calls = min_calls
+        self.error_rate = error_rate
+        self.slow_call = slow_call
+        self.slow_rate = slow_rate
+        self.open_seconds = open_seconds
+        self.max_open_seconds = max_open_seconds
+        self.probes = probes
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.multiplier = multiplier
+        self.min_samples = min_samples
+        self.enabled = enabled
+        self.state = CLOSED
+        self._outcomes: Deque[Tuple[float, bool, bool]] = deque()  # (finished_at, failed, slow)
+        self._failures = 0
+        self._slow = 0
+        self._latencies: Dict[str, Deque[float]] = {}
+        self._opened_for = open_seconds
+        self._retry_at = 0.0
+        self._probes_in_flight = 0
+        self._probe_successes = 0
+        self._stats = {'calls': 0, 'failures': 0, 'rejected': 0, 'opened': 0, 'timeouts': 0}
+
+    @classmethod
+    def from_env(cls, name: str, **defaults) -> 'CircuitBreaker':
+        """Defaults overridden by BREAKER_<NAME>_<SETTING>, e.g. BREAKER_TENOR_ERROR_RATE=0.3"""
+        settings = dict(defaults)
+        for setting in ('window', 'error_rate', 'slow_call', 'slow_rate', 'open_seconds',
+                        'max_open_seconds', 'min_timeout', 'max_timeout', 'multiplier'):
+            value = os.getenv(f"BREAKER_{name.upper()}_{setting.upper()}")
+            if value is not None:
+                settings[setting] = float(value)
+        for setting in ('min_calls', 'probes', 'min_samples'):
+            value = os.getenv(f"BREAKER_{name.upper()}_{setting.upper()}")
+            if value is not None:
+                settings[setting] = int(value)
+        settings.setdefault('enabled', os.getenv('BREAKERS', '1') != '0')
+        return cls(name, **settings)
+
+    def timeout(self, op: str = 'default', max_timeout: float = None) -> float:
+        """Deadline for the next `op` call, from its recent latency"""
+        ceiling = max_timeout or self.max_timeout
+        samples = self._latencies.get(op)
+        if samples is None or len(samples) < self.min_samples:
+            return ceiling
+        p99 = sorted(samples)[int(len(samples) * 0.99)]
+        return min(ceiling, max(self.min_timeout, p99 * self.multiplier))
+
+    def retry_in(self) -> float:
+        return max(0.0, self._retry_at - time.monotonic()) if self.state == OPEN else 0.0
+
+    def guard(self, op: str = 'default', max_timeout: float = None) -> _Call:
+        """Context manager for one call; raises BreakerOpen if the call must not be made.
+
+            with breaker.guard('search') as call:
+                response = await asyncio.wait_for(request(timeout=call.timeout), call.timeout)
+        """
+        probe = False
+        if self.state == OPEN and time.monotonic() >= self._retry_at:
+            self.state = HALF_OPEN
+            self._probes_in_flight = 0
+            self._probe_successes = 0
+            logger.info(f"{self.name} circuit half-open, probing")
+        if self.state == OPEN:
+            self._stats['rejected'] += 1
+            raise BreakerOpen(self.name, self.retry_in())
+        if self.state == HALF_OPEN:
+            if self._probes_in_flight + self._probe_successes >= self.probes:
+                self._stats['rejected'] += 1
+                raise BreakerOpen(self.name, 0.0)
+            self._probes_in_flight += 1
+            probe = True
+        self._stats['calls'] += 1
+        return _Call(self, op, self.timeout(op, max_timeout), probe)
+
+    async def call(self, fn: Callable[[float], Awaitable[T]], op: str = 'default', max_timeout: float = None,
+                   failed: Callable[[T], bool] = None) -> T:
+        """Await `fn(timeout)` under the breaker and that timeout; `failed(result)` marks bad results"""
+        with self.guard(op, max_timeout) as call:
+            result = await asyncio.wait_for(fn(call.timeout), call.timeout)
+            if failed is not None and failed(result):
+                call.fail()
+            return result
+
+    def _trim(self, now: float):
+        cutoff = now - self.window
+        while self._outcomes and self._outcomes[0][0] < cutoff:
+            _, failed, slow = self._outcomes.popleft()
+            self._failures -= failed
+            self._slow -= slow
+
+    def _open(self, now: float, reason: str):
+        self.state = OPEN
+        self._retry_at = now + self._opened_for
+        self._stats['opened'] += 1
+        logger.warning(f"{self.name} circuit opened for {self._opened_for:g}s: {reason}")
+
+    def _close(self):
+        self.state = CLOSED
+        self._opened_for = self.open_seconds
+        self._outcomes.clear()
+        self._failures = self._slow = 0
+        logger.info(f"{self.name} circuit closed")
+
+    def _abandon(self, call: _Call):
+        if call.probe:
+            self._probes_in_flight -= 1
+
+    def _record(self, call: _Call, seconds: float, failed: bool, timed_out: bool = False):
+        now = time.monotonic()
+        if failed:
+            self._stats['failures'] += 1
+        if timed_out:
+            self._stats['timeouts'] += 1
+            # Took at least the whole timeout: counting that lets the timeout grow when the
+            # dependency slows down, instead of staying fitted to the calls that were fast enough
+            seconds = max(seconds, call.timeout)
+        if not failed or timed_out:
+            samples = self._latencies.get(call.op)
+            if samples is None:
+                samples = self._latencies[call.op] = deque(maxlen=self.LATENCY_SAMPLES)
+            samples.append(seconds)
+
+        if call.probe:
+            self._probes_in_flight -= 1
+            if self.state != HALF_OPEN:
+                return
+            if failed:
+                self._opened_for = min(self._opened_for * 2, self.max_open_seconds)
+                self._open(now, "probe failed")
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.probes:
+                    self._close()
+            return
+        if self.state != CLOSED:
+            return  # a call that started before the breaker opened
+
+        slow = not failed and seconds >= self.slow_call
+        self._outcomes.append((now, failed, slow))
+        self._failures += failed
+        self._slow += slow
+        self._trim(now)
+        total = len(self._outcomes)
+        if not self.enabled or total < self.min_calls:
+            return
+        if self._failures >= total * self.error_rate:
+            self._open(now, f"{self._failures}/{total} calls failed in the last {self.window:.0f}s")
+        elif self._slow >= total * self.slow_rate:
+            self._open(now, f"{self._slow}/{total} calls took over {self.slow_call}s")
+
+    def stats(self) -> Dict[str, Any]:
+        self._trim(time.monotonic())
+        total = len(self._outcomes)
+        stats = dict(self._stats)
+        stats.update(
+            state=self.state,
+            state_code=STATE_CODES[self.state],
+            error_rate=self._failures / total if total else 0.0,
+            slow_rate=self._slow / total if total else 0.0,
+            retry_in_seconds=self.retry_in(),
+            timeouts_seconds={op: self.timeout(op) for op in self._latencies},
+        )
+        return stats
+
+
+class BreakerRegistry:
+    """The breakers for each outside dependency, reported together in /stats, /metrics and health"""
+
+    def __init__(self, breakers: Dict[str, CircuitBreaker]):
+        self._breakers = breakers
+
+    def __getitem__(self, name: str) -> CircuitBreaker:
+        return self._breakers[name]
+
+    def states(self) -> Dict[str, str]:
+        return {name: breaker.state for name, breaker in self._breakers.items()}
+
+    def stats(self) -> Dict[str, Any]:
+        return {name: breaker.stats() for name, breaker in self._breakers.items()}
+
+
+def default_breakers() -> BreakerRegistry:
+    """Breakers for Telegram, Tenor and Gemini; the max timeouts are the old fixed ones"""
+    return BreakerRegistry({
+        'telegram': CircuitBreaker.from_env('telegram', slow_call=5.0, min_timeout=2.0, max_timeout=10.0,
+                                            open_seconds=5.0),
+        'tenor': CircuitBreaker.from_env('tenor', slow_call=2.0, min_timeout=1.0, max_timeout=10.0,
+                                         open_seconds=30.0),
+        'gemini': CircuitBreaker.from_env('gemini', slow_call=15.0, min_timeout=5.0,
+                                          max_timeout=float(os.getenv('GEMINI_TIMEOUT', '20')),
+                                          open_seconds=20.0),
+    })
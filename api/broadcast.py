@@ -0,0 +1,533 @@
+import os
+import time
+import json
+import uuid
+import socket
+import asyncio
+import sqlite3
+import logging
+import threading
+from bisect import bisect_right, insort
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+import httpx
+
+from api.breaker import BreakerOpen
+
+logger = logging.getLogger(__name__)
+
+# Telegram descriptions for chats that will never accept a message again
+_GONE_DESCRIPTIONS = ('bot was blocked', 'user is deactivated', 'chat not found', 'bot was kicked',
+                      'peer_id_invalid', 'chat was deleted', 'have no rights to send')
+
+
+def chat_is_gone(response: httpx.Response) -> bool:
+    """True for a sendMessage failure meaning the chat blocked the bot or no longer exists"""
+    if response.status_code not in (400, 403):
+        return False
+    try:
+        description = (response.json().get('description') or '').lower()
+    except Exception:
+        description = ''
+    return response.status_code == 403 or any(text in description for text in _GONE_DESCRIPTIONS)
+
+
+class MemorySubscriberRegistry:
+    """Chats that have talked to the bot, kept in sorted order so a broadcast can page through them by id"""
+
+    def __init__(self):
+        self._ids: List[int] = []
+        self._known = set()
+        self._job: Optional[Dict[str, Any]] = None
+        self.added = 0
+        self.removed = 0
+
+    def add(self, chat_id: int):
+        """Called for every incoming message; cheap once the chat is known"""
+        if chat_id in self._known:
+            return
+        self._known.add(chat_id)
+        insort(self._ids, chat_id)
+        self.added += 1
+
+    def remove(self, chat_id: int):
+        if chat_id not in self._known:
+            return
+        self._known.discard(chat_id)
+        index = bisect_right(self._ids, chat_id) - 1
+        if index >= 0 and self._ids[index] == chat_id:
+            del self._ids[index]
+        self.removed += 1
+
+    def page(self, after: Optional[int], limit: int) -> List[int]:
+        """Up to `limit` chat_ids greater than `after`, ascending"""
+        start = 0 if after is None else bisect_right(self._ids, after)
+        return self._ids[start:start + limit]
+
+    def count_after(self, after: Optional[int]) -> int:
+        return len(self._ids) - (0 if after is None else bisect_right(self._ids, after))
+
+    def create_job(self, job: Dict[str, Any], owner: str, lease: float) -> bool:
+        """Store a new job leased to `owner`, unless another job still holds a live lease"""
+        now = time.time()
+        if self._job is not None and self._job['owner'] is not None and self._job['heartbeat'] >= now - lease:
+            return False
+        self._job = dict(job, owner=owner, heartbeat=now, pause_requested=False)
+        return True
+
+    def acquire_job(self, job_id: str, owner: str, lease: float) -> bool:
+        """Take the lease on a stored job whose owner released it or stopped renewing it"""
+        now = time.time()
+        job = self._job
+        if job is None or job['id'] != job_id or (job['owner'] is not None and job['heartbeat'] >= now - lease):
+            return False
+        job.update(owner=owner, heartbeat=now, pause_requested=False)
+        return True
+
+    def renew_job(self, job_id: str, owner: str) -> Optional[bool]:
+        """Extend the lease; None if `owner` lost it, otherwise whether a pause was requested"""
+        job = self._job
+        if job is None or job['id'] != job_id or job['owner'] != owner:
+            return None
+        job['heartbeat'] = time.time()
+        return job['pause_requested']
+
+    def save_job(self, job: Dict[str, Any], owner: str) -> bool:
+        """Checkpoint `job`; False if `owner` no longer holds its lease"""
+        stored = self._job
+        if stored is None or stored['id'] != job['id'] or stored['owner'] != owner:
+            return False
+        stored.update(job, owner=owner, heartbeat=time.time(), pause_requested=stored['pause_requested'])
+        return True
+
+    def release_job(self, job_id: str, owner: str):
+        if self._job is not None and self._job['id'] == job_id and self._job['owner'] == owner:
+            self._job['owner'] = None
+
+    def request_pause(self, job_id: str):
+        if self._job is not None and self._job['id'] == job_id:
+            self._job['pause_requested'] = True
+
+    def load_job(self) -> Optional[Dict[str, Any]]:
+        """The latest job, with its `owner` and `heartbeat`"""
+        return dict(self._job) if self._job else None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class SqliteSubscriberRegistry:
+    """The same registry in a local SQLite file, so subscribers and broadcast checkpoints survive restarts"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._known = set()
+        self.added = 0
+        self.removed = 0
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS subscribers (chat_id INTEGER PRIMARY KEY, added_at REAL NOT NULL)")
+        self._conn.execute("CREATE TABLE IF NOT EXISTS broadcast_jobs (id TEXT PRIMARY KEY, data TEXT NOT NULL, "
+                           "updated_at REAL NOT NULL, owner TEXT, heartbeat REAL NOT NULL DEFAULT 0, "
+                           "pause_requested INTEGER NOT NULL DEFAULT 0)")
+        columns = {row[1] for row in self._conn.execute("PRAGMA table_info(broadcast_jobs)")}
+        for column, ddl in (('owner', 'owner TEXT'), ('heartbeat', 'heartbeat REAL NOT NULL DEFAULT 0'),
+                            ('pause_requested', 'pause_requested INTEGER NOT NULL DEFAULT 0')):
+            if column not in columns:
+                self._conn.execute(f"ALTER TABLE broadcast_jobs ADD COLUMN {ddl}")
+
+    def add(self, chat_id: int):
+        """Called for every incoming message; only a chat this process hasn't seen yet costs a write"""
+        if chat_id in self._known:
+            return
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO subscribers (chat_id, added_at) VALUES (?, ?) ON CONFLICT(chat_id) DO NOTHING",
+                (chat_id, time.time())
+            )
+            self.added += cursor.rowcount > 0
+        self._known.add(chat_id)
+
+    def remove(self, chat_id: int):
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM subscribers WHERE chat_id = ?", (chat_id,))
+            self.removed += cursor.rowcount > 0
+        self._known.discard(chat_id)
+
+    def page(self, after: Optional[int], limit: int) -> List[int]:
+        """Up to `limit` chat_ids greater than `after`, ascending (keyset pagination on the primary key)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT chat_id FROM subscribers WHERE chat_id > ? ORDER BY chat_id LIMIT ?",
+                (after if after is not None else -(1 << 63), limit)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def count_after(self, after: Optional[int]) -> int:
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM subscribers WHERE chat_id > ?",
+                (after if after is not None else -(1 << 63),)
+            ).fetchone()[0]
+
+    # Every worker on the host shares these rows; the lease (owner + heartbeat) makes sure only
+    # one of them runs a broadcast, and each change to it is a single atomic statement
+
+    def create_job(self, job: Dict[str, Any], owner: str, lease: float) -> bool:
+        """Store a new job leased to `owner`, unless another job still holds a live lease"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO broadcast_jobs (id, data, updated_at, owner, heartbeat) SELECT ?, ?, ?, ?, ? "
+                "WHERE NOT EXISTS (SELECT 1 FROM broadcast_jobs WHERE owner IS NOT NULL AND heartbeat >= ?)",
+                (job['id'], json.dumps(job), now, owner, now, now - lease)
+            )
+            return cursor.rowcount > 0
+
+    def acquire_job(self, job_id: str, owner: str, lease: float) -> bool:
+        """Take the lease on a stored job whose owner released it or stopped renewing it"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE broadcast_jobs SET owner = ?, heartbeat = ?, pause_requested = 0 "
+                "WHERE id = ? AND (owner IS NULL OR heartbeat < ?)",
+                (owner, now, job_id, now - lease)
+            )
+            return cursor.rowcount > 0
+
+    def renew_job(self, job_id: str, owner: str) -> Optional[bool]:
+        """Extend the lease; None if `owner` lost it, otherwise whether a pause was requested"""
+        with self._lock:
+            row = self._conn.execute(
+                "UPDATE broadcast_jobs SET heartbeat = ? WHERE id = ? AND owner = ? RETURNING pause_requested",
+                (time.time(), job_id, owner)
+            ).fetchone()
+        return bool(row[0]) if row else None
+
+    def save_job(self, job: Dict[str, Any], owner: str) -> bool:
+        """Checkpoint `job`; False if `owner` no longer holds its lease"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "UPDATE broadcast_jobs SET data = ?, updated_at = ?, heartbeat = ? WHERE id = ? AND owner = ?",
+                (json.dumps(job), now, now, job['id'], owner)
+            )
+            return cursor.rowcount > 0
+
+    def release_job(self, job_id: str, owner: str):
+        with self._lock:
+            self._conn.execute("UPDATE broadcast_jobs SET owner = NULL WHERE id = ? AND owner = ?", (job_id, owner))
+
+    def request_pause(self, job_id: str):
+        with self._lock:
+            self._conn.execute("UPDATE broadcast_jobs SET pause_requested = 1 WHERE id = ?", (job_id,))
+
+    def load_job(self) -> Optional[Dict[str, Any]]:
+        """The latest job, with its `owner` and `heartbeat`"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, owner, heartbeat, pause_requested FROM broadcast_jobs ORDER BY updated_at DESC LIMIT 1"
+            ).fetchone()
+        if not row:
+            return None
+        return dict(json.loads(row[0]), owner=row[1], heartbeat=row[2], pause_requested=bool(row[3]))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM subscribers").fetchone()[0]
+
+
+def registry_from_env():
+    """SUBSCRIBERS_BACKEND=sqlite (default, SUBSCRIBERS_PATH) or memory"""
+    if os.getenv('SUBSCRIBERS_BACKEND', 'sqlite') == 'sqlite':
+        path = os.getenv('SUBSCRIBERS_PATH', '/tmp/sai_bot_subscribers.sqlite3')
+        try:
+            return SqliteSubscriberRegistry(path)
+        except sqlite3.Error as e:
+            logger.error(f"Could not open subscriber database {path}, falling back to memory: {e}")
+    return MemorySubscriberRegistry()
+
+
+class LeaseLost(Exception):
+    """Another worker took over the broadcast this one was running"""
+
+
+class Broadcaster:
+    """Sends one announcement to every registered chat.
+
+    Chats are read in pages of `batch_size` ids and sent with at most `concurrency` requests in
+    flight; pacing against Telegram's limits is left to the send function (the SendScheduler).
+    After each page the job is checkpointed with the last chat_id, so a restarted broadcast
+    resumes from there and repeats at most one page; a pause checkpoints mid-page and repeats
+    at most the sends that were in flight. Chats that blocked the bot or no longer exist are
+    removed from the registry.
+
+    The registry may be shared by several workers. A job is run by whichever worker holds its
+    lease, renewed every few seconds; the others report progress from the stored checkpoint, and
+    only take the job over once the lease has lapsed.
+    """
+
+    def __init__(self, registry, send: Callable[[int, Dict[str, Any]], Awaitable[Optional[httpx.Response]]],
+                 batch_size: int = None, concurrency: int = None, lease_seconds: float = None):
+        self.registry = registry
+        self.send = send
+        self.batch_size = batch_size or int(os.getenv('BROADCAST_BATCH_SIZE', '500'))
+        self.concurrency = concurrency or int(os.getenv('BROADCAST_CONCURRENCY', '100'))
+        self.lease_seconds = lease_seconds or float(os.getenv('BROADCAST_LEASE_SECONDS', '30'))
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        # The job this worker is running; None while it runs nothing
+        self.job: Optional[Dict[str, Any]] = None
+        self._task: Optional[asyncio.Task] = None
+        self._run_started = 0.0
+        self._page_outcomes: Dict[int, str] = {}
+        # What a cancelled run leaves in the checkpoint: 'paused' waits for /broadcast/resume,
+        # 'running' is picked up again by the next startup
+        self._cancel_status = 'paused'
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def _leased(self, job: Dict[str, Any]) -> bool:
+        return job.get('owner') is not None and job.get('heartbeat', 0) >= time.time() - self.lease_seconds
+
+    def start(self, message: Dict[str, Any]) -> Dict[str, Any]:
+        """Begin a new broadcast of `message` (text, or document_url with an optional caption)"""
+        if self.running:
+            raise RuntimeError("a broadcast is already running")
+        job = {
+            'id': uuid.uuid4().hex[:12],
+            'message': message,
+            'status': 'running',
+            'cursor': None,
+            'total': len(self.registry),
+            'sent': 0, 'failed': 0, 'pruned': 0,
+            'created_at': time.time(),
+            'active_seconds': 0.0,
+        }
+        if not self.registry.create_job(job, self.owner, self.lease_seconds):
+            raise RuntimeError("a broadcast is already running on another worker")
+        self._launch(job)
+        return self.progress()
+
+    def resume(self) -> Dict[str, Any]:
+        """Continue the last broadcast from its checkpoint"""
+        if self.running:
+            raise RuntimeError("a broadcast is already running")
+        job = self.registry.load_job()
+        if not job or job['status'] == 'done':
+            raise LookupError("no unfinished broadcast to resume")
+        if not self.registry.acquire_job(job['id'], self.owner, self.lease_seconds):
+            raise RuntimeError("the broadcast is running on another worker")
+        job['status'] = 'running'
+        self._launch(job)
+        return self.progress()
+
+    def resume_interrupted(self) -> bool:
+        """At startup: continue a job left running by a worker that went away, if no one else has"""
+        job = self.registry.load_job()
+        if not job or job['status'] != 'running' or self._leased(job):
+            return False
+        try:
+            self.resume()
+        except (RuntimeError, LookupError):
+            return False  # another worker won the lease
+        return True
+
+    def _launch(self, job: Dict[str, Any]):
+        for key in ('owner', 'heartbeat', 'pause_requested'):
+            job.pop(key, None)
+        self.job = job
+        self._cancel_status = 'paused'
+        self._task = asyncio.create_task(self._run())
+
+    async def _cancel(self, status: str):
+        if self.running:
+            self._cancel_status = status
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+
+    async def pause(self) -> Dict[str, Any]:
+        """Stop sending; progress up to the last completed page is kept.
+
+        A broadcast run by another worker is asked to pause and stops at its next lease renewal.
+        """
+        if self.running:
+            await self._cancel('paused')
+        else:
+            job = self.registry.load_job()
+            if job and job['status'] == 'running' and self._leased(job):
+                self.registry.request_pause(job['id'])
+        return self.progress()
+
+    async def shutdown(self):
+        """Stop for a server shutdown, leaving the job to be resumed on the next startup"""
+        await self._cancel('running')
+
+    async def _keep_lease(self):
+        """Renew the lease while the run lasts; stop the run if it was lost or a pause was requested"""
+        interval = max(self.lease_seconds / 3, 0.1)
+        while True:
+            await asyncio.sleep(interval)
+            pause_requested = self.registry.renew_job(self.job['id'], self.owner)
+            if pause_requested is None or pause_requested:
+                if pause_requested is None:
+                    logger.warning(f"Broadcast {self.job['id']}: lease lost to another worker, stopping")
+                self._cancel_status = 'lost' if pause_requested is None else 'paused'
+                self._task.cancel()
+                return
+
+    async def _send_one(self, chat_id: int, slots: asyncio.Semaphore, outcomes: Dict[int, str]):
+        async with slots:
+            while True:
+                try:
+                    response = await self.send(chat_id, self.job['message'])
+                except BreakerOpen as e:
+                    # Telegram is down; wait for the breaker instead of failing every remaining chat
+                    await asyncio.sleep(max(e.retry_in, 1.0))
+                    continue
+                except Exception as e:
+                    logger.debug("Broadcast to chat %s failed: %s", chat_id, e)
+                    outcomes[chat_id] = 'failed'
+                    return
+                break
+        if response is not None and response.status_code == 200:
+            outcomes[chat_id] = 'sent'
+        elif response is not None and chat_is_gone(response):
+            self.registry.remove(chat_id)
+            outcomes[chat_id] = 'pruned'
+        else:
+            outcomes[chat_id] = 'failed'
+
+    def _checkpoint(self, chat_ids: List[int], outcomes: Dict[int, str]):
+        """Advance the cursor over the finished prefix of the page and count those chats.
+
+        Chats after the first unfinished one are sent again on resume, so only the prefix is
+        counted, plus any pruned chats, which are gone from the registry and won't come back.
+        """
+        job = self.job
+        finished = 0
+        for chat_id in chat_ids:
+            outcome = outcomes.get(chat_id)
+            if outcome is None:
+                break
+            job[outcome] += 1
+            finished += 1
+        if finished:
+            job['cursor'] = chat_ids[finished - 1]
+        job['pruned'] += sum(1 for chat_id in chat_ids[finished:] if outcomes.get(chat_id) == 'pruned')
+        outcomes.clear()
+
+    async def _run(self):
+        job = self.job
+        slots = asyncio.Semaphore(self.concurrency)
+        # Rates and ETA cover this run only, so a resumed job isn't judged by time spent paused
+        job['remaining_at_start'] = self.registry.count_after(job['cursor'])
+        job['done_at_start'] = job['sent'] + job['failed'] + job['pruned']
+        job['run_seconds'] = 0.0
+        active_before = job['active_seconds']
+        self._run_started = started = last_log = time.monotonic()
+        outcomes = self._page_outcomes = {}
+        chat_ids: List[int] = []
+        keeper = asyncio.create_task(self._keep_lease())
+        logger.info(f"Broadcast {job['id']} running: {job['remaining_at_start']} chats to go")
+        try:
+            while True:
+                chat_ids = self.registry.page(job['cursor'], self.batch_size)
+                if not chat_ids:
+                    break
+                await asyncio.gather(*(self._send_one(chat_id, slots, outcomes) for chat_id in chat_ids))
+                self._checkpoint(chat_ids, outcomes)
+                job['run_seconds'] = time.monotonic() - started
+                job['active_seconds'] = active_before + job['run_seconds']
+                if not self.registry.save_job(job, self.owner):
+                    raise LeaseLost()
+                if time.monotonic() - last_log >= 10:
+                    last_log = time.monotonic()
+                    progress = self.progress()
+                    logger.info(f"Broadcast {job['id']}: {progress['done']}/{progress['total']} done, "
+                                f"{progress['rate_per_second']:.0f}/s, ETA {progress['eta_seconds'] or 0:.0f}s")
+            job['status'] = 'done'
+        except asyncio.CancelledError:
+            job['status'] = self._cancel_status
+            if job['status'] == 'running':
+                raise  # shutdown
+        except LeaseLost:
+            job['status'] = 'lost'
+        except Exception as e:
+            job['status'] = 'failed'
+            logger.exception(f"Broadcast {job['id']} stopped: {e}")
+        finally:
+            keeper.cancel()
+            if job['status'] == 'lost':
+                # The new owner carries on from the last checkpoint; nothing of ours may overwrite it
+                logger.warning(f"Broadcast {job['id']} handed over to another worker")
+                self.job = None
+                return
+            if outcomes:
+                self._checkpoint(chat_ids, outcomes)
+            job['run_seconds'] = time.monotonic() - started
+            job['active_seconds'] = active_before + job['run_seconds']
+            self.registry.save_job(job, self.owner)
+            self.registry.release_job(job['id'], self.owner)
+            self.job = None
+            logger.info(f"Broadcast {job['id']} {job['status']}: {job['sent']} sent, "
+                        f"{job['failed']} failed, {job['pruned']} pruned")
+
+    def interrupted(self) -> bool:
+        """Whether the stored job was left running by a worker that no longer holds its lease"""
+        if self.running:
+            return False
+        job = self.registry.load_job()
+        return bool(job) and job['status'] == 'running' and not self._leased(job)
+
+    def progress(self) -> Dict[str, Any]:
+        """Counts, throughput and ETA for the current or last broadcast.
+
+        Live counts if this worker runs the job; otherwise the last checkpoint in the registry,
+        which is what every other worker sees.
+        """
+        running = self.running and self.job is not None
+        job = self.job if running else self.registry.load_job()
+        if not job:
+            return {'status': 'idle', 'subscribers': len(self.registry)}
+        done = job['sent'] + job['failed'] + job['pruned']
+        if running:
+            done += len(self._page_outcomes)  # finished in the current page, not yet checkpointed
+        done_this_run = done - job.get('done_at_start', 0)
+        run_seconds = time.monotonic() - self._run_started if running else job.get('run_seconds', 0.0)
+        rate = done_this_run / run_seconds if run_seconds > 0 else 0.0
+        remaining = max(0, job.get('remaining_at_start', job['total']) - done_this_run)
+        status = job['status']
+        if not running and status == 'running' and not self._leased(job):
+            status = 'interrupted'  # checkpointed by a process that is gone; POST /broadcast/resume continues it
+        return {
+            'id': job['id'],
+            'status': status,
+            'total': job['total'],
+            'done': done,
+            'sent': job['sent'],
+            'failed': job['failed'],
+            'pruned': job['pruned'],
+            'rate_per_second': round(rate, 1),
+            'eta_seconds': 0.0 if status == 'done' else (round(remaining / rate, 1) if rate > 0 else None),
+            'active_seconds': round(job['active_seconds'], 1),
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        progress = self.progress()
+        stats = {
+            'subscribers': len(self.registry),
+            'subscribers_added': self.registry.added,
+            'subscribers_pruned': self.registry.removed,
+            'running': self.running,
+        }
+        if 'id' in progress:
+            stats.update(sent=progress['sent'], failed=progress['failed'], pruned=progress['pruned'],
+                         rate_per_second=progress['rate_per_second'])
+        return stats
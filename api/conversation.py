@@ -0,0 +1,248 @@
+import os
+import re
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+from api.profile_index import estimate_tokens
+
+logger = logging.getLogger(__name__)
+
+USER = 'u'
+BOT = 'b'
+_SPEAKERS = {USER: 'User', BOT: 'You'}
+_SENTENCE_END_RE = re.compile(r"(?<=[.!?])\s")
+
+
+def first_sentence(text: str, max_chars: int = 80) -> str:
+    """The opening sentence of `text`, cut to `max_chars`"""
+    text = ' '.join(text.split())
+    sentence = _SENTENCE_END_RE.split(text, 1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars - 3].rstrip() + '...'
+
+
+class ChatHistory:
+    """Recent turns of one chat in a fixed-size ring buffer, plus a rolling summary of older ones"""
+
+    __slots__ = ('turns', 'summary', 'tokens', 'updated_at')
+
+    def __init__(self, max_turns: int):
+        self.turns: Deque[Tuple[str, str, int]] = deque(maxlen=max_turns)  # (speaker, text, tokens)
+        self.summary: Deque[str] = deque()
+        self.tokens = 0  # tokens held by self.turns
+        self.updated_at = time.time()
+
+    def to_json(self) -> str:
+        return json.dumps({'s': list(self.summary), 't': [[speaker, text] for speaker, text, _ in self.turns]},
+                          ensure_ascii=False, separators=(',', ':'))
+
+    @classmethod
+    def from_json(cls, data: str, max_turns: int, updated_at: float) -> 'ChatHistory':
+        raw = json.loads(data)
+        history = cls(max_turns)
+        history.summary.extend(raw.get('s', []))
+        for speaker, text in raw.get('t', [])[-max_turns:]:
+            tokens = estimate_tokens(text)
+            history.turns.append((speaker, text, tokens))
+            history.tokens += tokens
+        history.updated_at = updated_at
+        return history
+
+
+class MemoryHistoryStore:
+    """Chat histories for a single process; least recently used and idle chats are evicted"""
+
+    def __init__(self, ttl: float = 21600.0, max_chats: int = 10000):
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self._chats: 'OrderedDict[Any, ChatHistory]' = OrderedDict()
+        self.evictions = 0
+
+    def _evict(self, now: float):
+        # Recency order means idle chats are at the front
+        cutoff = now - self.ttl
+        while self._chats:
+            chat_id, history = next(iter(self._chats.items()))
+            if len(self._chats) <= self.max_chats and history.updated_at >= cutoff:
+                break
+            del self._chats[chat_id]
+            self.evictions += 1
+
+    def load(self, chat_id: Any) -> Optional[ChatHistory]:
+        self._evict(time.time())
+        history = self._chats.get(chat_id)
+        if history is not None:
+            self._chats.move_to_end(chat_id)
+        return history
+
+    def save(self, chat_id: Any, history: ChatHistory):
+        self._chats[chat_id] = history
+        self._chats.move_to_end(chat_id)
+        self._evict(history.updated_at)
+
+    def __len__(self) -> int:
+        return len(self._chats)
+
+
+class SqliteHistoryStore:
+    """Chat histories in a local SQLite file, so context survives restarts and is shared across workers"""
+
+    PRUNE_EVERY = 256
+
+    def __init__(self, path: str, max_turns: int, ttl: float = 21600.0, max_chats: int = 10000):
+        self.path = path
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_chats = max_chats
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._saves = 0
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chat_history "
+            "(chat_id INTEGER PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS chat_history_updated ON chat_history (updated_at)")
+
+    def _prune(self, now: float):
+        before = self._conn.total_changes
+        self._conn.execute("DELETE FROM chat_history WHERE updated_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM chat_history WHERE chat_id NOT IN "
+            "(SELECT chat_id FROM chat_history ORDER BY updated_at DESC LIMIT ?)",
+            (self.max_chats,)
+        )
+        self.evictions += self._conn.total_changes - before
+
+    def load(self, chat_id: Any) -> Optional[ChatHistory]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT data, updated_at FROM chat_history WHERE chat_id = ? AND updated_at >= ?",
+                (chat_id, time.time() - self.ttl)
+            ).fetchone()
+        return ChatHistory.from_json(row[0], self.max_turns, row[1]) if row else None
+
+    def save(self, chat_id: Any, history: ChatHistory):
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO chat_history (chat_id, data, updated_at) VALUES (?, ?, ?) "
+                "ON CONFLICT(chat_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at",
+                (chat_id, history.to_json(), history.updated_at)
+            )
+            self._saves += 1
+            if self._saves % self.PRUNE_EVERY == 0:
+                self._prune(history.updated_at)
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chat_history").fetchone()[0]
+
+
+class ConversationMemory:
+    """Per-chat context for prompts, held under a hard token budget.
+
+    The newest turns are kept verbatim. Turns that no longer fit the ring buffer or the
+    budget are folded into a short rolling summary made of their opening sentences.
+    """
+
+    def __init__(self, store=None, max_turns: int = 8, token_budget: int = 500, summary_tokens: int = 120):
+        self.store = store
+        self.max_turns = max_turns
+        self.token_budget = token_budget
+        self.summary_tokens = summary_tokens
+        self._stats = {'recorded': 0, 'folded': 0, 'prompts_with_history': 0}
+
+    @classmethod
+    def from_env(cls) -> 'ConversationMemory':
+        backend = os.getenv('HISTORY_BACKEND', 'memory')
+        max_turns = int(os.getenv('HISTORY_MAX_TURNS', '8'))
+        token_budget = int(os.getenv('HISTORY_TOKEN_BUDGET', '500'))
+        summary_tokens = int(os.getenv('HISTORY_SUMMARY_TOKENS', '120'))
+        ttl = float(os.getenv('HISTORY_TTL', '21600'))
+        max_chats = int(os.getenv('HISTORY_MAX_CHATS', '10000'))
+        if backend == 'off':
+            return cls(None)
+        store = None
+        if backend == 'sqlite':
+            path = os.getenv('HISTORY_PATH', '/tmp/sai_bot_history.sqlite3')
+            try:
+                store = SqliteHistoryStore(path, max_turns, ttl=ttl, max_chats=max_chats)
+            except sqlite3.Error as e:
+                logger.error(f"Could not open history database {path}, falling back to memory: {e}")
+        if store is None:
+            store = MemoryHistoryStore(ttl=ttl, max_chats=max_chats)
+        return cls(store, max_turns=max_turns, token_budget=token_budget, summary_tokens=summary_tokens)
+
+    def _load(self, chat_id: Any) -> Optional[ChatHistory]:
+        if self.store is None:
+            return None
+        try:
+            return self.store.load(chat_id)
+        except Exception as e:
+            # A broken history store degrades to stateless replies
+            logger.error(f"History store error loading chat {chat_id}: {e}")
+            return None
+
+    def context(self, chat_id: Any) -> str:
+        """Earlier conversation to put in the prompt, or '' for a chat with no history"""
+        history = self._load(chat_id)
+        if history is None or not (history.turns or history.summary):
+            return ''
+        self._stats['prompts_with_history'] += 1
+        lines = []
+        if history.summary:
+            lines.append(f"Earlier: {'; '.join(history.summary)}")
+        lines.extend(f"{_SPEAKERS[speaker]}: {text}" for speaker, text, _ in history.turns)
+        return '\n'.join(lines)
+
+    def _fold_oldest(self, history: ChatHistory):
+        speaker, text, tokens = history.turns.popleft()
+        history.tokens -= tokens
+        history.summary.append(f"{'user asked' if speaker == USER else 'you said'} \"{first_sentence(text)}\"")
+        while len(history.summary) > 1 and estimate_tokens('; '.join(history.summary)) > self.summary_tokens:
+            history.summary.popleft()
+        self._stats['folded'] += 1
+
+    def _append(self, history: ChatHistory, speaker: str, text: str):
+        text = ' '.join(text.split())
+        # No single turn may take more than the whole budget
+        limit = self.token_budget * 4
+        if len(text) > limit:
+            text = text[:limit - 3] + '...'
+        tokens = estimate_tokens(text)
+        if len(history.turns) == history.turns.maxlen:
+            self._fold_oldest(history)
+        history.turns.append((speaker, text, tokens))
+        history.tokens += tokens
+        while len(history.turns) > 1 and history.tokens + estimate_tokens('; '.join(history.summary)) > self.token_budget:
+            self._fold_oldest(history)
+
+    def record(self, chat_id: Any, user_text: str, reply_text: str):
+        """Add one exchange to the chat's history"""
+        if self.store is None:
+            return
+        history = self._load(chat_id) or ChatHistory(self.max_turns)
+        self._append(history, USER, user_text)
+        self._append(history, BOT, reply_text)
+        history.updated_at = time.time()
+        try:
+            self.store.save(chat_id, history)
+        except Exception as e:
+            logger.error(f"History store error saving chat {chat_id}: {e}")
+            return
+        self._stats['recorded'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update(
+            backend=type(self.store).__name__ if self.store else 'off',
+            chats=len(self.store) if self.store else 0,
+            evictions=getattr(self.store, 'evictions', 0),
+        )
+        return stats
@@ -0,0 +1,154 @@
+import os
+import time
+import sqlite3
+import logging
+import threading
+from collections import deque
+from typing import Any, Deque, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryDedupeStore:
+    """Recently seen update_ids for a single process, evicted by age and count"""
+
+    def __init__(self, ttl: float = 3600.0, max_entries: int = 10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        # update_ids arrive roughly in order, so a FIFO of (id, seen_at) plus a set is enough
+        self._order: Deque[Tuple[int, float]] = deque()
+        self._ids = set()
+
+    def _evict(self, now: float):
+        cutoff = now - self.ttl
+        while self._order and (len(self._order) > self.max_entries or self._order[0][1] < cutoff):
+            update_id, _ = self._order.popleft()
+            self._ids.discard(update_id)
+
+    def add(self, update_id: int) -> bool:
+        """Record `update_id`; returns False if it was already present"""
+        now = time.time()
+        self._evict(now)
+        if update_id in self._ids:
+            return False
+        self._ids.add(update_id)
+        self._order.append((update_id, now))
+        return True
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+
+class SqliteDedupeStore:
+    """Recently seen update_ids in a local SQLite file, shared by every worker on the host"""
+
+    PRUNE_EVERY = 256
+
+    def __init__(self, path: str, ttl: float = 3600.0, max_entries: int = 10000):
+        self.path = path
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._inserts = 0
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS seen_updates (update_id INTEGER PRIMARY KEY, seen_at REAL NOT NULL)"
+        )
+
+    def _prune(self, now: float):
+        self._conn.execute("DELETE FROM seen_updates WHERE seen_at < ?", (now - self.ttl,))
+        self._conn.execute(
+            "DELETE FROM seen_updates WHERE update_id NOT IN "
+            "(SELECT update_id FROM seen_updates ORDER BY seen_at DESC LIMIT ?)",
+            (self.max_entries,)
+        )
+
+    def add(self, update_id: int) -> bool:
+        """Record `update_id`; returns False if any worker already recorded it"""
+        now = time.time()
+        with self._lock:
+            cursor = self._conn.execute(
+                "INSERT INTO seen_updates (update_id, seen_at) VALUES (?, ?) "
+                "ON CONFLICT(update_id) DO UPDATE SET seen_at = excluded.seen_at "
+                "WHERE seen_updates.seen_at < ?",
+                (update_id, now, now - self.ttl)
+            )
+            inserted = cursor.rowcount > 0
+            if inserted:
+                self._inserts += 1
+                if self._inserts % self.PRUNE_EVERY == 0:
+                    self._prune(now)
+            return inserted
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM seen_updates").fetchone()[0]
+
+
+class StateDedupeStore:
+    """Recently seen update_ids as TTL keys in the shared state layer (api.state)"""
+
+    PREFIX = 'update:'
+
+    def __init__(self, state, ttl: float = 3600.0):
+        self.state = state
+        self.ttl = ttl
+
+    def add(self, update_id: int) -> bool:
+        """Record `update_id`; returns False if it was already recorded"""
+        return self.state.add(f"{self.PREFIX}{update_id}", 1, ttl=self.ttl)
+
+    def __len__(self) -> int:
+        return self.state.count(self.PREFIX)
+
+
+class UpdateDeduplicator:
+    """Drops Telegram redeliveries by remembering recent update_ids"""
+
+    def __init__(self, store=None):
+        self.store = store
+        self.hits = 0
+        self.misses = 0
+
+    @classmethod
+    def from_env(cls, state=None) -> 'UpdateDeduplicator':
+        backend = os.getenv('DEDUPE_BACKEND', 'memory')
+        ttl = float(os.getenv('DEDUPE_TTL', '3600'))
+        max_entries = int(os.getenv('DEDUPE_MAX_ENTRIES', '10000'))
+        if backend == 'off':
+            return cls(None)
+        if backend == 'state' and state is not None:
+            return cls(StateDedupeStore(state, ttl=ttl))
+        if backend == 'sqlite':
+            path = os.getenv('DEDUPE_PATH', '/tmp/sai_bot_dedupe.sqlite3')
+            try:
+                return cls(SqliteDedupeStore(path, ttl=ttl, max_entries=max_entries))
+            except sqlite3.Error as e:
+                logger.error(f"Could not open dedupe database {path}, falling back to memory: {e}")
+        return cls(MemoryDedupeStore(ttl=ttl, max_entries=max_entries))
+
+    def is_duplicate(self, update_id: Optional[int]) -> bool:
+        """True if this update_id was already seen (and so must not be handled again)"""
+        if self.store is None or update_id is None:
+            return False
+        try:
+            first_time = self.store.add(update_id)
+        except Exception as e:
+            # Fail open: a broken dedupe store must never stop message handling
+            logger.error(f"Dedupe store error for update {update_id}: {e}")
+            return False
+        if first_time:
+            self.misses += 1
+            return False
+        self.hits += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'backend': type(self.store).__name__ if self.store else 'off',
+            'hits': self.hits,
+            'misses': self.misses,
+            'entries': len(self.store) if self.store else 0,
+        }
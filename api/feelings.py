@@ -0,0 +1,90 @@
+import re
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Checked in this order; the first feeling with any matching keyword wins
+FEELING_KEYWORDS: List[Tuple[str, Sequence[str]]] = [
+    ('greeting', ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening']),
+    ('wtf', ['wtf', 'what the', 'omg', 'unbelievable', 'crazy', 'insane']),
+    ('excited', ['wow', 'amazing', 'awesome', 'great', 'fantastic', 'incredible', 'cool']),
+    ('happy', ['happy', 'good', 'nice', 'love', 'like', 'perfect']),
+    ('approved', ['yes', 'correct', 'right', 'exactly', 'agree', 'approved']),
+    ('grateful', ['thanks', 'thank you', 'appreciate', 'grateful']),
+    ('cute', ['cute', 'adorable', 'sweet', 'kawaii', 'aww']),
+    ('serious', ['project', 'work', 'business', 'professional', 'serious']),
+    ('thinking', ['what', 'how', 'why', 'when', 'where', '?']),
+    ('sad', ['sad', 'confused', 'don\'t understand', 'unclear', 'help', 'problem']),
+]
+
+SAI_KEYWORDS = ['sai', 'sai mahendra', 'who is sai', 'about sai', 'tell me about sai', 'bejawada sai mahendra', 'mahendra']
+
+# Keywords at least this long also match simple inflections ("loved", "projects", "working");
+# shorter ones don't, or 'hi' would match "his"
+INFLECTABLE_LENGTH = 4
+INFLECTIONS = r"(?:ing|es|ed|s|d)?"
+_ABOUT_SAI = -1
+
+
+def trie_pattern(words: Iterable[str]) -> str:
+    """Regex matching any of `words`, factored into a character trie so each position is tried once.
+
+    Optional tails are greedy, so the longest keyword wins ("good morning" over "good").
+    """
+    root: Dict[str, dict] = {}
+    for word in words:
+        node = root
+        for char in word:
+            node = node.setdefault(char, {})
+        node[''] = {}
+
+    def build(node: Dict[str, dict]) -> str:
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ''
+        body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+        return f"(?:{body})?" if '' in node else body
+
+    return build(root)
+
+
+class FeelingClassifier:
+    """Single-pass matcher for the feeling keywords and Sai mentions, compiled once"""
+
+    def __init__(self, feeling_keywords: List[Tuple[str, Sequence[str]]] = None, sai_keywords: Sequence[str] = None):
+        feeling_keywords = feeling_keywords or FEELING_KEYWORDS
+        sai_keywords = sai_keywords or SAI_KEYWORDS
+        self.feelings = [feeling for feeling, _ in feeling_keywords]
+
+        # keyword -> priority (index into self.feelings), or _ABOUT_SAI
+        self.priorities: Dict[str, int] = {}
+        for priority, (_, keywords) in enumerate(feeling_keywords):
+            for keyword in keywords:
+                self.priorities.setdefault(keyword.lower(), priority)
+        for keyword in sai_keywords:
+            self.priorities[keyword.lower()] = _ABOUT_SAI
+
+        inflectable = [k for k in self.priorities if len(k) >= INFLECTABLE_LENGTH and k[-1].isalnum()]
+        exact = [k for k in self.priorities if len(k) < INFLECTABLE_LENGTH and k[-1].isalnum()]
+        symbols = [k for k in self.priorities if not k[-1].isalnum()]
+        alternatives = []
+        if inflectable:
+            alternatives.append(rf"\b({trie_pattern(inflectable)}){INFLECTIONS}\b")
+        if exact:
+            alternatives.append(rf"\b({trie_pattern(exact)})\b")
+        if symbols:
+            alternatives.append(f"({trie_pattern(symbols)})")
+        self.pattern = re.compile('|'.join(alternatives))
+
+    def classify(self, message_text: str) -> Tuple[Optional[str], bool]:
+        """Return (feeling or None, is_about_sai)"""
+        best = len(self.feelings)
+        about_sai = False
+        priorities = self.priorities
+        for match in self.pattern.finditer(message_text.lower()):
+            priority = priorities[match.group(match.lastindex)]
+            if priority == _ABOUT_SAI:
+                about_sai = True
+            elif priority < best:
+                best = priority
+                if best == 0 and about_sai:
+                    break
+        return (self.feelings[best] if best < len(self.feelings) else None), about_sai
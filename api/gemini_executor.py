@@ -0,0 +1,155 @@
+import os
+import time
+import asyncio
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import AsyncIterator, Callable, Dict, Any, Optional
+
+logger = logging.getLogger(__name__)
+
+# Marks the end of a streamed response
+_DONE = object()
+
+
+class GeminiExecutor:
+    """Runs blocking Gemini SDK calls on a dedicated thread pool with bounded concurrency and deadlines"""
+
+    def __init__(self, max_in_flight: int = None, timeout: float = None):
+        self.max_in_flight = max_in_flight or int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+        self.timeout = timeout or float(os.getenv('GEMINI_TIMEOUT', '20'))
+        self._pool = ThreadPoolExecutor(max_workers=self.max_in_flight, thread_name_prefix='gemini')
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._stats = {
+            'waiting': 0,
+            'in_flight': 0,
+            'max_waiting': 0,
+            'completed': 0,
+            'errors': 0,
+            'timeouts': 0,
+            'queue_wait_seconds': 0.0,
+            'latency_seconds': 0.0,
+            'streams': 0,
+            'first_chunk_seconds': 0.0,
+        }
+
+    def _semaphore(self) -> asyncio.Semaphore:
+        # Created lazily so it binds to the running loop, not the import-time one
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.max_in_flight)
+        return self._slots
+
+    def _release(self, future: asyncio.Future):
+        if not future.cancelled():
+            future.exception()  # mark as retrieved when the caller already timed out
+        self._stats['in_flight'] -= 1
+        self._semaphore().release()
+
+    async def _acquire(self, deadline: float):
+        """Wait for a free slot, counting the wait as queue time"""
+        stats = self._stats
+        queued_at = time.perf_counter()
+        stats['waiting'] += 1
+        stats['max_waiting'] = max(stats['max_waiting'], stats['waiting'])
+        try:
+            await asyncio.wait_for(self._semaphore().acquire(), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            stats['timeouts'] += 1
+            raise
+        finally:
+            stats['waiting'] -= 1
+        stats['queue_wait_seconds'] += time.perf_counter() - queued_at
+        stats['in_flight'] += 1
+
+    async def run(self, fn: Callable, *args, timeout: float = None, **kwargs) -> Any:
+        """Run `fn(*args, **kwargs)` off the event loop; raises asyncio.TimeoutError past the deadline"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        stats = self._stats
+        await self._acquire(deadline)
+
+        started_at = time.perf_counter()
+        # The slot is held until the worker thread really finishes, even if the caller gave up,
+        # so the number of concurrent SDK calls never exceeds max_in_flight.
+        future = asyncio.get_running_loop().run_in_executor(self._pool, partial(fn, *args, **kwargs))
+        future.add_done_callback(self._release)
+        try:
+            result = await asyncio.wait_for(asyncio.shield(future), max(deadline - time.monotonic(), 0))
+        except asyncio.TimeoutError:
+            stats['timeouts'] += 1
+            logger.warning(f"Gemini call exceeded its {timeout or self.timeout}s deadline")
+            raise
+        except Exception:
+            stats['errors'] += 1
+            raise
+        stats['completed'] += 1
+        stats['latency_seconds'] += time.perf_counter() - started_at
+        return result
+
+    async def stream(self, fn: Callable, *args, timeout: float = None, **kwargs) -> AsyncIterator[Any]:
+        """Like run(), but `fn` returns an iterator that is consumed on the worker thread; items are yielded as they arrive"""
+        deadline = time.monotonic() + (timeout or self.timeout)
+        stats = self._stats
+        await self._acquire(deadline)
+
+        loop = asyncio.get_running_loop()
+        items: asyncio.Queue = asyncio.Queue()
+        stop = threading.Event()
+
+        def put(item, error=None):
+            try:
+                loop.call_soon_threadsafe(items.put_nowait, (item, error))
+            except RuntimeError:
+                stop.set()  # the loop is gone; nobody is listening any more
+
+        def pump():
+            try:
+                for item in fn(*args, **kwargs):
+                    if stop.is_set():
+                        return
+                    put(item)
+            except Exception as e:
+                put(_DONE, e)
+            else:
+                put(_DONE)
+
+        started_at = time.perf_counter()
+        future = loop.run_in_executor(self._pool, pump)
+        future.add_done_callback(self._release)
+        first = True
+        try:
+            while True:
+                item, error = await asyncio.wait_for(items.get(), max(deadline - time.monotonic(), 0))
+                if item is _DONE:
+                    if error is not None:
+                        stats['errors'] += 1
+                        raise error
+                    break
+                if first:
+                    first = False
+                    stats['streams'] += 1
+                    stats['first_chunk_seconds'] += time.perf_counter() - started_at
+                handed_over = time.monotonic()
+                yield item
+                # The deadline covers waiting on Gemini, not the caller's handling of each chunk
+                deadline += time.monotonic() - handed_over
+        except asyncio.TimeoutError:
+            stats['timeouts'] += 1
+            logger.warning(f"Gemini stream exceeded its {timeout or self.timeout}s deadline")
+            raise
+        finally:
+            stop.set()
+        stats['completed'] += 1
+        stats['latency_seconds'] += time.perf_counter() - started_at
+
+    def shutdown(self):
+        self._pool.shutdown(wait=False)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['max_in_flight'] = self.max_in_flight
+        if stats['completed']:
+            stats['avg_latency_seconds'] = stats['latency_seconds'] / stats['completed']
+        if stats['streams']:
+            stats['avg_first_chunk_seconds'] = stats['first_chunk_seconds'] / stats['streams']
+        return stats
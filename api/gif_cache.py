@@ -0,0 +1,152 @@
+import os
+import time
+import random
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from api.breaker import BreakerOpen
+
+logger = logging.getLogger(__name__)
+
+Key = Tuple[str, str]
+
+
+class _Entry:
+    __slots__ = ('urls', 'fetched_at')
+
+    def __init__(self, urls: List[str], fetched_at: float):
+        self.urls = urls
+        self.fetched_at = fetched_at
+
+
+class GifCache:
+    """Per-(feeling, search term) pool of Tenor results, served locally and refreshed in the background"""
+
+    # Start refreshing an entry once it has lived this fraction of its TTL
+    REFRESH_AT = 0.8
+    # While degraded, probe Tenor again at most this often
+    RETRY_INTERVAL = 30.0
+
+    def __init__(self, search: Callable[[str], Awaitable[List[str]]], search_terms: Dict[str, List[str]],
+                 fallback_gifs: Dict[str, List[str]], ttl: float = None, max_urls: int = None,
+                 prefetch_concurrency: int = 4):
+        self.search = search
+        self.search_terms = search_terms
+        self.fallback_gifs = fallback_gifs
+        self.ttl = ttl or float(os.getenv('GIF_CACHE_TTL', '3600'))
+        self.max_urls = max_urls or int(os.getenv('GIF_CACHE_MAX_URLS', '2000'))
+        self.prefetch_concurrency = prefetch_concurrency
+        self._entries: 'OrderedDict[Key, _Entry]' = OrderedDict()
+        self._url_count = 0
+        self._inflight: Dict[Key, asyncio.Task] = {}
+        self._degraded = False
+        self._retry_at = 0.0
+        self._stats = {'hits': 0, 'cold_fetches': 0, 'refreshes': 0, 'fetch_errors': 0,
+                       'evictions': 0, 'fallbacks_blended': 0}
+
+    async def _fetch(self, key: Key):
+        feeling, term = key
+        try:
+            urls = await self.search(term)
+        except BreakerOpen as e:
+            # Tenor is known to be down; fallback GIFs are served until the breaker's probe succeeds
+            self._stats['fetch_errors'] += 1
+            self._degraded = True
+            self._retry_at = time.monotonic() + max(self.RETRY_INTERVAL, e.retry_in)
+            logger.debug("Skipped GIF fetch for '%s': %s", term, e)
+            return
+        except Exception as e:
+            self._stats['fetch_errors'] += 1
+            self._degraded = True
+            self._retry_at = time.monotonic() + self.RETRY_INTERVAL
+            logger.error(f"Error fetching GIFs for '{term}': {e}")
+            return
+        self._degraded = False
+        self._store(key, urls)
+
+    def _store(self, key: Key, urls: List[str]):
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self._url_count -= len(old.urls)
+        self._entries[key] = _Entry(urls, time.monotonic())
+        self._url_count += len(urls)
+        # LRU eviction keeps total memory bounded by URL count
+        while self._url_count > self.max_urls and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._url_count -= len(evicted.urls)
+            self._stats['evictions'] += 1
+
+    def _fetch_task(self, key: Key) -> asyncio.Task:
+        """Start (or join) the single in-flight fetch for `key`"""
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.create_task(self._fetch(key))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return task
+
+    async def prefetch(self):
+        """Warm every feeling's search terms, a few at a time"""
+        slots = asyncio.Semaphore(self.prefetch_concurrency)
+
+        async def warm(key: Key):
+            async with slots:
+                await asyncio.shield(self._fetch_task(key))
+
+        keys = [(feeling, term) for feeling, terms in self.search_terms.items() for term in terms]
+        await asyncio.gather(*(warm(key) for key in keys))
+        logger.info(f"GIF cache warmed: {len(self._entries)} searches, {self._url_count} GIFs")
+
+    def _pick(self, feeling: str, now: float) -> Optional[str]:
+        fresh, stale = [], []
+        for term in self.search_terms.get(feeling, []):
+            key = (feeling, term)
+            entry = self._entries.get(key)
+            if entry is None:
+                continue
+            self._entries.move_to_end(key)
+            age = now - entry.fetched_at
+            # While Tenor is backing off (_retry_at), hits don't trigger refreshes; the probe below does
+            if age > self.ttl * self.REFRESH_AT and key not in self._inflight and now >= self._retry_at:
+                self._stats['refreshes'] += 1
+                self._fetch_task(key)
+            if entry.urls:
+                (fresh if age < self.ttl else stale).append(entry.urls)
+
+        pools = fresh
+        if self._degraded:
+            # Tenor is failing: stretch what we have and blend in the hard-coded GIFs
+            pools = fresh + stale
+            if now >= self._retry_at and not self._inflight:
+                self._retry_at = now + self.RETRY_INTERVAL
+                self._fetch_task((feeling, random.choice(self.search_terms[feeling])))
+            fallback = self.fallback_gifs.get(feeling)
+            if fallback:
+                pools.append(fallback)
+                self._stats['fallbacks_blended'] += 1
+        if not pools:
+            return None
+        return random.choice(random.choice(pools))
+
+    async def get(self, feeling: str) -> Optional[str]:
+        """Random GIF URL for `feeling`; only touches the network when nothing is cached yet"""
+        now = time.monotonic()
+        gif_url = self._pick(feeling, now)
+        if gif_url:
+            self._stats['hits'] += 1
+            return gif_url
+
+        terms = self.search_terms.get(feeling)
+        if not terms or self._degraded:
+            return None
+        self._stats['cold_fetches'] += 1
+        # Other lookups may be waiting on the same fetch; a caller giving up must not cancel it for them
+        await asyncio.shield(self._fetch_task((feeling, random.choice(terms))))
+        return self._pick(feeling, time.monotonic())
+
+    def stats(self) -> Dict[str, object]:
+        stats = dict(self._stats)
+        stats.update(searches=len(self._entries), gifs=self._url_count, degraded=self._degraded)
+        return stats
@@ -0,0 +1,118 @@
+import os
+import logging
+from typing import Dict, Any, Optional
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+try:
+    import h2  # noqa: F401  (enables HTTP/2 in httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+
+def default_hosts() -> Dict[str, Dict[str, Any]]:
+    """Per-host defaults. Base URLs can be overridden (e.g. to point at local stand-ins); they are
+    read when the pool is created, so values from .env apply."""
+    return {
+        'telegram': {
+            'base_url': os.getenv('TELEGRAM_API_BASE', 'https://api.telegram.org'),
+            'timeout': 10.0,
+            'max_connections': 50,
+            'max_keepalive_connections': 20,
+        },
+        'tenor': {
+            'base_url': os.getenv('TENOR_API_BASE', 'https://tenor.googleapis.com'),
+            'timeout': 10.0,
+            'max_connections': 10,
+            'max_keepalive_connections': 5,
+        },
+    }
+
+
+class HttpClientPool:
+    """Long-lived, per-host httpx clients shared by the whole app"""
+
+    def __init__(self, hosts: Dict[str, Dict[str, Any]] = None):
+        self.hosts = hosts or default_hosts()
+        self.http2 = HTTP2_AVAILABLE and os.getenv('HTTP2', '1') != '0'
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._stats = {name: self._empty_stats() for name in self.hosts}
+
+    @staticmethod
+    def _empty_stats() -> Dict[str, int]:
+        return {'requests': 0, 'errors': 0, 'pool_hits': 0, 'tcp_connects': 0, 'tls_handshakes': 0}
+
+    def _build_client(self, name: str) -> httpx.AsyncClient:
+        config = self.hosts[name]
+        limits = httpx.Limits(
+            max_connections=config.get('max_connections', 20),
+            max_keepalive_connections=config.get('max_keepalive_connections', 10),
+            keepalive_expiry=config.get('keepalive_expiry', 60.0),
+        )
+        return httpx.AsyncClient(
+            base_url=config['base_url'],
+            http2=self.http2,
+            limits=limits,
+            timeout=httpx.Timeout(config.get('timeout', 10.0), connect=config.get('connect_timeout', 5.0)),
+        )
+
+    async def start(self):
+        """Open one client per configured host (called on app startup)"""
+        for name in self.hosts:
+            if name not in self._clients:
+                self._clients[name] = self._build_client(name)
+        logger.info(f"HTTP client pool started for {list(self.hosts)} (http2={self.http2})")
+
+    async def close(self):
+        """Close all clients (called on app shutdown)"""
+        clients, self._clients = self._clients, {}
+        for client in clients.values():
+            await client.aclose()
+        logger.info(f"HTTP client pool closed, stats: {self._stats}")
+
+    def client(self, name: str) -> httpx.AsyncClient:
+        """Get the shared client for a host, creating it lazily if startup hasn't run"""
+        client = self._clients.get(name)
+        if client is None or client.is_closed:
+            client = self._clients[name] = self._build_client(name)
+        return client
+
+    async def request(self, name: str, method: str, url: str, **kwargs) -> httpx.Response:
+        """Send a request through the pooled client for `name`, tracking connection reuse"""
+        stats = self._stats[name]
+        connected = False
+
+        async def trace(event_name: str, info: Dict[str, Any]):
+            nonlocal connected
+            if event_name == 'connection.connect_tcp.complete':
+                connected = True
+                stats['tcp_connects'] += 1
+            elif event_name == 'connection.start_tls.complete':
+                stats['tls_handshakes'] += 1
+
+        extensions = dict(kwargs.pop('extensions', None) or {})
+        extensions['trace'] = trace
+        stats['requests'] += 1
+        try:
+            return await self.client(name).request(method, url, extensions=extensions, **kwargs)
+        except Exception:
+            stats['errors'] += 1
+            raise
+        finally:
+            if not connected:
+                stats['pool_hits'] += 1
+
+    async def get(self, name: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(name, 'GET', url, **kwargs)
+
+    async def post(self, name: str, url: str, **kwargs) -> httpx.Response:
+        return await self.request(name, 'POST', url, **kwargs)
+
+    def stats(self, name: Optional[str] = None) -> Dict[str, Any]:
+        """Per-host request, pool-hit and handshake counters"""
+        if name is not None:
+            return dict(self._stats[name])
+        return {host: dict(values) for host, values in self._stats.items()}
@@ -1,23 +1,130 @@
 import os
+import hmac
 import logging
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Callable, Awaitable
 import asyncio
 import random
+import time
+import threading
+import httpx
 from fastapi import FastAPI, Request, HTTPException
-from fastapi.responses import JSONResponse
-import google.generativeai as genai
+from fastapi.responses import JSONResponse, PlainTextResponse
 from dotenv import load_dotenv
-import httpx
 
-# Load environment variables
+# Load environment variables before the api modules, some of which read them at import time
 load_dotenv()
 
-# Configure logging
-logging.basicConfig(level=logging.INFO)
+from api.http_client import HttpClientPool
+from api.gemini_executor import GeminiExecutor
+from api.update_queue import UpdateQueue
+from api.dedupe import UpdateDeduplicator
+from api.gif_cache import GifCache
+from api.media_cache import MediaCache, extract_file_id
+from api.state import state_from_env
+from api.breaker import BreakerOpen, default_breakers
+from api.broadcast import Broadcaster, chat_is_gone, registry_from_env
+from api.profile_index import ProfileIndex, estimate_tokens
+from api.response_cache import ResponseCache, content_hash
+from api.streaming import StreamingReply
+from api.send_scheduler import SendScheduler, PRIORITY_MEDIA, PRIORITY_DECORATIVE, PRIORITY_BULK
+from api.feelings import FeelingClassifier
+from api.conversation import ConversationMemory
+from api.polling import UpdatePoller
+from api.metrics import metrics, LoopLagMonitor
+from api.profiler import SamplingProfiler
+from api.logs import setup_logging, log_context, logging_stats, LOG_PAYLOADS
+
+# Configure logging: records are queued and written by a background thread (see api/logs.py)
+setup_logging()
 logger = logging.getLogger(__name__)
 
 app = FastAPI(title="Sai's Telegram Bot", version="1.0.0")
 
+WELCOME_MESSAGE = """
+ <h1>Hello visitor </h1><br><p>I am telegram bot created by sai mahendra, you can ask me anything about him i will try to tell about his work and details as per data i trained for 
+""".strip()
+
+HELP_TEXT = """
+📋 <b>Available commands:</b>
+• /start - Start the bot and get a welcome message
+• /help - Show this help message  
+• /about_sai - Just some self info about me
+• /resume - Get Sai's resume PDF
+""".strip()
+
+GEMINI_MODEL = 'gemini-2.0-flash-lite'
+
+RESUME_URL = "https://raw.githubusercontent.com/saimahendra282/telegram_bot/main/allpurposefin.pdf"
+
+# System instruction for Gemini; {profile} is filled with the relevant parts of re.txt
+SYSTEM_INSTRUCTION = """
+You are Sai's personal AI assistant - talk like a real human friend, not a formal bot!
+Be casual, friendly, and conversational. Use contractions (like "he's", "that's", "we're").
+When talking about Sai Mahendra, be enthusiastic and proud - he's genuinely amazing!
+Keep responses natural and under 2-3 sentences. Based on: {profile}
+        """
+
+# Map feelings to Tenor search terms
+FEELING_SEARCH_TERMS = {
+    'happy': ['happy anime', 'kawaii happy', 'anime smile', 'cute happy'],
+    'excited': ['anime excited', 'kawaii excited', 'anime celebration', 'anime yay'],
+    'sad': ['anime sad', 'kawaii sad', 'anime crying', 'anime disappointed'],
+    'thinking': ['anime thinking', 'kawaii hmm', 'anime confused', 'anime pondering'],
+    'serious': ['anime serious', 'anime cool', 'anime badass', 'anime confident'],
+    'greeting': ['anime hello', 'kawaii wave', 'anime greeting', 'anime hi'],
+    'grateful': ['anime thank you', 'kawaii thanks', 'anime bow', 'anime grateful'],
+    'cute': ['kawaii', 'anime cute', 'chibi', 'anime adorable'],
+    'approved': ['anime thumbs up', 'anime yes', 'anime approved', 'anime good'],
+    'wtf': ['anime shocked', 'anime wtf', 'anime surprised', 'anime confused'],
+    'angry': ['anime angry', 'anime mad', 'anime frustrated'],
+    'bye': ['anime goodbye', 'kawaii bye', 'anime wave goodbye'],
+    'coffee': ['anime coffee', 'kawaii coffee', 'anime drink'],
+    'childish': ['anime funny', 'kawaii silly', 'anime playful'],
+    'debate': ['anime arguing', 'anime discussion', 'anime debate']
+}
+
+# Fallback GIFs if Tenor API fails or not available
+FALLBACK_GIFS = {
+    'happy': [
+        "https://media1.tenor.com/m/SuB9sd9uT9IAAAAC/anime-happy.gif",
+        "https://media1.tenor.com/m/PL1gYFz_YpkAAAAC/kawaii-anime.gif",
+        "https://media1.tenor.com/m/fxyNZog6380AAAAC/anime-happy.gif"
+    ],
+    'excited': [
+        "https://media1.tenor.com/m/b-z9eI0rMnUAAAAC/anime-excited.gif",
+        "https://media1.tenor.com/m/YiZ5QZuEKrUAAAAC/thumbs-up-anime.gif"
+    ],
+    'sad': [
+        "https://media1.tenor.com/m/7vr7Zt7doeUAAAAC/confused-anime.gif",
+        "https://media1.tenor.com/m/X8gzL9-VQ-YAAAAC/lost-anime.gif"
+    ],
+    'thinking': [
+        "https://media1.tenor.com/m/3T_Q7EiPmrEAAAAC/anime-thinking.gif",
+        "https://media1.tenor.com/m/Sj3Tjd8WmYAAAAAC/thinking-anime.gif"
+    ],
+    'greeting': [
+        "https://media1.tenor.com/m/yP5sa-rZqfcAAAAC/kawaii-anime.gif",
+        "https://media1.tenor.com/m/ZlgJ5k7NbdoAAAAC/anime-wave.gif"
+    ],
+    'grateful': [
+        "https://media1.tenor.com/m/cHg_I2-rFUEAAAAC/bow-anime.gif",
+        "https://media1.tenor.com/m/l8X6Xcl6pUQAAAAC/thanks-anime.gif"
+    ],
+    'cute': [
+        "https://media1.tenor.com/m/8QMf6KL1AvQAAAAC/chibi-anime.gif",
+        "https://media1.tenor.com/m/NlxaZl6yQEcAAAAC/cute-anime-smile.gif"
+    ],
+    'approved': [
+        "https://media1.tenor.com/m/YiZ5QZuEKrUAAAAC/thumbs-up-anime.gif",
+        "https://media1.tenor.com/m/h8l0WvCJOGUAAAAC/confident-anime.gif"
+    ],
+    'wtf': [
+        "https://media1.tenor.com/m/7vr7Zt7doeUAAAAC/confused-anime.gif",
+        "https://media1.tenor.com/m/K8lYj1d2c8cAAAAC/question-mark-anime.gif"
+    ]
+}
+
+
 class SaiBot:
     def __init__(self):
         self.bot_token = os.getenv('BOT_ID')
@@ -31,42 +138,61 @@ class SaiBot:
         if not self.tenor_api_key:
             logger.warning("TENOR_API not set, will use fallback GIFs")
         
-        # Configure Gemini API
-        genai.configure(api_key=self.gemini_api_key)
-        self.model = genai.GenerativeModel('gemini-2.0-flash-lite')
+        # Shared keep-alive clients for Telegram and Tenor
+        self.http = HttpClientPool()
+        # Per-dependency circuit breakers; they also set each call's timeout from observed latency
+        self.breakers = default_breakers()
+        # Key/value state the caches, dedupe and send budget can share across workers (STATE_BACKEND)
+        self.state = state_from_env()
+        # Paces outbound Telegram calls under the bot-wide and per-chat limits
+        self.scheduler = SendScheduler(state=self.state)
         
-        # Load reference information about Sai
-        self.load_sai_info()
+        # The Gemini SDK is imported and configured on first use (see `model`); it dominates cold-start time
+        self._model = None
+        self._model_lock = threading.Lock()
+        # Blocking SDK calls run here so they never stall the event loop
+        self.gemini = GeminiExecutor()
+        # Stream replies into the chat with progressive edits instead of waiting for the full answer
+        self.stream_replies = os.getenv('STREAM_REPLIES', '0') == '1'
+        # How long a ready reply waits for its GIF to go out first
+        self.gif_grace = float(os.getenv('GIF_GRACE_SECONDS', '0.5'))
+        # How long an update then waits, after its reply, for a GIF that was still uploading
+        self.gif_wait = float(os.getenv('GIF_WAIT_SECONDS', '20'))
         
-        # System instruction for Gemini
-        self.system_instruction = f"""
-You are Sai's personal AI assistant - talk like a real human friend, not a formal bot!
-Be casual, friendly, and conversational. Use contractions (like "he's", "that's", "we're").
-When talking about Sai Mahendra, be enthusiastic and proud - he's genuinely amazing!
-Keep responses natural and under 2-3 sentences. Based on: {self.sai_info}
-        """
+        # Reference information about Sai is loaded and indexed for retrieval by the first prompt that needs it
+        self.response_cache = ResponseCache()
+        self.profile_loaded = False
+        self.profile_checked_at = 0.0
+        self.prompt_stats = {'prompts': 0, 'prompt_tokens': 0, 'max_prompt_tokens': 0}
         
-        # Map feelings to Tenor search terms
-        self.feeling_to_search_terms = {
-            'happy': ['happy anime', 'kawaii happy', 'anime smile', 'cute happy'],
-            'excited': ['anime excited', 'kawaii excited', 'anime celebration', 'anime yay'],
-            'sad': ['anime sad', 'kawaii sad', 'anime crying', 'anime disappointed'],
-            'thinking': ['anime thinking', 'kawaii hmm', 'anime confused', 'anime pondering'],
-            'serious': ['anime serious', 'anime cool', 'anime badass', 'anime confident'],
-            'greeting': ['anime hello', 'kawaii wave', 'anime greeting', 'anime hi'],
-            'grateful': ['anime thank you', 'kawaii thanks', 'anime bow', 'anime grateful'],
-            'cute': ['kawaii', 'anime cute', 'chibi', 'anime adorable'],
-            'approved': ['anime thumbs up', 'anime yes', 'anime approved', 'anime good'],
-            'wtf': ['anime shocked', 'anime wtf', 'anime surprised', 'anime confused'],
-            'angry': ['anime angry', 'anime mad', 'anime frustrated'],
-            'bye': ['anime goodbye', 'kawaii bye', 'anime wave goodbye'],
-            'coffee': ['anime coffee', 'kawaii coffee', 'anime drink'],
-            'childish': ['anime funny', 'kawaii silly', 'anime playful'],
-            'debate': ['anime arguing', 'anime discussion', 'anime debate']
-        }
+        # System instruction for Gemini; only the profile sections relevant to each message are appended
+        self.system_instruction = SYSTEM_INSTRUCTION
+        
+        # Keyword matcher for feelings and Sai mentions, compiled once
+        self.classifier = FeelingClassifier()
+        
+        # Static tables live at module level so they are built once per process
+        self.feeling_to_search_terms = FEELING_SEARCH_TERMS
+        self.fallback_gifs = FALLBACK_GIFS
+        
+        # Tenor results are cached per feeling/search term and refreshed in the background
+        self.gif_cache = GifCache(self.search_tenor, self.feeling_to_search_terms, self.fallback_gifs)
+        self.background_tasks = set()
+        
+        # Telegram file_ids for media we've already uploaded (resume PDF, GIFs)
+        self.media_cache = MediaCache(state=self.state if self.state.shared else None)
+        
+        # Recent turns per chat so follow-up questions keep their context
+        self.memory = ConversationMemory.from_env()
+        
+        # Every chat that has messaged the bot, for broadcasts
+        self.subscribers = registry_from_env()
+        self.broadcast_upload_lock = asyncio.Lock()
     
     def load_sai_info(self):
         """Load information about Sai from re.txt file"""
+        self.sai_info_path = None
+        self.sai_info_mtime = None
         try:
             # Try different possible paths
             possible_paths = ['re.txt', '../re.txt', './re.txt']
@@ -74,6 +200,8 @@ Keep responses natural and under 2-3 sentences. Based on: {self.sai_info}
                 try:
                     with open(path, 'r', encoding='utf-8') as file:
                         self.sai_info = file.read().strip()
+                        self.sai_info_path = path
+                        self.sai_info_mtime = os.fstat(file.fileno()).st_mtime
                         logger.info(f"Loaded Sai info from {path}")
                         return
                 except FileNotFoundError:
@@ -93,232 +221,561 @@ Keep responses natural and under 2-3 sentences. Based on: {self.sai_info}
             self.sai_info = "Sai Mahendra is a talented programmer"
             logger.error(f"Error loading Sai info: {e}")
     
-    async def send_message(self, chat_id: int, text: str):
+    def index_profile(self):
+        """Rebuild everything derived from sai_info; cached replies for the old profile are dropped"""
+        self.profile_index = ProfileIndex(self.sai_info)
+        self.profile_hash = content_hash(self.sai_info)
+        self.response_cache.clear()
+    
+    def refresh_profile_if_changed(self):
+        """Load re.txt on first use, then reload it if it was edited (checked at most every PROFILE_RELOAD_INTERVAL seconds)"""
+        now = time.monotonic()
+        if not self.profile_loaded:
+            self.load_sai_info()
+            self.index_profile()
+            self.profile_loaded = True
+            self.profile_checked_at = now
+            return
+        if not self.sai_info_path or now - self.profile_checked_at < float(os.getenv('PROFILE_RELOAD_INTERVAL', '30')):
+            return
+        self.profile_checked_at = now
+        try:
+            mtime = os.stat(self.sai_info_path).st_mtime
+        except OSError:
+            return
+        if mtime != self.sai_info_mtime:
+            logger.info(f"{self.sai_info_path} changed, reloading profile")
+            self.load_sai_info()
+            self.index_profile()
+    
+    @property
+    def model(self):
+        """The Gemini model, created once on first use"""
+        if self._model is None:
+            with self._model_lock:
+                if self._model is None:
+                    import google.generativeai as genai
+                    endpoint = os.getenv('GEMINI_API_ENDPOINT')
+                    if endpoint:
+                        # e.g. the stand-in server in benchmarks/load_test.py; REST is the transport that can reach it
+                        genai.configure(api_key=self.gemini_api_key, transport='rest',
+                                        client_options={'api_endpoint': endpoint})
+                    else:
+                        genai.configure(api_key=self.gemini_api_key)
+                    self._model = genai.GenerativeModel(GEMINI_MODEL)
+                    logger.info(f"Gemini model {GEMINI_MODEL} ready")
+        return self._model
+    
+    def generate_content(self, *args, **kwargs):
+        """Called on a Gemini worker thread, so the first call's SDK import never blocks the event loop"""
+        return self.model.generate_content(*args, **kwargs)
+    
+    def spawn(self, coro) -> asyncio.Task:
+        """Run a coroutine in the background, keeping a reference until it finishes"""
+        task = asyncio.create_task(coro)
+        self.background_tasks.add(task)
+        task.add_done_callback(self.background_tasks.discard)
+        return task
+    
+    def build_prompt(self, message_text: str, is_about_sai: bool, history: str = '') -> str:
+        """Build the Gemini prompt with only the relevant parts of re.txt, plus the chat's earlier turns if any"""
+        instruction = self.system_instruction.format(profile=self.profile_index.context_for(message_text))
+        if history:
+            instruction = f"{instruction.rstrip()}\n\nConversation so far:\n{history}"
+        if is_about_sai:
+            prompt = f"The user is asking about Sai: '{message_text}'. {instruction}"
+        else:
+            prompt = f"{instruction}\n\nUser message: {message_text}"
+        
+        tokens = estimate_tokens(prompt)
+        self.prompt_stats['prompts'] += 1
+        self.prompt_stats['prompt_tokens'] += tokens
+        self.prompt_stats['max_prompt_tokens'] = max(self.prompt_stats['max_prompt_tokens'], tokens)
+        logger.debug("Prompt size: %d chars (~%d tokens)", len(prompt), tokens)
+        return prompt
+    
+    async def post_telegram(self, url: str, payload: Dict[str, Any], op: str, max_timeout: float) -> httpx.Response:
+        """POST to the Bot API under the Telegram breaker; 5xx answers count against it, 4xx don't"""
+        return await self.breakers['telegram'].call(
+            lambda timeout: self.http.post('telegram', url, json=payload, timeout=timeout),
+            op=op, max_timeout=max_timeout, failed=lambda response: response.status_code >= 500
+        )
+    
+    @metrics.timed('send_message')
+    async def send_message(self, chat_id: int, text: str, parse_mode: str = "HTML"):
         """Send message to Telegram chat"""
         if not text or not str(text).strip():
             logger.warning("Empty message text, skipping send")
             return None
             
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendMessage"
+        url = f"/bot{self.bot_token}/sendMessage"
         payload = {
             "chat_id": chat_id,
             "text": str(text)[:4096],  # Telegram message limit
-            "parse_mode": "HTML"
         }
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, json=payload, timeout=10.0)
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"Message sent successfully to chat {chat_id}")
-                return result
-            except Exception as e:
-                logger.error(f"Error sending message to chat {chat_id}: {e}")
-                # Don't raise, just return None to prevent webhook failures
+        try:
+            response = await self.scheduler.run(
+                chat_id, lambda: self.post_telegram(url, payload, 'sendMessage', 10.0)
+            )
+            if response is None:
                 return None
+            response.raise_for_status()
+            result = response.json()
+            logger.debug("Message sent to chat %s", chat_id)
+            return result
+        except Exception as e:
+            metrics.error('send_message')
+            logger.error(f"Error sending message to chat {chat_id}: {e}")
+            # Don't raise, just return None to prevent webhook failures
+            return None
     
-    async def send_document(self, chat_id: int, document_url: str, caption: str = None):
-        """Send document/PDF to Telegram chat"""
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendDocument"
+    async def edit_message_text(self, chat_id: int, message_id: int, text: str, parse_mode: str = None):
+        """Replace the text of a message we sent earlier"""
+        url = f"/bot{self.bot_token}/editMessageText"
         payload = {
             "chat_id": chat_id,
-            "document": document_url,
+            "message_id": message_id,
+            "text": str(text)[:4096],
         }
+        if parse_mode:
+            payload["parse_mode"] = parse_mode
+        
+        try:
+            response = await self.scheduler.run(
+                chat_id, lambda: self.post_telegram(url, payload, 'editMessageText', 10.0)
+            )
+            if response is None:
+                return None
+            if response.status_code == 400 and 'message is not modified' in response.text:
+                # The message already reads exactly like this; that is what we wanted
+                logger.debug("Message %s in chat %s already up to date", message_id, chat_id)
+                return {"ok": True, "result": True}
+            response.raise_for_status()
+            return response.json()
+        except Exception as e:
+            logger.error(f"Error editing message {message_id} in chat {chat_id}: {e}")
+            return None
+    
+    async def send_media(self, method: str, field: str, chat_id: int, media_url: str,
+                         extra: Dict[str, Any] = None, timeout: float = 15.0,
+                         priority: int = PRIORITY_MEDIA) -> Optional[Dict[str, Any]]:
+        """Send media by cached Telegram file_id when we have one, by URL otherwise (None if the send was dropped)"""
+        url = f"/bot{self.bot_token}/{method}"
+        file_id = self.media_cache.get(media_url)
+        payload = {"chat_id": chat_id, field: file_id or media_url}
+        if file_id:
+            metrics.event('media_file_id_hit')
+        if extra:
+            payload.update(extra)
+        
+        def post():
+            # Uploads from a URL take far longer than sends by file_id, so they keep their own latency history
+            op = f"{method}:upload" if payload[field] == media_url else method
+            return self.post_telegram(url, dict(payload), op, timeout)
+        
+        response = await self.scheduler.run(chat_id, post, priority)
+        if response is not None and file_id and response.status_code == 400:
+            # Telegram no longer accepts this file_id; drop it and upload from the URL again
+            logger.warning(f"Cached file_id for {media_url} was rejected, resending by URL")
+            metrics.event('media_file_id_rejected')
+            self.media_cache.forget(media_url)
+            payload[field] = media_url
+            response = await self.scheduler.run(chat_id, post, priority)
+        if response is None:
+            return None
+        response.raise_for_status()
+        result = response.json()
+        
+        if payload[field] == media_url:
+            # Sent by URL, first time or after a rejected file_id; animations come back as both
+            # "animation" and "document", and either id works
+            self.media_cache.remember(media_url, extract_file_id(result.get('result') or {}, field, 'document'))
+        return result
+    
+    async def send_document(self, chat_id: int, document_url: str, caption: str = None):
+        """Send document/PDF to Telegram chat"""
+        extra = {}
         if caption:
-            payload["caption"] = caption
-            payload["parse_mode"] = "HTML"
+            extra["caption"] = caption
+            extra["parse_mode"] = "HTML"
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, json=payload, timeout=30.0)
-                response.raise_for_status()
-                return response.json()
-            except Exception as e:
-                logger.error(f"Error sending document: {e}")
-                # Fallback to sending a message with the link
-                await self.send_message(chat_id, f"📄 Here's Sai's resume: {document_url}")
-                raise
+        try:
+            result = await self.send_media('sendDocument', 'document', chat_id, document_url, extra, timeout=30.0)
+            if result is None:
+                raise RuntimeError("document send was dropped by the rate limiter")
+            return result
+        except Exception as e:
+            logger.error(f"Error sending document: {e}")
+            # Fallback to sending a message with the link
+            metrics.event('document_link_fallback')
+            await self.send_message(chat_id, f"📄 Here's Sai's resume: {document_url}")
+            raise
     
+    @metrics.timed('send_gif')
     async def send_gif(self, chat_id: int, gif_url: str, caption: str = None):
         """Send GIF to Telegram chat"""
         if not gif_url:
             logger.warning("No GIF URL provided, skipping send")
             return None
             
-        url = f"https://api.telegram.org/bot{self.bot_token}/sendAnimation"
-        payload = {
-            "chat_id": chat_id,
-            "animation": gif_url,
-        }
+        extra = {}
         if caption:
-            payload["caption"] = str(caption)[:1024]  # Caption limit
-            payload["parse_mode"] = "HTML"
+            extra["caption"] = str(caption)[:1024]  # Caption limit
+            extra["parse_mode"] = "HTML"
         
-        async with httpx.AsyncClient() as client:
-            try:
-                response = await client.post(url, json=payload, timeout=15.0)
-                response.raise_for_status()
-                result = response.json()
-                logger.info(f"GIF sent successfully to chat {chat_id}")
-                return result
-            except Exception as e:
-                logger.error(f"Error sending GIF to chat {chat_id}: {e}")
-                # Don't raise, just return None to prevent webhook failures
+        try:
+            result = await self.send_media('sendAnimation', 'animation', chat_id, gif_url, extra,
+                                           timeout=15.0, priority=PRIORITY_DECORATIVE)
+            if result is None:
                 return None
+            logger.debug("GIF sent to chat %s", chat_id)
+            return result
+        except Exception as e:
+            metrics.error('send_gif')
+            logger.error(f"Error sending GIF to chat {chat_id}: {e}")
+            # Don't raise, just return None to prevent webhook failures
+            return None
+    
+    async def send_broadcast(self, chat_id: int, message: Dict[str, Any]) -> Optional[httpx.Response]:
+        """One broadcast send in the bulk lane; returns Telegram's response (None if the send was dropped)"""
+        document_url = message.get('document_url')
+        # Paid broadcasts lift Telegram's ~30/s limit (raise TELEGRAM_GLOBAL_RATE to match); they cost Stars
+        paid = {"allow_paid_broadcast": True} if os.getenv('BROADCAST_PAID', '0') == '1' else {}
+        if not document_url:
+            payload = {"chat_id": chat_id, "text": message['text'][:4096], **paid}
+            if message.get('parse_mode'):
+                payload["parse_mode"] = message['parse_mode']
+            return await self.scheduler.run(
+                chat_id, lambda: self.post_telegram(f"/bot{self.bot_token}/sendMessage", payload, 'sendMessage', 10.0),
+                PRIORITY_BULK
+            )
+        
+        async def send_document(document: str) -> Optional[httpx.Response]:
+            payload = {"chat_id": chat_id, "document": document, **paid}
+            if message.get('caption'):
+                payload["caption"] = message['caption'][:1024]
+                if message.get('parse_mode'):
+                    payload["parse_mode"] = message['parse_mode']
+            op = 'sendDocument:upload' if document == document_url else 'sendDocument'
+            return await self.scheduler.run(
+                chat_id, lambda: self.post_telegram(f"/bot{self.bot_token}/sendDocument", payload, op, 30.0),
+                PRIORITY_BULK
+            )
+        
+        async def upload() -> Optional[httpx.Response]:
+            # Called under broadcast_upload_lock, so the other chats wait for this file_id
+            response = await send_document(document_url)
+            if response is not None and response.status_code == 200:
+                self.media_cache.remember(document_url, extract_file_id(response.json().get('result') or {}, 'document'))
+            return response
+        
+        # Upload the document once; every other chat gets the cached file_id
+        file_id = self.media_cache.get(document_url)
+        if not file_id:
+            async with self.broadcast_upload_lock:
+                file_id = self.media_cache.get(document_url)
+                if not file_id:
+                    return await upload()
+        response = await send_document(file_id)
+        if response is None or response.status_code != 400 or chat_is_gone(response):
+            return response
+        # Telegram no longer accepts the cached file_id: the first chat to find out uploads again,
+        # the others (already in flight with the old id) retry with the new one
+        async with self.broadcast_upload_lock:
+            current = self.media_cache.get(document_url)
+            if current == file_id:
+                logger.warning(f"Cached file_id for {document_url} was rejected, uploading it again for the broadcast")
+                metrics.event('media_file_id_rejected')
+                self.media_cache.forget(document_url)
+                current = None
+            if not current:
+                return await upload()
+        return await send_document(current)
+    
+    async def search_tenor(self, search_query: str) -> List[str]:
+        """Search Tenor and return every GIF URL in the result set"""
+        # Tenor API v2 endpoint
+        url = "/v2/search"
+        params = {
+            'q': search_query,
+            'key': self.tenor_api_key,
+            'limit': 20,
+            'media_filter': 'gif',
+            'contentfilter': 'off'  # Keep it clean
+        }
+        
+        response = await self.breakers['tenor'].call(
+            lambda timeout: self.http.get('tenor', url, params=params, timeout=timeout),
+            op='search', failed=lambda response: response.status_code >= 500 or response.status_code == 429
+        )
+        response.raise_for_status()
+        data = response.json()
+        
+        urls = [gif['media_formats']['gif']['url'] for gif in data.get('results', [])
+                if gif.get('media_formats', {}).get('gif', {}).get('url')]
+        if not urls:
+            logger.warning(f"No GIFs found for search: {search_query}")
+        return urls
     
+    @metrics.timed('get_random_gif')
     async def get_random_gif(self, feeling: str = None):
-        """Get a random GIF based on feeling/emotion using Tenor API"""
+        """Get a random GIF based on feeling/emotion from the Tenor-backed GIF cache"""
         # If no specific feeling, pick a random one
         if not feeling or feeling not in self.feeling_to_search_terms:
             feeling = random.choice(list(self.feeling_to_search_terms.keys()))
         
-        # Try Tenor API first if available
+        # Try the Tenor cache first if available
         if self.tenor_api_key:
             try:
-                # Get search terms for this feeling
-                search_terms = self.feeling_to_search_terms[feeling]
-                search_query = random.choice(search_terms)
-                
-                # Tenor API v2 endpoint
-                url = "https://tenor.googleapis.com/v2/search"
-                params = {
-                    'q': search_query,
-                    'key': self.tenor_api_key,
-                    'limit': 20,
-                    'media_filter': 'gif',
-                    'contentfilter': 'off'  # Keep it clean
-                }
-                
-                async with httpx.AsyncClient() as client:
-                    response = await client.get(url, params=params, timeout=10.0)
-                    response.raise_for_status()
-                    data = response.json()
-                    
-                    if data.get('results'):
-                        # Pick a random GIF from results
-                        gif = random.choice(data['results'])
-                        return gif['media_formats']['gif']['url']
-                    else:
-                        logger.warning(f"No GIFs found for search: {search_query}")
-                        
+                gif_url = await self.gif_cache.get(feeling)
+                if gif_url:
+                    return gif_url
             except Exception as e:
+                metrics.error('get_random_gif')
                 logger.error(f"Error fetching GIF from Tenor: {e}")
         
-        # Fallback GIFs if Tenor API fails or not available
-        fallback_gifs = {
-            'happy': [
-                "https://media1.tenor.com/m/SuB9sd9uT9IAAAAC/anime-happy.gif",
-                "https://media1.tenor.com/m/PL1gYFz_YpkAAAAC/kawaii-anime.gif",
-                "https://media1.tenor.com/m/fxyNZog6380AAAAC/anime-happy.gif"
-            ],
-            'excited': [
-                "https://media1.tenor.com/m/b-z9eI0rMnUAAAAC/anime-excited.gif",
-                "https://media1.tenor.com/m/YiZ5QZuEKrUAAAAC/thumbs-up-anime.gif"
-            ],
-            'sad': [
-                "https://media1.tenor.com/m/7vr7Zt7doeUAAAAC/confused-anime.gif",
-                "https://media1.tenor.com/m/X8gzL9-VQ-YAAAAC/lost-anime.gif"
-            ],
-            'thinking': [
-                "https://media1.tenor.com/m/3T_Q7EiPmrEAAAAC/anime-thinking.gif",
-                "https://media1.tenor.com/m/Sj3Tjd8WmYAAAAAC/thinking-anime.gif"
-            ],
-            'greeting': [
-                "https://media1.tenor.com/m/yP5sa-rZqfcAAAAC/kawaii-anime.gif",
-                "https://media1.tenor.com/m/ZlgJ5k7NbdoAAAAC/anime-wave.gif"
-            ],
-            'grateful': [
-                "https://media1.tenor.com/m/cHg_I2-rFUEAAAAC/bow-anime.gif",
-                "https://media1.tenor.com/m/l8X6Xcl6pUQAAAAC/thanks-anime.gif"
-            ],
-            'cute': [
-                "https://media1.tenor.com/m/8QMf6KL1AvQAAAAC/chibi-anime.gif",
-                "https://media1.tenor.com/m/NlxaZl6yQEcAAAAC/cute-anime-smile.gif"
-            ],
-            'approved': [
-                "https://media1.tenor.com/m/YiZ5QZuEKrUAAAAC/thumbs-up-anime.gif",
-                "https://media1.tenor.com/m/h8l0WvCJOGUAAAAC/confident-anime.gif"
-            ],
-            'wtf': [
-                "https://media1.tenor.com/m/7vr7Zt7doeUAAAAC/confused-anime.gif",
-                "https://media1.tenor.com/m/K8lYj1d2c8cAAAAC/question-mark-anime.gif"
-            ]
-        }
-        
         # Use fallback
-        gif_list = fallback_gifs.get(feeling, fallback_gifs['happy'])
+        metrics.event('gif_fallback')
+        gif_list = self.fallback_gifs.get(feeling, self.fallback_gifs['happy'])
         return random.choice(gif_list)
     
-    async def generate_gemini_response(self, prompt: str) -> str:
-        """Generate response using Gemini API"""
+    @metrics.timed('generate_gemini_response')
+    async def generate_gemini_response(self, prompt: str, cache_key: str = None,
+                                       on_reply: Callable[[str], None] = None) -> str:
+        """Generate response using Gemini API, served from the response cache when `cache_key` is given.
+        
+        Failures come back as a friendly message; `on_reply` is only called with real answers.
+        """
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                metrics.event('response_cache_hit')
+                if on_reply:
+                    on_reply(cached)
+                return cached
+        
         try:
-            response = self.model.generate_content(prompt)
+            response = await self.breakers['gemini'].call(
+                lambda timeout: self.gemini.run(
+                    self.generate_content, prompt, timeout=timeout,
+                    request_options={"timeout": timeout}
+                ),
+                op='generate'
+            )
             if response.text:
+                if cache_key:
+                    self.response_cache.put(cache_key, response.text)
+                if on_reply:
+                    on_reply(response.text)
                 return response.text
             else:
                 logger.warning("Gemini returned empty response")
+                metrics.event('gemini_empty_reply')
                 return "Hmm, I'm not sure how to respond to that. Could you try asking in a different way?"
         except Exception as e:
-            logger.error(f"Gemini API error: {e}")
-            error_str = str(e).lower()
-            if "404" in error_str or "not found" in error_str:
-                return "My AI brain needs an update! The developer should check the Gemini model configuration."
-            elif "api key" in error_str or "authentication" in error_str:
-                return "There's an issue with my API credentials. Please check with my developer!"
-            elif "quota" in error_str or "limit" in error_str:
-                return "I've been thinking too much today! Please try again in a few minutes."
-            else:
-                return "Sorry, I'm having trouble connecting to my brain right now. Please try again later!"
+            if not isinstance(e, BreakerOpen):
+                metrics.error('generate_gemini_response')
+            return self.gemini_error_message(e, cache_key)
+    
+    def gemini_error_message(self, error: Exception, cache_key: str = None) -> str:
+        """Reply for a failed Gemini call: an earlier answer to the same question if we have one, else a friendly message"""
+        if cache_key:
+            cached = self.response_cache.fallback(cache_key)
+            if cached:
+                metrics.event('gemini_cached_fallback')
+                return cached
+        metrics.event('gemini_fallback_reply')
+        if isinstance(error, BreakerOpen):
+            logger.warning("Gemini skipped: %s", error)
+            return "Sorry, I'm having trouble connecting to my brain right now. Please try again later!"
+        if isinstance(error, asyncio.TimeoutError):
+            logger.error("Gemini API call timed out")
+            return "I took too long thinking about that one! Please try again in a moment."
+        logger.error(f"Gemini API error: {error!r}")
+        # google.api_core exceptions carry the HTTP status as `code`
+        code = getattr(error, 'code', None)
+        # An invalid key comes back as 400 INVALID_ARGUMENT with reason API_KEY_INVALID, not 401/403
+        bad_key = code == 400 and (getattr(error, 'reason', None) == 'API_KEY_INVALID'
+                                   or 'API_KEY_INVALID' in str(getattr(error, 'details', None) or '')
+                                   or 'api key not valid' in str(error).lower())
+        if code == 404:
+            return "My AI brain needs an update! The developer should check the Gemini model configuration."
+        elif code in (401, 403) or bad_key:
+            return "There's an issue with my API credentials. Please check with my developer!"
+        elif code == 429:
+            return "I've been thinking too much today! Please try again in a few minutes."
+        else:
+            return "Sorry, I'm having trouble connecting to my brain right now. Please try again later!"
+    
+    @metrics.timed('stream_gemini_response')
+    async def stream_gemini_response(self, chat_id: int, prompt: str, cache_key: str = None,
+                                     before_send: Callable[[], Awaitable[None]] = None,
+                                     on_reply: Callable[[str], None] = None):
+        """Stream a Gemini reply into the chat, growing the message with editMessageText as chunks arrive"""
+        reply = StreamingReply(chat_id, self.send_message, self.edit_message_text, before_send=before_send)
+        if cache_key:
+            cached = self.response_cache.get(cache_key)
+            if cached:
+                metrics.event('response_cache_hit')
+                await reply.ready()
+                await self.send_message(chat_id, cached)
+                if on_reply:
+                    on_reply(cached)
+                return
+        
+        try:
+            with self.breakers['gemini'].guard('stream') as call:
+                async for chunk in self.gemini.stream(
+                    self.generate_content, prompt, stream=True, timeout=call.timeout,
+                    request_options={"timeout": call.timeout}
+                ):
+                    try:
+                        text = chunk.text
+                    except ValueError:
+                        continue  # chunk without text parts (e.g. safety metadata)
+                    # Only the model's time counts toward Gemini's latency; Telegram edits are ours
+                    with call.outside():
+                        await reply.feed(text)
+        except Exception as e:
+            if not isinstance(e, BreakerOpen):
+                metrics.error('stream_gemini_response')
+            if not reply.text:
+                await reply.ready()
+                await self.send_message(chat_id, self.gemini_error_message(e, cache_key))
+                return
+            logger.error(f"Gemini stream for chat {chat_id} broke off: {e}")
+            await reply.finish()
+            return
+        
+        if not reply.text.strip():
+            logger.warning("Gemini returned empty response")
+            metrics.event('gemini_empty_reply')
+            await reply.ready()
+            await self.send_message(chat_id, "Hmm, I'm not sure how to respond to that. Could you try asking in a different way?")
+            return
+        await reply.finish()
+        if cache_key:
+            self.response_cache.put(cache_key, reply.text)
+        if on_reply:
+            on_reply(reply.text)
+        logger.debug("Streamed reply to chat %s in %d message(s), %d edits", chat_id, len(reply.message_ids), reply.edits)
+    
+    async def reply_with_gemini(self, chat_id: int, prompt: str, cache_key: str = None,
+                                before_send: Callable[[], Awaitable[None]] = None,
+                                on_reply: Callable[[str], None] = None):
+        """Answer with Gemini, streaming the reply when STREAM_REPLIES is on.
+        
+        `before_send` runs just before the first send; `on_reply` gets the answer if Gemini produced one.
+        """
+        if self.stream_replies:
+            await self.stream_gemini_response(chat_id, prompt, cache_key, before_send, on_reply)
+            return
+        response = await self.generate_gemini_response(prompt, cache_key, on_reply)
+        if before_send:
+            await before_send()
+        if response:
+            await self.send_message(chat_id, response)
+    
+    async def reply_with_gif(self, chat_id: int, feeling: Optional[str],
+                             reply: Callable[[Callable[[], Awaitable[None]]], Awaitable[Any]], label: str):
+        """Look up and send a GIF while `reply` is being prepared.
+        
+        `reply` receives a hook to await right before it sends anything. The hook lets the GIF go
+        first if it lands within GIF_GRACE_SECONDS; after that a GIF still being looked up is
+        cancelled, and one already uploading is left to arrive after the text. Either way the GIF is
+        finished (up to GIF_WAIT_SECONDS) before this returns, so the chat's next update comes after it.
+        """
+        started = time.perf_counter()
+        timings = {}
+        gif_stage = ['lookup']
+        
+        async def lookup_and_send():
+            try:
+                gif_url = await self.get_random_gif(feeling)
+                timings['gif_lookup'] = time.perf_counter() - started
+                if gif_url:
+                    gif_stage[0] = 'send'
+                    await self.send_gif(chat_id, gif_url)
+                    timings['gif_sent'] = time.perf_counter() - started
+                gif_stage[0] = 'done'
+            except Exception as e:
+                # Continue even if the GIF fails
+                gif_stage[0] = 'failed'
+                logger.error(f"Error sending GIF: {e}")
+        
+        gif_task = self.spawn(lookup_and_send())
+        
+        async def gif_first():
+            timings['reply_ready'] = time.perf_counter() - started
+            if gif_task.done():
+                if gif_task.cancelled():
+                    timings['gif'] = 'skipped'
+                return
+            # asyncio.wait neither cancels the GIF on timeout nor raises if it was cancelled elsewhere
+            await asyncio.wait({gif_task}, timeout=self.gif_grace)
+            if gif_task.cancelled():
+                timings['gif'] = 'skipped'  # e.g. at shutdown; the reply still goes out
+            elif not gif_task.done():
+                if gif_stage[0] == 'lookup':
+                    gif_task.cancel()
+                timings['gif'] = 'cancelled' if gif_stage[0] == 'lookup' else 'demoted'
+        
+        try:
+            await reply(gif_first)
+            if not gif_task.done():
+                # A demoted GIF is still uploading: finish it within this update, so it isn't dropped
+                # once a webhook has answered and the chat's next update doesn't overtake it
+                await asyncio.wait({gif_task}, timeout=self.gif_wait)
+        finally:
+            timings['total'] = time.perf_counter() - started
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("%s timings for chat %s: %s", label, chat_id, ", ".join(
+                    f"{stage}={value:.3f}s" if isinstance(value, float) else f"{stage}={value}"
+                    for stage, value in timings.items()
+                ))
     
     async def handle_start_command(self, chat_id: int):
         """Handle /start command"""
-        # Send a greeting GIF first
-        gif_url = await self.get_random_gif('greeting')
-        if gif_url:
-            await self.send_gif(chat_id, gif_url)
+        async def welcome(before_send):
+            await before_send()
+            await self.send_message(chat_id, WELCOME_MESSAGE)
         
-        welcome_message = """
- <h1>Hello visitor </h1><br><p>I am telegram bot created by sai mahendra, you can ask me anything about him i will try to tell about his work and details as per data i trained for 
-        """
-        await self.send_message(chat_id, welcome_message.strip())
+        # Greeting GIF first, then the welcome text
+        await self.reply_with_gif(chat_id, 'greeting', welcome, "/start")
     
     async def handle_help_command(self, chat_id: int):
         """Handle /help command"""
-        help_text = """
-📋 <b>Available commands:</b>
-• /start - Start the bot and get a welcome message
-• /help - Show this help message  
-• /about_sai - Just some self info about me
-• /resume - Get Sai's resume PDF
-        """
-        await self.send_message(chat_id, help_text.strip())
+        await self.send_message(chat_id, HELP_TEXT)
     
     async def handle_about_sai_command(self, chat_id: int):
         """Handle /about_sai command"""
-        # Send a happy GIF first
-        gif_url = await self.get_random_gif('happy')
-        if gif_url:
-            await self.send_gif(chat_id, gif_url)
+        self.refresh_profile_if_changed()
+        prompt = "Tell me about Sai Mahendra, the programmer. Be cute and expressive but don't use emojis."
+        cache_key = ResponseCache.key(prompt, self.profile_hash)
         
-        response = await self.generate_gemini_response(
-            "Tell me about Sai Mahendra, the programmer. Be cute and expressive but don't use emojis."
+        # Happy GIF first, generated concurrently with the answer
+        await self.reply_with_gif(
+            chat_id, 'happy',
+            lambda before_send: self.reply_with_gemini(chat_id, prompt, cache_key, before_send),
+            "/about_sai"
         )
-        await self.send_message(chat_id, response)
     
     async def handle_resume_command(self, chat_id: int):
         """Handle /resume command - sends Sai's resume PDF"""
-        # Send an excited GIF first
-        gif_url = await self.get_random_gif('excited')
-        if gif_url:
-            await self.send_gif(chat_id, gif_url)
+        async def resume(before_send):
+            await before_send()
+            await self.send_document(chat_id, RESUME_URL)
         
-        resume_url = "https://raw.githubusercontent.com/saimahendra282/telegram_bot/main/allpurposefin.pdf"
-        await self.send_document(chat_id, resume_url)
+        # Excited GIF first, then the PDF
+        await self.reply_with_gif(chat_id, 'excited', resume, "/resume")
     
     async def handle_message(self, chat_id: int, message_text: str):
         """Handle regular text messages"""
-        logger.info(f"Handling message from chat {chat_id}: {message_text}")
+        if LOG_PAYLOADS:
+            logger.info("Handling message from chat %s: %s", chat_id, message_text)
         
         # Validate input
         if not message_text or not str(message_text).strip():
@@ -326,35 +783,31 @@ Keep responses natural and under 2-3 sentences. Based on: {self.sai_info}
             return
         
         try:
-            # Determine feeling based on message content
-            feeling = self.determine_feeling(message_text)
-            logger.info(f"Determined feeling: {feeling}")
+            # Determine feeling and whether the message is asking about Sai in one pass
+            with metrics.timer('determine_feeling'):
+                feeling, is_about_sai = self.classifier.classify(message_text)
+            logger.debug("Determined feeling: %s", feeling)
             
-            # Check if the message is asking about Sai
-            sai_keywords = ['sai', 'sai mahendra', 'who is sai', 'about sai', 'tell me about sai', 'bejawada sai mahendra', 'mahendra']
-            is_about_sai = any(keyword in message_text.lower() for keyword in sai_keywords)
+            self.refresh_profile_if_changed()
+            history = self.memory.context(chat_id)
+            prompt = self.build_prompt(message_text, is_about_sai, history)
             
-            if is_about_sai:
-                prompt = f"The user is asking about Sai: '{message_text}'. {self.system_instruction}"
-            else:
-                prompt = f"{self.system_instruction}\n\nUser message: {message_text}"
+            # Near-identical questions are answered from the cache, but only when there is no earlier
+            # conversation that could change what the right answer is
+            cache_key = None if history else ResponseCache.key(message_text, self.profile_hash)
+            remember = lambda reply: self.memory.record(chat_id, message_text, reply)
             
-            # Send contextual GIF based on feeling first (30% chance to keep it not overwhelming)
+            # Contextual GIF based on feeling (30% chance to keep it not overwhelming), fetched
+            # while Gemini generates so it can still land before the reply
             if random.random() < 0.3 and feeling:
-                try:
-                    gif_url = await self.get_random_gif(feeling)
-                    if gif_url:
-                        await self.send_gif(chat_id, gif_url)
-                        logger.info(f"GIF sent to chat {chat_id}")
-                except Exception as gif_error:
-                    logger.error(f"Error sending GIF: {gif_error}")
-                    # Continue even if GIF fails
-            
-            # Generate response
-            response = await self.generate_gemini_response(prompt)
-            if response:
-                await self.send_message(chat_id, response)
-                logger.info(f"Response sent to chat {chat_id}")
+                await self.reply_with_gif(
+                    chat_id, feeling,
+                    lambda before_send: self.reply_with_gemini(chat_id, prompt, cache_key, before_send, remember),
+                    "Message"
+                )
+            else:
+                await self.reply_with_gemini(chat_id, prompt, cache_key, on_reply=remember)
+            logger.debug("Response sent to chat %s", chat_id)
                     
         except Exception as e:
             logger.error(f"Error handling message from chat {chat_id}: {e}")
@@ -369,130 +822,190 @@ Keep responses natural and under 2-3 sentences. Based on: {self.sai_info}
                 logger.error(f"Failed to send error message: {error_send_error}")
                 # If we can't even send error message, just log it
     
+    @metrics.timed('determine_feeling')
     def determine_feeling(self, message_text: str) -> str:
         """Determine feeling/emotion based on message content"""
-        message_lower = message_text.lower()
-        
-        # Greeting patterns
-        if any(word in message_lower for word in ['hello', 'hi', 'hey', 'good morning', 'good afternoon', 'good evening']):
-            return 'greeting'
-        
-        # WTF/shocked patterns
-        elif any(word in message_lower for word in ['wtf', 'what the', 'omg', 'unbelievable', 'crazy', 'insane']):
-            return 'wtf'
-        
-        # Excited/positive patterns
-        elif any(word in message_lower for word in ['wow', 'amazing', 'awesome', 'great', 'fantastic', 'incredible', 'cool']):
-            return 'excited'
-        
-        # Happy patterns
-        elif any(word in message_lower for word in ['happy', 'good', 'nice', 'love', 'like', 'perfect']):
-            return 'happy'
-        
-        # Approved/agreement patterns
-        elif any(word in message_lower for word in ['yes', 'correct', 'right', 'exactly', 'agree', 'approved']):
-            return 'approved'
-        
-        # Grateful patterns
-        elif any(word in message_lower for word in ['thanks', 'thank you', 'appreciate', 'grateful']):
-            return 'grateful'
-        
-        # Cute patterns
-        elif any(word in message_lower for word in ['cute', 'adorable', 'sweet', 'kawaii', 'aww']):
-            return 'cute'
-        
-        # Serious/work related
-        elif any(word in message_lower for word in ['project', 'work', 'business', 'professional', 'serious']):
-            return 'serious'
-        
-        # Thinking/question patterns
-        elif any(word in message_lower for word in ['what', 'how', 'why', 'when', 'where', '?']):
-            return 'thinking'
-        
-        # Sad/confused patterns
-        elif any(word in message_lower for word in ['sad', 'confused', 'don\'t understand', 'unclear', 'help', 'problem']):
-            return 'sad'
-        
-        else:
-            return None  # Random feeling will be picked
+        feeling, _ = self.classifier.classify(message_text)
+        return feeling  # None means a random feeling will be picked
 
 # Initialize bot
 bot = SaiBot()
 
+# Off unless PROFILE_SAMPLE_RATE is set
+profiler = SamplingProfiler()
+# How late the event loop wakes up from a sleep; a busy or blocked loop shows up here first
+loop_lag = LoopLagMonitor()
+
+async def process_update(data: Dict[str, Any]):
+    """Handle one update, under the sampling profiler when this update is picked for profiling"""
+    chat_id = ((data.get('message') or {}).get('chat') or {}).get('id')
+    with log_context(update_id=data.get('update_id'), chat_id=chat_id), \
+            profiler.session(f"update-{data.get('update_id')}"):
+        await handle_update(data)
+
+async def handle_update(data: Dict[str, Any]):
+    """Dispatch a parsed Telegram update to the right handler"""
+    # Check if it's a message update
+    if 'message' not in data:
+        logger.debug("No message in update, ignoring")
+        return
+    
+    message = data['message']
+    
+    # Validate message structure
+    if 'chat' not in message or 'id' not in message['chat']:
+        logger.error("Invalid message structure - missing chat ID")
+        return
+        
+    chat_id = message['chat']['id']
+    try:
+        bot.subscribers.add(chat_id)
+    except Exception as e:
+        logger.error(f"Could not register chat {chat_id} for broadcasts: {e}")
+    
+    # Handle commands
+    if 'text' in message:
+        text = message['text']
+        if LOG_PAYLOADS:
+            logger.info("Processing text message: %s", text)
+        
+        try:
+            if text.startswith('/start'):
+                await bot.handle_start_command(chat_id)
+            elif text.startswith('/help'):
+                await bot.handle_help_command(chat_id)
+            elif text.startswith('/about_sai'):
+                await bot.handle_about_sai_command(chat_id)
+            elif text.startswith('/resume'):
+                await bot.handle_resume_command(chat_id)
+            else:
+                await bot.handle_message(chat_id, text)
+                
+            logger.debug("Processed message for chat %s", chat_id)
+            
+        except Exception as handler_error:
+            logger.error(f"Error in message handler: {handler_error}")
+            # Try to send error message to user
+            try:
+                await bot.send_message(chat_id, "Sorry, I encountered an error processing your message. Please try again.")
+            except:
+                pass  # If we can't send error message, just log it
+    else:
+        logger.debug("Message has no text content")
+
+# In "queue" mode the webhook acks immediately and updates are handled in the background.
+# Keep "sync" on serverless platforms, which freeze the process once the response is sent.
+WEBHOOK_MODE = os.getenv('WEBHOOK_MODE', 'sync')
+update_queue = UpdateQueue(process_update)
+# Telegram redelivers updates it thinks timed out; remember recent update_ids to skip them
+deduplicator = UpdateDeduplicator.from_env(bot.state)
+
+async def dispatch_update(data: Dict[str, Any]):
+    """Common ingress path for webhook and long polling: skip duplicates, then queue or process"""
+    if deduplicator.is_duplicate(data.get('update_id')):
+        logger.info("Skipping duplicate update %s", data.get('update_id'))
+        return
+    
+    if update_queue.running:
+        chat_id = (data.get('message') or {}).get('chat', {}).get('id')
+        if chat_id is not None:
+            await update_queue.submit(chat_id, data)
+        return
+    
+    await process_update(data)
+
+poller = UpdatePoller(bot.http, bot.bot_token, dispatch_update)
+# Fans announcements out to every registered chat; checkpoints live next to the registry
+broadcaster = Broadcaster(bot.subscribers, bot.send_broadcast)
+
+@app.on_event("startup")
+async def startup():
+    """Open long-lived HTTP clients, start the update workers and warm the GIF cache (and optionally Gemini)"""
+    await bot.http.start()
+    if WEBHOOK_MODE == 'queue':
+        await update_queue.start()
+    lag_interval = float(os.getenv('LOOP_LAG_INTERVAL', '1'))
+    if lag_interval > 0:
+        bot.spawn(loop_lag.run(lag_interval))
+    if os.getenv('GEMINI_PREWARM', '0') == '1':
+        # Long-running servers can pay the Gemini SDK import up front instead of on the first message
+        bot.spawn(asyncio.to_thread(lambda: bot.model))
+    if bot.tenor_api_key and os.getenv('GIF_PREFETCH', '1') != '0':
+        # Warm the GIF cache without holding up startup
+        bot.spawn(bot.gif_cache.prefetch())
+    # Every worker tries; the lease in the registry lets exactly one of them take the job
+    if os.getenv('BROADCAST_AUTO_RESUME', '1') != '0' and broadcaster.resume_interrupted():
+        logger.info(f"Resuming broadcast {broadcaster.job['id']} from its checkpoint")
+
+@app.on_event("shutdown")
+async def shutdown():
+    """Drain queued updates, save cached file_ids, then close HTTP clients and the Gemini worker pool"""
+    await update_queue.drain()
+    await broadcaster.shutdown()
+    for task in list(bot.background_tasks):
+        task.cancel()
+    bot.media_cache.flush()
+    await bot.http.close()
+    bot.gemini.shutdown()
+
 @app.get("/")
 async def root():
     """Health check endpoint"""
-    return {"status": "Sai's Telegram Bot is running!", "version": "1.0.0"}
+    return {"status": "Sai's Telegram Bot is running!", "version": "1.0.0", "dependencies": bot.breakers.states()}
+
+SUBSYSTEM_STATS = {
+    "http": bot.http.stats,
+    "gemini": bot.gemini.stats,
+    "updates": update_queue.stats,
+    "dedupe": deduplicator.stats,
+    "gifs": bot.gif_cache.stats,
+    "media": bot.media_cache.stats,
+    "prompts": lambda: {**bot.prompt_stats, **(bot.profile_index.stats() if bot.profile_loaded else {})},
+    "responses": bot.response_cache.stats,
+    "history": bot.memory.stats,
+    "sends": bot.scheduler.stats,
+    "polling": poller.stats,
+    "logging": logging_stats,
+    "loop": loop_lag.stats,
+    "state": bot.state.stats,
+    "breakers": bot.breakers.stats,
+    "broadcast": broadcaster.stats,
+}
+for name, collect in SUBSYSTEM_STATS.items():
+    metrics.collect(name, collect)
+
+@app.get("/stats")
+async def stats():
+    """Internal counters for the bot's subsystems"""
+    return {name: collect() for name, collect in SUBSYSTEM_STATS.items()}
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint: per-stage latency histograms, error/event counters and subsystem gauges"""
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 @app.post("/webhook")
 async def webhook(request: Request):
     """Handle incoming webhook from Telegram"""
     try:
-        # First, let's get the raw data to see what we're receiving
-        raw_data = await request.body()
-        logger.info(f"Raw webhook data: {raw_data}")
-        
         # Parse JSON
         try:
-            data = await request.json()
+            with metrics.timer('webhook_parse'):
+                data = await request.json()
         except Exception as json_error:
-            logger.error(f"JSON parsing error: {json_error}")
-            logger.error(f"Raw data that failed to parse: {raw_data}")
+            logger.error("JSON parsing error: %s", json_error)
+            if LOG_PAYLOADS:
+                logger.error("Raw data that failed to parse: %r", await request.body())
             return JSONResponse({"status": "ok"})  # Return OK to avoid telegram retries
         
-        logger.info(f"Parsed webhook data: {data}")
-        
-        # Check if it's a message update
-        if 'message' not in data:
-            logger.info("No message in webhook data, returning OK")
-            return JSONResponse({"status": "ok"})
-        
-        message = data['message']
-        
-        # Validate message structure
-        if 'chat' not in message or 'id' not in message['chat']:
-            logger.error("Invalid message structure - missing chat ID")
-            return JSONResponse({"status": "ok"})
-            
-        chat_id = message['chat']['id']
-        logger.info(f"Processing message for chat_id: {chat_id}")
-        
-        # Handle commands
-        if 'text' in message:
-            text = message['text']
-            logger.info(f"Processing text message: {text}")
-            
-            try:
-                if text.startswith('/start'):
-                    await bot.handle_start_command(chat_id)
-                elif text.startswith('/help'):
-                    await bot.handle_help_command(chat_id)
-                elif text.startswith('/about_sai'):
-                    await bot.handle_about_sai_command(chat_id)
-                elif text.startswith('/resume'):
-                    await bot.handle_resume_command(chat_id)
-                else:
-                    await bot.handle_message(chat_id, text)
-                    
-                logger.info(f"Successfully processed message: {text}")
-                
-            except Exception as handler_error:
-                logger.error(f"Error in message handler: {handler_error}")
-                # Try to send error message to user
-                try:
-                    await bot.send_message(chat_id, "Sorry, I encountered an error processing your message. Please try again.")
-                except:
-                    pass  # If we can't send error message, just log it
-        else:
-            logger.info("Message has no text content")
+        if LOG_PAYLOADS:
+            logger.info("Webhook update: %s", data)
         
+        await dispatch_update(data)
         return JSONResponse({"status": "ok"})
         
     except Exception as e:
-        logger.error(f"Webhook critical error: {e}")
-        logger.error(f"Error type: {type(e)}")
-        import traceback
-        logger.error(f"Full traceback: {traceback.format_exc()}")
+        logger.exception("Webhook critical error: %s", e)
         # Always return 200 OK to prevent Telegram from retrying
         return JSONResponse({"status": "error_logged"}, status_code=200)
 
@@ -505,34 +1018,132 @@ async def set_webhook(webhook_url: str = None):
     if not webhook_url:
         raise HTTPException(status_code=400, detail="Webhook URL not provided")
     
-    url = f"https://api.telegram.org/bot{bot.bot_token}/setWebhook"
+    url = f"/bot{bot.bot_token}/setWebhook"
     payload = {"url": f"{webhook_url}/webhook"}
     
-    async with httpx.AsyncClient() as client:
-        try:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            result = response.json()
-            logger.info(f"Webhook set successfully: {result}")
-            return result
-        except Exception as e:
-            logger.error(f"Error setting webhook: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+    try:
+        response = await bot.http.post('telegram', url, json=payload)
+        response.raise_for_status()
+        result = response.json()
+        logger.info(f"Webhook set successfully: {result}")
+        return result
+    except Exception as e:
+        logger.error(f"Error setting webhook: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/webhook_info")
 async def get_webhook_info():
     """Get current webhook information"""
-    url = f"https://api.telegram.org/bot{bot.bot_token}/getWebhookInfo"
+    url = f"/bot{bot.bot_token}/getWebhookInfo"
+    
+    try:
+        response = await bot.http.get('telegram', url)
+        response.raise_for_status()
+        return response.json()
+    except Exception as e:
+        logger.error(f"Error getting webhook info: {e}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def require_broadcast_token(request: Request):
+    """Broadcast routes need `Authorization: Bearer <BROADCAST_TOKEN>`; without a token configured they don't exist"""
+    token = os.getenv('BROADCAST_TOKEN')
+    if not token:
+        raise HTTPException(status_code=404, detail="Broadcasts are not enabled")
+    supplied = request.headers.get('authorization', '').removeprefix('Bearer ').strip()
+    if not hmac.compare_digest(supplied.encode(), token.encode()):
+        raise HTTPException(status_code=401, detail="Invalid broadcast token")
+
+@app.post("/broadcast")
+async def start_broadcast(request: Request):
+    """Send an announcement to every chat that has messaged the bot.
     
-    async with httpx.AsyncClient() as client:
+    Body: {"text": ..., "parse_mode": "HTML"} or {"document_url": ..., "caption": ...} or {"resume_pdf": true}
+    """
+    require_broadcast_token(request)
+    try:
+        body = await request.json()
+    except Exception:
+        raise HTTPException(status_code=400, detail="Body must be JSON")
+    if not isinstance(body, dict):
+        raise HTTPException(status_code=400, detail="Body must be a JSON object")
+    for key in ('text', 'document_url', 'caption', 'parse_mode'):
+        if body.get(key) is not None and not isinstance(body[key], str):
+            raise HTTPException(status_code=400, detail=f"{key} must be a string")
+    if body.get('resume_pdf'):
+        body = {'document_url': RESUME_URL, 'caption': body.get('caption') or "📄 Sai's resume has been updated!"}
+    message = {key: body[key] for key in ('text', 'document_url', 'caption', 'parse_mode') if body.get(key)}
+    if not message.get('text') and not message.get('document_url'):
+        raise HTTPException(status_code=400, detail="Provide text, document_url or resume_pdf")
+    try:
+        progress = broadcaster.start(message)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    logger.info(f"Broadcast {progress['id']} started for {progress['total']} chats")
+    return JSONResponse(progress, status_code=202)
+
+@app.get("/broadcast")
+async def broadcast_progress(request: Request):
+    """Counts, throughput and ETA of the current or last broadcast"""
+    require_broadcast_token(request)
+    return broadcaster.progress()
+
+@app.post("/broadcast/pause")
+async def pause_broadcast(request: Request):
+    """Stop the running broadcast; progress up to its last checkpoint is kept"""
+    require_broadcast_token(request)
+    return await broadcaster.pause()
+
+@app.post("/broadcast/resume")
+async def resume_broadcast(request: Request):
+    """Continue a paused or interrupted broadcast from its last checkpoint"""
+    require_broadcast_token(request)
+    try:
+        return JSONResponse(broadcaster.resume(), status_code=202)
+    except RuntimeError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except LookupError as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+async def run_polling():
+    """Long-polling ingress: no HTTP server, updates are pulled with getUpdates and run on the update queue"""
+    import signal
+    
+    await startup()
+    # Polled updates always go through the worker pool for bounded concurrency
+    await update_queue.start()
+    poll_task = asyncio.create_task(poller.run())
+    
+    def stop():
+        poller.stop()
+        poll_task.cancel()
+    
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            response = await client.get(url)
-            response.raise_for_status()
-            return response.json()
-        except Exception as e:
-            logger.error(f"Error getting webhook info: {e}")
-            raise HTTPException(status_code=500, detail=str(e))
+            loop.add_signal_handler(sig, stop)
+        except NotImplementedError:
+            pass  # Windows; Ctrl+C still cancels asyncio.run
+    
+    try:
+        await poll_task
+    except asyncio.CancelledError:
+        pass
+    finally:
+        await update_queue.drain()
+        await poller.confirm()
+        await shutdown()
+        logger.info(f"Long polling stopped, stats: {poller.stats()}")
 
 if __name__ == "__main__":
-    import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=6969)
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Sai's Telegram Bot")
+    parser.add_argument('--mode', choices=['webhook', 'polling'], default=os.getenv('INGRESS_MODE', 'webhook'),
+                        help="webhook: serve /webhook over HTTP; polling: pull updates with getUpdates")
+    args = parser.parse_args()
+    
+    if args.mode == 'polling':
+        asyncio.run(run_polling())
+    else:
+        import uvicorn
+        uvicorn.run(app, host="0.0.0.0", port=6969)
\ No newline at end of file
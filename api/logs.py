@@ -0,0 +1,175 @@
+import os
+import sys
+import json
+import queue
+import random
+import atexit
+import logging
+import contextvars
+from contextlib import contextmanager
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Iterator, Optional
+
+# Correlation ids for whatever update the current task is handling
+chat_id_var: contextvars.ContextVar = contextvars.ContextVar('chat_id', default=None)
+update_id_var: contextvars.ContextVar = contextvars.ContextVar('update_id', default=None)
+
+# Set LOG_PAYLOADS=1 to log raw update bodies and message text (they contain user content)
+LOG_PAYLOADS = os.getenv('LOG_PAYLOADS', '0') == '1'
+
+
+@contextmanager
+def log_context(update_id: Any = None, chat_id: Any = None) -> Iterator[None]:
+    """Tag every record logged inside the block (and tasks spawned from it) with these ids"""
+    tokens = []
+    if update_id is not None:
+        tokens.append((update_id_var, update_id_var.set(update_id)))
+    if chat_id is not None:
+        tokens.append((chat_id_var, chat_id_var.set(chat_id)))
+    try:
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
+
+
+class ContextFilter(logging.Filter):
+    """Stamps chat_id/update_id onto records; runs inside the logging call, so it sees the caller's context"""
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.chat_id = chat_id_var.get()
+        record.update_id = update_id_var.get()
+        return True
+
+
+class SamplingFilter(logging.Filter):
+    """Keeps a fraction of records per level; WARNING and above are always kept unless configured otherwise"""
+
+    def __init__(self, rates: Dict[int, float]):
+        super().__init__()
+        self.rates = rates
+        self.sampled_out = 0
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        rate = self.rates.get(record.levelno, 1.0)
+        if rate >= 1.0 or random.random() < rate:
+            return True
+        self.sampled_out += 1
+        return False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            'ts': round(record.created, 3),
+            'level': record.levelname,
+            'logger': record.name,
+            'msg': record.getMessage(),
+        }
+        chat_id = getattr(record, 'chat_id', None)
+        update_id = getattr(record, 'update_id', None)
+        if chat_id is not None:
+            entry['chat_id'] = chat_id
+        if update_id is not None:
+            entry['update_id'] = update_id
+        if record.exc_info or record.exc_text:
+            entry['exc'] = record.exc_text or self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class TextFormatter(logging.Formatter):
+    """Plain text with the correlation ids appended when present"""
+
+    def __init__(self):
+        super().__init__('%(asctime)s %(levelname)s %(name)s: %(message)s')
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = super().format(record)
+        ids = [f"{name}={getattr(record, name)}" for name in ('update_id', 'chat_id')
+               if getattr(record, name, None) is not None]
+        return f"{line} [{' '.join(ids)}]" if ids else line
+
+
+class LazyQueueHandler(QueueHandler):
+    """QueueHandler that leaves formatting to the listener thread and drops records when the queue is full"""
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # The stock prepare() formats the message here, on the event loop; the listener does it instead.
+        # Only the traceback is rendered up front, because the frames it points at won't outlive the call.
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional[LazyQueueHandler] = None
+_sampler: Optional[SamplingFilter] = None
+
+
+def setup_logging(level: str = None, fmt: str = None):
+    """Route all logging through a bounded queue to a background writer thread.
+
+    LOG_LEVEL, LOG_FORMAT (json|text), LOG_QUEUE_SIZE and LOG_SAMPLE_<LEVEL> (0..1) configure it.
+    """
+    global _listener, _queue_handler, _sampler
+    if _listener is not None:
+        return
+    level = (level or os.getenv('LOG_LEVEL', 'INFO')).upper()
+    fmt = fmt or os.getenv('LOG_FORMAT', 'json')
+
+    output = logging.StreamHandler(sys.stderr)
+    output.setFormatter(JsonFormatter() if fmt == 'json' else TextFormatter())
+
+    rates = {}
+    for name in ('DEBUG', 'INFO', 'WARNING', 'ERROR'):
+        rate = os.getenv(f'LOG_SAMPLE_{name}')
+        if rate is not None:
+            rates[logging.getLevelName(name)] = float(rate)
+    _sampler = SamplingFilter(rates)
+
+    log_queue: queue.Queue = queue.Queue(int(os.getenv('LOG_QUEUE_SIZE', '10000')))
+    _queue_handler = LazyQueueHandler(log_queue)
+    # Sample before stamping so dropped records cost as little as possible
+    _queue_handler.addFilter(_sampler)
+    _queue_handler.addFilter(ContextFilter())
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+    root.setLevel(level)
+    if root.level > logging.DEBUG:
+        # httpx logs every request at INFO, which is one line per Telegram/Tenor call
+        logging.getLogger('httpx').setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, output, respect_handler_level=True)
+    _listener.start()
+    atexit.register(stop_logging)
+
+
+def stop_logging():
+    """Flush queued records and stop the writer thread"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def logging_stats() -> Dict[str, int]:
+    return {
+        'queued': _queue_handler.queue.qsize() if _queue_handler else 0,
+        'dropped': _queue_handler.dropped if _queue_handler else 0,
+        'sampled_out': _sampler.sampled_out if _sampler else 0,
+    }
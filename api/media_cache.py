@@ -0,0 +1,153 @@
+import os
+import json
+import asyncio
+import logging
+import tempfile
+import threading
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def extract_file_id(result: Dict[str, Any], *kinds: str) -> Optional[str]:
+    """Pull the file_id out of a sendDocument/sendAnimation `result` message"""
+    for kind in kinds:
+        media = result.get(kind)
+        if isinstance(media, dict) and media.get('file_id'):
+            return media['file_id']
+    return None
+
+
+class MediaCache:
+    """Maps media source URLs to the Telegram file_id they were uploaded as, persisted to a small JSON file.
+
+    Changes are batched: the file is rewritten once, off the event loop, `flush_interval` seconds
+    after the first unsaved change, and on flush() at shutdown.
+
+    With a shared `state` (api.state) the mapping lives there instead, so one worker's upload
+    is reused by all of them; the local dict then only fronts it.
+    """
+
+    PREFIX = 'media:'
+
+    def __init__(self, path: str = None, max_entries: int = None, state=None, flush_interval: float = None):
+        self.state = state
+        if state is not None:
+            path = ''
+        self.path = path if path is not None else os.getenv('MEDIA_CACHE_PATH', '/tmp/sai_bot_media.json')
+        self.max_entries = max_entries or int(os.getenv('MEDIA_CACHE_MAX_ENTRIES', '5000'))
+        self.flush_interval = (flush_interval if flush_interval is not None
+                               else float(os.getenv('MEDIA_CACHE_FLUSH_INTERVAL', '5')))
+        self._file_ids: Dict[str, str] = {}
+        self._stats = {'hits': 0, 'misses': 0, 'stored': 0, 'invalidated': 0, 'saves': 0}
+        self._dirty = False
+        self._flush_task: Optional[asyncio.Task] = None
+        self._write_lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as file:
+                data = json.load(file)
+            if isinstance(data, dict):
+                self._file_ids = {str(url): str(file_id) for url, file_id in data.items()}
+                logger.info(f"Loaded {len(self._file_ids)} cached file_ids from {self.path}")
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            logger.error(f"Error loading media cache {self.path}: {e}")
+
+    def _write(self, file_ids: Dict[str, str]):
+        # Runs on a worker thread; the lock keeps an older snapshot from landing after a newer one
+        with self._write_lock:
+            try:
+                directory = os.path.dirname(os.path.abspath(self.path))
+                with tempfile.NamedTemporaryFile('w', encoding='utf-8', dir=directory, delete=False) as file:
+                    json.dump(file_ids, file)
+                os.replace(file.name, self.path)
+                self._stats['saves'] += 1
+            except Exception as e:
+                logger.error(f"Error saving media cache {self.path}: {e}")
+
+    def _changed(self):
+        if not self.path:
+            return
+        self._dirty = True
+        if self._flush_task is not None and not self._flush_task.done():
+            return  # already due; this change goes out with it
+        try:
+            self._flush_task = asyncio.get_running_loop().create_task(self._flush_later())
+        except RuntimeError:
+            self.flush()  # no event loop (a script); just write it
+
+    async def _flush_later(self):
+        # Loops so that changes made while a write is running get a write of their own
+        while self._dirty:
+            await asyncio.sleep(self.flush_interval)
+            self._dirty = False
+            await asyncio.to_thread(self._write, dict(self._file_ids))
+
+    def flush(self):
+        """Write unsaved changes now (at shutdown)"""
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        if self._dirty:
+            self._dirty = False
+            self._write(dict(self._file_ids))
+
+    def _shared_get(self, url: str) -> Optional[str]:
+        try:
+            file_id = self.state.get(self.PREFIX + url)
+        except Exception as e:
+            logger.error(f"State error reading media cache: {e}")
+            return None
+        if file_id:
+            self._file_ids[url] = file_id
+            self._trim()
+        return file_id
+
+    def _trim(self):
+        # Oldest entries go first once the store is full
+        while len(self._file_ids) > self.max_entries:
+            self._file_ids.pop(next(iter(self._file_ids)))
+
+    def get(self, url: str) -> Optional[str]:
+        file_id = self._file_ids.get(url)
+        if not file_id and self.state is not None:
+            file_id = self._shared_get(url)
+        if file_id:
+            self._stats['hits'] += 1
+        else:
+            self._stats['misses'] += 1
+        return file_id
+
+    def remember(self, url: str, file_id: Optional[str]):
+        if not file_id or self._file_ids.get(url) == file_id:
+            return
+        self._file_ids[url] = file_id
+        self._trim()
+        self._stats['stored'] += 1
+        if self.state is not None:
+            try:
+                self.state.set(self.PREFIX + url, file_id)
+            except Exception as e:
+                logger.error(f"State error writing media cache: {e}")
+        self._changed()
+
+    def forget(self, url: str):
+        if self._file_ids.pop(url, None) is not None:
+            self._stats['invalidated'] += 1
+            if self.state is not None:
+                try:
+                    self.state.delete(self.PREFIX + url)
+                except Exception as e:
+                    logger.error(f"State error writing media cache: {e}")
+            self._changed()
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats['entries'] = len(self._file_ids)
+        return stats
@@ -0,0 +1,170 @@
+import re
+import time
+import asyncio
+import functools
+from bisect import bisect_left
+from typing import Any, Callable, Dict, Iterator, List, Sequence, Tuple
+
+# Seconds; covers a classifier call (~15us) up to a slow Gemini reply
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_INVALID_NAME_RE = re.compile(r"[^a-zA-Z0-9_]")
+
+
+class Histogram:
+    """Fixed-bucket latency histogram; observe() is a bisect and three additions"""
+
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)  # the last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value: float):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative(self) -> Iterator[Tuple[str, int]]:
+        running = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            running += count
+            yield ('+Inf' if bound == float('inf') else repr(bound)), running
+
+
+class _Timer:
+    __slots__ = ('metrics', 'stage', 'started')
+
+    def __init__(self, metrics: 'Metrics', stage: str):
+        self.metrics = metrics
+        self.stage = stage
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.observe(self.stage, time.perf_counter() - self.started)
+        if exc_type is not None and not issubclass(exc_type, asyncio.CancelledError):
+            self.metrics.error(self.stage)
+        return False
+
+
+class Metrics:
+    """Per-stage latency histograms, error and event counters, and subsystem stats, in Prometheus text format"""
+
+    def __init__(self, namespace: str = 'sai_bot', buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.namespace = namespace
+        self.buckets = buckets
+        self._stages: Dict[str, Histogram] = {}
+        self._errors: Dict[str, int] = {}
+        self._events: Dict[str, int] = {}
+        self._collectors: List[Tuple[str, Callable[[], Dict[str, Any]]]] = []
+
+    def observe(self, stage: str, seconds: float):
+        histogram = self._stages.get(stage)
+        if histogram is None:
+            histogram = self._stages[stage] = Histogram(self.buckets)
+        histogram.observe(seconds)
+
+    def error(self, stage: str):
+        self._errors[stage] = self._errors.get(stage, 0) + 1
+
+    def event(self, name: str, amount: int = 1):
+        """Count something worth watching, e.g. a fallback taken or a cache hit"""
+        self._events[name] = self._events.get(name, 0) + amount
+
+    def timer(self, stage: str) -> _Timer:
+        """Context manager timing a block; an exception leaving it counts as an error for the stage"""
+        return _Timer(self, stage)
+
+    def timed(self, stage: str):
+        """Decorator form of timer() for plain and async functions"""
+        def decorator(fn):
+            if asyncio.iscoroutinefunction(fn):
+                @functools.wraps(fn)
+                async def async_wrapper(*args, **kwargs):
+                    with _Timer(self, stage):
+                        return await fn(*args, **kwargs)
+                return async_wrapper
+
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                with _Timer(self, stage):
+                    return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def collect(self, prefix: str, stats: Callable[[], Dict[str, Any]]):
+        """Export the numeric values of a subsystem's stats() as gauges named <namespace>_<prefix>_<key>"""
+        self._collectors.append((prefix, stats))
+
+    def render(self) -> str:
+        ns = self.namespace
+        lines = [
+            f"# HELP {ns}_stage_seconds Time spent in each stage of update handling",
+            f"# TYPE {ns}_stage_seconds histogram",
+        ]
+        for stage, histogram in sorted(self._stages.items()):
+            for bound, count in histogram.cumulative():
+                lines.append(f'{ns}_stage_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+            lines.append(f'{ns}_stage_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+            lines.append(f'{ns}_stage_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+        lines += [f"# HELP {ns}_stage_errors_total Stage calls that failed",
+                  f"# TYPE {ns}_stage_errors_total counter"]
+        lines += [f'{ns}_stage_errors_total{{stage="{stage}"}} {count}' for stage, count in sorted(self._errors.items())]
+
+        lines += [f"# HELP {ns}_events_total Fallbacks taken, cache hits and similar events",
+                  f"# TYPE {ns}_events_total counter"]
+        lines += [f'{ns}_events_total{{event="{event}"}} {count}' for event, count in sorted(self._events.items())]
+
+        for prefix, stats in self._collectors:
+            try:
+                values = stats()
+            except Exception:
+                continue
+            for key, value in _flatten(values):
+                name = _INVALID_NAME_RE.sub('_', f"{ns}_{prefix}_{key}")
+                lines.append(f"# TYPE {name} gauge")
+                lines.append(f"{name} {value}")
+        return '\n'.join(lines) + '\n'
+
+
+class LoopLagMonitor:
+    """Sleeps in a loop and records how late each wake-up is as the `event_loop_lag` stage"""
+
+    def __init__(self, registry: 'Metrics' = None):
+        self.registry = registry
+        self.max_lag = 0.0
+        self.samples = 0
+
+    async def run(self, interval: float):
+        registry = self.registry or metrics
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(interval)
+            lag = max(0.0, time.perf_counter() - started - interval)
+            registry.observe('event_loop_lag', lag)
+            self.max_lag = max(self.max_lag, lag)
+            self.samples += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {'lag_samples': self.samples, 'max_lag_seconds': self.max_lag}
+
+
+def _flatten(values: Dict[str, Any], path: str = '') -> Iterator[Tuple[str, float]]:
+    for key, value in values.items():
+        name = f"{path}_{key}" if path else str(key)
+        if isinstance(value, dict):
+            yield from _flatten(value, name)
+        elif isinstance(value, bool):
+            yield name, int(value)
+        elif isinstance(value, (int, float)):
+            yield name, value
+
+
+# Shared by the bot, the update pipeline and the /metrics route
+metrics = Metrics()
@@ -0,0 +1,113 @@
+import os
+import time
+import asyncio
+import logging
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from api.http_client import HttpClientPool
+from api.send_scheduler import retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+# getUpdates returns at most this many updates per call
+TELEGRAM_MAX_BATCH = 100
+
+
+class UpdatePoller:
+    """Long-polls getUpdates and hands every update to `dispatch`, confirming them through the offset"""
+
+    def __init__(self, http: HttpClientPool, bot_token: str, dispatch: Callable[[Dict[str, Any]], Awaitable[Any]],
+                 limit: int = None, timeout: int = None, allowed_updates: List[str] = None):
+        self.http = http
+        self.url = f"/bot{bot_token}/getUpdates"
+        self.delete_webhook_url = f"/bot{bot_token}/deleteWebhook"
+        self.dispatch = dispatch
+        limit = limit or int(os.getenv('POLL_LIMIT', str(TELEGRAM_MAX_BATCH)))
+        self.limit = max(1, min(limit, TELEGRAM_MAX_BATCH))
+        self.timeout = timeout if timeout is not None else int(os.getenv('POLL_TIMEOUT', '30'))
+        self.allowed_updates = allowed_updates
+        self.max_backoff = float(os.getenv('POLL_MAX_BACKOFF', '30'))
+        self.offset: Optional[int] = None
+        self._stopping = False
+        self._stats = {'polls': 0, 'empty_polls': 0, 'updates': 0, 'errors': 0, 'max_batch': 0,
+                       'dispatch_seconds': 0.0}
+
+    async def _get_updates(self, timeout: int, limit: int):
+        payload: Dict[str, Any] = {'timeout': timeout, 'limit': limit}
+        if self.offset is not None:
+            payload['offset'] = self.offset
+        if self.allowed_updates is not None:
+            payload['allowed_updates'] = self.allowed_updates
+        # The request stays open for up to `timeout` seconds, so give the client some slack on top
+        return await self.http.post('telegram', self.url, json=payload, timeout=timeout + 10)
+
+    async def delete_webhook(self):
+        """getUpdates is refused (409) while a webhook is set; pending updates are kept"""
+        response = await self.http.post('telegram', self.delete_webhook_url, json={'drop_pending_updates': False})
+        response.raise_for_status()
+        logger.info("Webhook removed for long polling")
+
+    async def run(self):
+        """Poll until stop() is called"""
+        self._stopping = False
+        backoff = 1.0
+        logger.info(f"Long polling started (limit {self.limit}, timeout {self.timeout}s)")
+        while not self._stopping:
+            try:
+                response = await self._get_updates(self.timeout, self.limit)
+                if response.status_code == 409:
+                    logger.warning("getUpdates conflicts with an active webhook, removing it")
+                    await self.delete_webhook()
+                    continue
+                if response.status_code == 429:
+                    retry_after = retry_after_seconds(response)
+                    logger.warning(f"getUpdates rate limited, retry after {retry_after}s")
+                    await asyncio.sleep(retry_after)
+                    continue
+                response.raise_for_status()
+                updates = response.json().get('result') or []
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._stats['errors'] += 1
+                logger.error(f"getUpdates failed, retrying in {backoff:.0f}s: {e}")
+                await asyncio.sleep(backoff)
+                backoff = min(backoff * 2, self.max_backoff)
+                continue
+
+            backoff = 1.0
+            self._stats['polls'] += 1
+            if not updates:
+                self._stats['empty_polls'] += 1
+                continue
+            self._stats['max_batch'] = max(self._stats['max_batch'], len(updates))
+
+            started = time.perf_counter()
+            for update in updates:
+                # Advance first: a failing update must not be fetched again forever
+                self.offset = update['update_id'] + 1
+                try:
+                    await self.dispatch(update)
+                except Exception as e:
+                    self._stats['errors'] += 1
+                    logger.error(f"Failed to dispatch update {update.get('update_id')}: {e}")
+            self._stats['updates'] += len(updates)
+            self._stats['dispatch_seconds'] += time.perf_counter() - started
+
+    async def confirm(self):
+        """Tell Telegram everything below the current offset is handled, so a restart doesn't replay it"""
+        if self.offset is None:
+            return
+        try:
+            response = await self._get_updates(0, 1)
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Could not confirm update offset {self.offset}: {e}")
+
+    def stop(self):
+        self._stopping = True
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats['offset'] = self.offset
+        return stats
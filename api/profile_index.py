@@ -0,0 +1,122 @@
+import os
+import re
+import math
+from collections import Counter
+from typing import Dict, List, Tuple
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:\.[a-z0-9]+)*")
+STOPWORDS = frozenset("""
+a an and are as at be by can do does for from has have he her his how i in is it its me my of on or
+she so tell that the their them they this to was what when where which who why will with you your
+about know
+""".split())
+# Nearly every question names Sai, so his name says nothing about which section is relevant
+SUBJECT_NAMES = frozenset(['sai', 'mahendra', 'bejawada'])
+
+
+def _stem(token: str) -> str:
+    # Just enough folding to match "project"/"projects" and "skill"/"skills"
+    if len(token) > 3 and token.endswith('s') and not token.endswith('ss'):
+        return token[:-1]
+    return token
+
+
+def tokenize(text: str) -> List[str]:
+    return [_stem(token) for token in TOKEN_RE.findall(text.lower())
+            if token not in STOPWORDS and token not in SUBJECT_NAMES]
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (~4 characters per token), good enough for budgeting"""
+    return (len(text) + 3) // 4
+
+
+class Section:
+    __slots__ = ('title', 'text', 'tokens', 'length', 'term_freqs')
+
+    def __init__(self, title: str, body: str):
+        self.title = title
+        self.text = f"{title}\n{body}".strip() if body else title
+        self.tokens = estimate_tokens(self.text)
+        # Title words count twice so "projects" finds the Projects section first
+        terms = tokenize(title) * 2 + tokenize(body)
+        self.length = len(terms)
+        self.term_freqs = Counter(terms)
+
+
+def split_sections(text: str) -> List[Section]:
+    """Split the profile on its `##` headings; a bare heading line before them is folded into the first section"""
+    chunks = []
+    title, body = None, []
+    for line in text.splitlines():
+        if line.startswith('##'):
+            if title is not None or any(part.strip() for part in body):
+                chunks.append((title or '', '\n'.join(body).strip()))
+            title, body = line.lstrip('#').strip(), []
+        elif title is None and not body and line.strip():
+            title = line.strip()
+        else:
+            body.append(line)
+    if title is not None or any(part.strip() for part in body):
+        chunks.append((title or '', '\n'.join(body).strip()))
+
+    if len(chunks) > 1 and not chunks[0][1]:
+        # e.g. "Bejawada Sai Mahendra - Profile" on its own above "## Introduction & Summary"
+        preamble = chunks.pop(0)[0]
+        chunks[0] = (f"{preamble}\n{chunks[0][0]}", chunks[0][1])
+    return [Section(title, body) for title, body in chunks]
+
+
+class ProfileIndex:
+    """BM25 index over the `##` sections of re.txt, used to pick prompt context per message"""
+
+    K1 = 1.5
+    B = 0.75
+
+    def __init__(self, text: str, top_k: int = None, token_budget: int = None):
+        self.top_k = top_k or int(os.getenv('PROFILE_TOP_K', '3'))
+        self.token_budget = token_budget or int(os.getenv('PROFILE_TOKEN_BUDGET', '600'))
+        self.sections = split_sections(text)
+        count = len(self.sections) or 1
+        self.avg_length = sum(section.length for section in self.sections) / count or 1.0
+        doc_freqs = Counter(term for section in self.sections for term in section.term_freqs)
+        self.idf = {term: math.log(1 + (count - df + 0.5) / (df + 0.5)) for term, df in doc_freqs.items()}
+
+    def search(self, query: str) -> List[Tuple[float, Section]]:
+        """Sections matching `query`, best first"""
+        terms = set(tokenize(query))
+        scored = []
+        for section in self.sections:
+            score = 0.0
+            norm = self.K1 * (1 - self.B + self.B * section.length / self.avg_length)
+            for term in terms:
+                freq = section.term_freqs.get(term)
+                if freq:
+                    score += self.idf[term] * freq * (self.K1 + 1) / (freq + norm)
+            if score > 0:
+                scored.append((score, section))
+        scored.sort(key=lambda item: item[0], reverse=True)
+        return scored
+
+    def select(self, query: str) -> List[Section]:
+        """Top-k relevant sections that fit the token budget (the opening section when nothing matches)"""
+        selected, used = [], 0
+        for _, section in self.search(query)[:self.top_k]:
+            if used + section.tokens > self.token_budget:
+                continue
+            selected.append(section)
+            used += section.tokens
+        if not selected and self.sections:
+            selected.append(self.sections[0])
+        return selected
+
+    def context_for(self, query: str) -> str:
+        return '\n\n'.join(section.text for section in self.select(query))
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            'sections': len(self.sections),
+            'profile_tokens': sum(section.tokens for section in self.sections),
+            'top_k': self.top_k,
+            'token_budget': self.token_budget,
+        }
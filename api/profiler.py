@@ -0,0 +1,90 @@
+import os
+import sys
+import time
+import random
+import logging
+import threading
+from collections import Counter
+from contextlib import contextmanager
+from typing import Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class SamplingProfiler:
+    """Stdlib stack sampler for individual updates, enabled with PROFILE_SAMPLE_RATE.
+
+    A background thread snapshots every thread's stack (the event loop and the Gemini
+    workers) at a fixed interval while a profiled update runs, and writes the result in
+    collapsed-stack format for flamegraph tools. Other updates handled concurrently on the
+    loop show up too, so profile under light load for clean numbers. One session at a time.
+    """
+
+    def __init__(self, sample_rate: float = None, interval: float = None, output_dir: str = None, top: int = 5):
+        self.sample_rate = sample_rate if sample_rate is not None else float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+        self.interval = interval or float(os.getenv('PROFILE_INTERVAL', '0.005'))
+        self.output_dir = output_dir or os.getenv('PROFILE_DIR', '/tmp/sai_bot_profiles')
+        self.top = top
+        self._active = threading.Lock()
+        self.sessions = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.sample_rate > 0
+
+    @contextmanager
+    def session(self, label: str) -> Iterator[None]:
+        """Profile the enclosed block if this request is sampled; otherwise a no-op"""
+        if not self.enabled or random.random() >= self.sample_rate or not self._active.acquire(blocking=False):
+            yield
+            return
+        samples: Counter = Counter()
+        stop = threading.Event()
+        sampler = threading.Thread(target=self._sample, args=(samples, stop), name='profiler', daemon=True)
+        started = time.perf_counter()
+        sampler.start()
+        try:
+            yield
+        finally:
+            stop.set()
+            sampler.join()
+            self._active.release()
+            self.sessions += 1
+            self._report(label, samples, time.perf_counter() - started)
+
+    def _sample(self, samples: Counter, stop: threading.Event):
+        me = threading.get_ident()
+        names = {}
+        while not stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == me:
+                    continue
+                if thread_id not in names:
+                    names = {t.ident: t.name for t in threading.enumerate()}
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                stack.append(names.get(thread_id, str(thread_id)))
+                samples[';'.join(reversed(stack))] += 1
+
+    def _report(self, label: str, samples: Counter, elapsed: float):
+        if not samples:
+            return
+        path: Optional[str] = None
+        try:
+            os.makedirs(self.output_dir, exist_ok=True)
+            path = os.path.join(self.output_dir, f"{label}-{int(time.time() * 1000)}.folded")
+            with open(path, 'w') as f:
+                for stack, count in samples.most_common():
+                    f.write(f"{stack} {count}\n")
+        except OSError as e:
+            logger.warning(f"Could not write profile for {label}: {e}")
+
+        leaves: Dict[str, int] = Counter()
+        for stack, count in samples.items():
+            leaves[stack.rsplit(';', 1)[-1]] += count
+        total = sum(samples.values())
+        hottest = ", ".join(f"{leaf} {count * 100 // total}%" for leaf, count in leaves.most_common(self.top))
+        logger.info(f"Profiled {label} in {elapsed:.3f}s ({total} samples, written to {path}): {hottest}")
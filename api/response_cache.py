@@ -0,0 +1,74 @@
+import os
+import re
+import time
+import random
+import hashlib
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+_PUNCTUATION_RE = re.compile(r"[^\w\s]")
+_WHITESPACE_RE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """Fold case, punctuation and spacing so "Who is Sai?" and "who is sai" share a key"""
+    return _WHITESPACE_RE.sub(' ', _PUNCTUATION_RE.sub(' ', text.lower())).strip()
+
+
+def content_hash(text: str) -> str:
+    return hashlib.sha1(text.encode('utf-8')).hexdigest()[:16]
+
+
+class ResponseCache:
+    """TTL + LRU cache of Gemini replies, keeping a few variants per prompt so answers don't feel canned"""
+
+    def __init__(self, ttl: float = None, max_keys: int = None, variants: int = None):
+        self.ttl = ttl or float(os.getenv('RESPONSE_CACHE_TTL', '21600'))
+        self.max_keys = max_keys or int(os.getenv('RESPONSE_CACHE_MAX_KEYS', '1000'))
+        self.variants = variants or int(os.getenv('RESPONSE_CACHE_VARIANTS', '3'))
+        self._entries: 'OrderedDict[str, Tuple[float, List[str]]]' = OrderedDict()
+        self._stats = {'hits': 0, 'misses': 0, 'expired': 0, 'evictions': 0, 'invalidations': 0}
+
+    @staticmethod
+    def key(prompt_text: str, profile_hash: str) -> str:
+        return f"{profile_hash}:{normalize_prompt(prompt_text)}"
+
+    def get(self, key: str) -> Optional[str]:
+        """A cached reply, once the key has collected its full set of variants"""
+        entry = self._entries.get(key)
+        if entry is not None and time.monotonic() - entry[0] > self.ttl:
+            del self._entries[key]
+            self._stats['expired'] += 1
+            entry = None
+        if entry is None or len(entry[1]) < self.variants:
+            self._stats['misses'] += 1
+            return None
+        self._entries.move_to_end(key)
+        self._stats['hits'] += 1
+        return random.choice(entry[1])
+
+    def fallback(self, key: str) -> Optional[str]:
+        """Any stored reply for the key, however few variants it has; for when Gemini can't be reached"""
+        entry = self._entries.get(key)
+        return random.choice(entry[1]) if entry is not None else None
+
+    def put(self, key: str, response: str):
+        entry = self._entries.get(key)
+        if entry is None:
+            self._entries[key] = (time.monotonic(), [response])
+        elif len(entry[1]) < self.variants:
+            entry[1].append(response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_keys:
+            self._entries.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def clear(self):
+        if self._entries:
+            self._entries.clear()
+            self._stats['invalidations'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        stats = dict(self._stats)
+        stats['keys'] = len(self._entries)
+        return stats
@@ -0,0 +1,227 @@
+import os
+import time
+import heapq
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+import httpx
+
+logger = logging.getLogger(__name__)
+
+# Priority lanes: lower goes first when the global budget is contended
+PRIORITY_TEXT = 0
+PRIORITY_MEDIA = 1
+PRIORITY_DECORATIVE = 2
+PRIORITY_BULK = 3  # broadcasts: only what interactive traffic leaves over
+LANE_NAMES = {PRIORITY_TEXT: 'text', PRIORITY_MEDIA: 'media', PRIORITY_DECORATIVE: 'decorative', PRIORITY_BULK: 'bulk'}
+
+
+class TokenBucket:
+    """Classic token bucket; `reserve()` takes a token now and says how long to wait before using it"""
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self) -> float:
+        """Seconds until a whole token is available"""
+        self._refill(time.monotonic())
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+    def reserve(self) -> float:
+        self._refill(time.monotonic())
+        self.tokens -= 1
+        return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+    def idle(self) -> bool:
+        self._refill(time.monotonic())
+        return self.tokens >= self.burst
+
+
+def retry_after_seconds(response: httpx.Response) -> float:
+    """Telegram puts the flood-control delay in parameters.retry_after (and usually the Retry-After header)"""
+    try:
+        retry_after = (response.json().get('parameters') or {}).get('retry_after')
+        if retry_after is not None:
+            return float(retry_after)
+    except Exception:
+        pass
+    try:
+        return float(response.headers.get('retry-after', 1))
+    except ValueError:
+        return 1.0
+
+
+class SharedBudget:
+    """Global sends-per-second budget counted in the shared state layer, so every worker draws from one pool.
+
+    A fixed one-second window: each send increments that second's counter, and a sender over
+    the limit sleeps until the next window.
+    """
+
+    PREFIX = 'tg:sends:'
+
+    def __init__(self, state, rate: float):
+        self.state = state
+        self.rate = rate
+        self.waits = 0
+
+    async def acquire(self):
+        while True:
+            now = time.time()
+            window = int(now)
+            try:
+                used = self.state.incr(f"{self.PREFIX}{window}", ttl=5)
+            except Exception as e:
+                # Fail open: the local bucket still applies
+                logger.error(f"Shared send budget unavailable: {e}")
+                return
+            if used <= self.rate:
+                return
+            self.waits += 1
+            await asyncio.sleep(window + 1 - now)
+
+
+class SendScheduler:
+    """Paces outbound Bot API calls under global and per-chat budgets, retrying on 429 retry_after"""
+
+    def __init__(self, global_rate: float = None, chat_rate: float = None, chat_burst: float = None,
+                 max_retries: int = None, max_retry_after: float = None, max_chats: int = 10000, state=None):
+        global_rate = global_rate or float(os.getenv('TELEGRAM_GLOBAL_RATE', '30'))
+        self.chat_rate = chat_rate or float(os.getenv('TELEGRAM_CHAT_RATE', '1'))
+        self.chat_burst = chat_burst or float(os.getenv('TELEGRAM_CHAT_BURST', '3'))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv('TELEGRAM_MAX_RETRIES', '3'))
+        self.max_retry_after = max_retry_after or float(os.getenv('TELEGRAM_MAX_RETRY_AFTER', '30'))
+        # How long a lane may wait for the global budget before its send is dropped (None = no limit)
+        self.lane_deadlines = {
+            PRIORITY_TEXT: None,
+            PRIORITY_MEDIA: None,
+            PRIORITY_DECORATIVE: float(os.getenv('TELEGRAM_DECORATIVE_MAX_WAIT', '3')),
+            PRIORITY_BULK: None,
+        }
+        self.max_chats = max_chats
+        self._global = TokenBucket(global_rate, global_rate)
+        # Only worth the extra round trip when other processes see the same counters
+        self._shared = SharedBudget(state, global_rate) if state is not None and state.shared else None
+        self._chats: 'OrderedDict[Hashable, TokenBucket]' = OrderedDict()
+        self._paused_until: Dict[Hashable, float] = {}
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._seq = itertools.count()
+        self._pacer: Optional[asyncio.Task] = None
+        self._stats = {
+            'sent': 0, 'rate_limited': 0, 'retries': 0, 'dropped': 0,
+            'queue_wait_seconds': 0.0, 'max_queue_wait_seconds': 0.0,
+        }
+        self._lane_stats = {name: {'sent': 0, 'dropped': 0} for name in LANE_NAMES.values()}
+
+    def _chat_bucket(self, chat_id: Hashable) -> TokenBucket:
+        bucket = self._chats.get(chat_id)
+        if bucket is None:
+            bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+            # Forget the least recently used chats, but never one that is still mid-burst
+            while len(self._chats) > self.max_chats:
+                oldest_id, oldest = next(iter(self._chats.items()))
+                if not oldest.idle():
+                    break
+                del self._chats[oldest_id]
+        else:
+            self._chats.move_to_end(chat_id)
+        return bucket
+
+    async def _chat_gate(self, chat_id: Hashable):
+        delay = self._chat_bucket(chat_id).reserve()
+        paused = self._paused_until.get(chat_id, 0.0) - time.monotonic()
+        if paused <= 0:
+            self._paused_until.pop(chat_id, None)
+        delay = max(delay, paused)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def _global_gate(self, priority: int):
+        if not self._waiters and self._global.delay() == 0:
+            self._global.take()
+            return
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._seq), future))
+        if self._pacer is None or self._pacer.done():
+            self._pacer = asyncio.create_task(self._pace())
+        await future
+
+    async def _pace(self):
+        """Hand out global tokens to waiters in priority order"""
+        while self._waiters:
+            delay = self._global.delay()
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            _, _, future = heapq.heappop(self._waiters)
+            if future.done():
+                continue  # the sender gave up (deadline passed)
+            self._global.take()
+            future.set_result(None)
+
+    async def run(self, chat_id: Hashable, send: Callable[[], Awaitable[httpx.Response]],
+                  priority: int = PRIORITY_TEXT) -> Optional[httpx.Response]:
+        """Send through the budgets; returns the last response, or None if the send was dropped"""
+        lane = LANE_NAMES.get(priority, 'text')
+        deadline = self.lane_deadlines.get(priority)
+        stats = self._stats
+        response = None
+        for attempt in range(self.max_retries + 1):
+            queued_at = time.perf_counter()
+            try:
+                await asyncio.wait_for(self._admit(chat_id, priority), deadline)
+            except asyncio.TimeoutError:
+                stats['dropped'] += 1
+                self._lane_stats[lane]['dropped'] += 1
+                logger.warning(f"Dropped {lane} send to chat {chat_id} after waiting {deadline}s for budget")
+                return None
+            waited = time.perf_counter() - queued_at
+            stats['queue_wait_seconds'] += waited
+            stats['max_queue_wait_seconds'] = max(stats['max_queue_wait_seconds'], waited)
+
+            response = await send()
+            if response.status_code != 429:
+                stats['sent'] += 1
+                self._lane_stats[lane]['sent'] += 1
+                return response
+
+            stats['rate_limited'] += 1
+            retry_after = retry_after_seconds(response)
+            logger.warning(f"Telegram rate limited chat {chat_id}, retry after {retry_after}s")
+            if retry_after > self.max_retry_after or attempt == self.max_retries:
+                break
+            self._paused_until[chat_id] = time.monotonic() + retry_after
+            stats['retries'] += 1
+
+        stats['dropped'] += 1
+        self._lane_stats[lane]['dropped'] += 1
+        return response
+
+    async def _admit(self, chat_id: Hashable, priority: int):
+        await self._chat_gate(chat_id)
+        await self._global_gate(priority)
+        if self._shared is not None:
+            await self._shared.acquire()
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        waiting = sum(1 for _, _, future in self._waiters if not future.done())
+        stats.update(waiting=waiting, chats=len(self._chats), lanes=self._lane_stats)
+        if self._shared is not None:
+            stats['shared_budget_waits'] = self._shared.waits
+        return stats
@@ -0,0 +1,222 @@
+import os
+import json
+import time
+import sqlite3
+import logging
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryState:
+    """Key/value state for a single process: get/set/add/incr/delete with per-key TTL"""
+
+    SWEEP_EVERY = 1024
+    # Visible to this process only
+    shared = False
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self._data: 'OrderedDict[str, Tuple[Any, Optional[float]]]' = OrderedDict()  # key -> (value, expires_at)
+        self._writes = 0
+        self._stats = {'gets': 0, 'sets': 0, 'adds': 0, 'incrs': 0, 'deletes': 0, 'expired': 0, 'evictions': 0}
+
+    def _live(self, key: str, now: float) -> Optional[Tuple[Any, Optional[float]]]:
+        entry = self._data.get(key)
+        if entry is not None and entry[1] is not None and entry[1] <= now:
+            del self._data[key]
+            self._stats['expired'] += 1
+            return None
+        return entry
+
+    def _write(self, key: str, value: Any, expires_at: Optional[float]):
+        self._data[key] = (value, expires_at)
+        self._data.move_to_end(key)
+        self._writes += 1
+        if self._writes % self.SWEEP_EVERY == 0:
+            now = time.time()
+            for stale in [k for k, (_, exp) in self._data.items() if exp is not None and exp <= now]:
+                del self._data[stale]
+                self._stats['expired'] += 1
+        while len(self._data) > self.max_keys:
+            self._data.popitem(last=False)
+            self._stats['evictions'] += 1
+
+    def get(self, key: str) -> Any:
+        self._stats['gets'] += 1
+        entry = self._live(key, time.time())
+        return entry[0] if entry is not None else None
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        self._stats['sets'] += 1
+        self._write(key, value, time.time() + ttl if ttl else None)
+
+    def add(self, key: str, value: Any, ttl: float = None) -> bool:
+        """Set `key` only if it is absent (or expired); True if this call set it"""
+        self._stats['adds'] += 1
+        now = time.time()
+        if self._live(key, now) is not None:
+            return False
+        self._write(key, value, now + ttl if ttl else None)
+        return True
+
+    def incr(self, key: str, amount: int = 1, ttl: float = None) -> int:
+        """Add `amount` to an integer counter and return the new value; `ttl` applies when the counter is created"""
+        self._stats['incrs'] += 1
+        now = time.time()
+        entry = self._live(key, now)
+        if entry is None:
+            value, expires_at = amount, (now + ttl if ttl else None)
+        else:
+            value, expires_at = int(entry[0]) + amount, entry[1]
+        self._write(key, value, expires_at)
+        return value
+
+    def delete(self, key: str):
+        self._stats['deletes'] += 1
+        self._data.pop(key, None)
+
+    def count(self, prefix: str = '') -> int:
+        """Live keys starting with `prefix`; a scan, meant for stats"""
+        now = time.time()
+        return sum(1 for key, (_, exp) in self._data.items()
+                   if key.startswith(prefix) and (exp is None or exp > now))
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update(backend='memory', keys=len(self._data))
+        return stats
+
+
+class SqliteState:
+    """The same operations on a local SQLite file in WAL mode, shared by every worker process on the host.
+
+    Each operation is a single statement, so get/set/add/incr are atomic across processes.
+    Values are stored as JSON.
+    """
+
+    PRUNE_EVERY = 1024
+    # Visible to every process that opens the same file
+    shared = True
+
+    def __init__(self, path: str, max_keys: int = 100000):
+        self.path = path
+        self.max_keys = max_keys
+        self._lock = threading.Lock()
+        self._writes = 0
+        self._stats = {'gets': 0, 'sets': 0, 'adds': 0, 'incrs': 0, 'deletes': 0, 'pruned': 0}
+        self._conn = sqlite3.connect(path, timeout=5.0, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS state "
+            "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, updated_at REAL NOT NULL)"
+        )
+
+    def _wrote(self, now: float):
+        self._writes += 1
+        if self._writes % self.PRUNE_EVERY == 0:
+            before = self._conn.total_changes
+            self._conn.execute("DELETE FROM state WHERE expires_at IS NOT NULL AND expires_at <= ?", (now,))
+            self._conn.execute(
+                "DELETE FROM state WHERE key NOT IN (SELECT key FROM state ORDER BY updated_at DESC LIMIT ?)",
+                (self.max_keys,)
+            )
+            self._stats['pruned'] += self._conn.total_changes - before
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            self._stats['gets'] += 1
+            row = self._conn.execute(
+                "SELECT value FROM state WHERE key = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (key, time.time())
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def set(self, key: str, value: Any, ttl: float = None):
+        now = time.time()
+        with self._lock:
+            self._stats['sets'] += 1
+            self._conn.execute(
+                "INSERT INTO state (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at, "
+                "updated_at = excluded.updated_at",
+                (key, json.dumps(value), now + ttl if ttl else None, now)
+            )
+            self._wrote(now)
+
+    def add(self, key: str, value: Any, ttl: float = None) -> bool:
+        """Set `key` only if it is absent (or expired); True if this call set it"""
+        now = time.time()
+        with self._lock:
+            self._stats['adds'] += 1
+            cursor = self._conn.execute(
+                "INSERT INTO state (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET value = excluded.value, expires_at = excluded.expires_at, "
+                "updated_at = excluded.updated_at "
+                "WHERE state.expires_at IS NOT NULL AND state.expires_at <= ?",
+                (key, json.dumps(value), now + ttl if ttl else None, now, now)
+            )
+            added = cursor.rowcount > 0
+            if added:
+                self._wrote(now)
+            return added
+
+    def incr(self, key: str, amount: int = 1, ttl: float = None) -> int:
+        """Add `amount` to an integer counter and return the new value; `ttl` applies when the counter is created"""
+        now = time.time()
+        with self._lock:
+            self._stats['incrs'] += 1
+            row = self._conn.execute(
+                "INSERT INTO state (key, value, expires_at, updated_at) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(key) DO UPDATE SET "
+                "value = CASE WHEN state.expires_at IS NOT NULL AND state.expires_at <= ? "
+                "THEN excluded.value ELSE CAST(state.value AS INTEGER) + ? END, "
+                "expires_at = CASE WHEN state.expires_at IS NOT NULL AND state.expires_at <= ? "
+                "THEN excluded.expires_at ELSE state.expires_at END, "
+                "updated_at = excluded.updated_at "
+                "RETURNING value",
+                (key, str(amount), now + ttl if ttl else None, now, now, amount, now)
+            ).fetchone()
+            self._wrote(now)
+        return int(row[0])
+
+    def delete(self, key: str):
+        with self._lock:
+            self._stats['deletes'] += 1
+            self._conn.execute("DELETE FROM state WHERE key = ?", (key,))
+
+    def count(self, prefix: str = '') -> int:
+        """Live keys starting with `prefix`"""
+        with self._lock:
+            return self._conn.execute(
+                "SELECT COUNT(*) FROM state WHERE substr(key, 1, ?) = ? AND (expires_at IS NULL OR expires_at > ?)",
+                (len(prefix), prefix, time.time())
+            ).fetchone()[0]
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM state").fetchone()[0]
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update(backend='sqlite', path=self.path)
+        return stats
+
+
+def state_from_env():
+    """STATE_BACKEND=memory (default) or sqlite (STATE_PATH), the latter shared by all workers on the host"""
+    backend = os.getenv('STATE_BACKEND', 'memory')
+    max_keys = int(os.getenv('STATE_MAX_KEYS', '100000'))
+    if backend == 'sqlite':
+        path = os.getenv('STATE_PATH', '/tmp/sai_bot_state.sqlite3')
+        try:
+            return SqliteState(path, max_keys=max_keys)
+        except sqlite3.Error as e:
+            logger.error(f"Could not open state database {path}, falling back to memory: {e}")
+    return MemoryState(max_keys=max_keys)
@@ -0,0 +1,120 @@
+import os
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+TELEGRAM_TEXT_LIMIT = 4096
+
+
+def split_point(text: str, limit: int) -> int:
+    """Where to cut `text` so the first part fits in `limit`, preferring a paragraph, line or word break"""
+    if len(text) <= limit:
+        return len(text)
+    for separator in ('\n\n', '\n', ' '):
+        cut = text.rfind(separator, limit // 2, limit)
+        if cut != -1:
+            return cut + len(separator)
+    return limit
+
+
+class StreamingReply:
+    """Turns a stream of text chunks into one or more Telegram messages that grow via editMessageText"""
+
+    def __init__(self, chat_id: int,
+                 send: Callable[..., Awaitable[Optional[Dict[str, Any]]]],
+                 edit: Callable[..., Awaitable[Optional[Dict[str, Any]]]],
+                 min_interval: float = None, min_delta: int = None, limit: int = TELEGRAM_TEXT_LIMIT,
+                 before_send: Callable[[], Awaitable[None]] = None):
+        self.chat_id = chat_id
+        self.send = send
+        self.edit = edit
+        self.before_send = before_send  # awaited once, right before the first message goes out
+        self.min_interval = min_interval if min_interval is not None else float(os.getenv('STREAM_EDIT_INTERVAL', '1.0'))
+        self.min_delta = min_delta if min_delta is not None else int(os.getenv('STREAM_MIN_DELTA', '40'))
+        self.limit = limit
+        self.text = ''
+        self.message_ids: List[int] = []
+        self.edits = 0
+        self._current_id: Optional[int] = None  # message showing the current segment, once sent
+        self._offset = 0  # where the current (last) message starts in self.text
+        self._shown = 0   # how much of the current message Telegram is already displaying
+        self._last_flush = 0.0
+
+    @property
+    def current(self) -> str:
+        return self.text[self._offset:]
+
+    async def ready(self):
+        """Run the before_send hook if it hasn't run yet"""
+        hook, self.before_send = self.before_send, None
+        if hook is not None:
+            await hook()
+
+    async def _send_new(self, text: str) -> bool:
+        await self.ready()
+        result = await self.send(self.chat_id, text, parse_mode=None)
+        message_id = ((result or {}).get('result') or {}).get('message_id')
+        if message_id is None:
+            return False
+        self.message_ids.append(message_id)
+        self._current_id = message_id
+        self._shown = len(text)
+        return True
+
+    async def _edit_current(self, text: str, parse_mode: str = None) -> bool:
+        result = await self.edit(self.chat_id, self._current_id, text, parse_mode=parse_mode)
+        if result is None:
+            return False
+        self.edits += 1
+        self._shown = len(text)
+        return True
+
+    async def _roll_over(self):
+        """Close the current message at a clean break and move the remainder into new ones"""
+        while len(self.current) > self.limit:
+            cut = split_point(self.current, self.limit)
+            head = self.current[:cut]
+            if self._current_id is not None:
+                await self._edit_current(head)
+            else:
+                await self._send_new(head)
+            self._offset += cut
+            self._current_id = None
+            self._shown = 0
+        if self.current.strip():
+            await self._send_new(self.current)
+
+    async def feed(self, chunk: str):
+        """Add a chunk; the first one is sent right away, later ones are coalesced into rate-limited edits"""
+        if not chunk:
+            return
+        self.text += chunk
+        if len(self.current) > self.limit:
+            await self._roll_over()
+            self._last_flush = time.monotonic()
+            return
+
+        if self._current_id is None:
+            if self.current.strip() and await self._send_new(self.current):
+                self._last_flush = time.monotonic()
+            return
+
+        now = time.monotonic()
+        if len(self.current) - self._shown >= self.min_delta and now - self._last_flush >= self.min_interval:
+            await self._edit_current(self.current)
+            self._last_flush = now
+
+    async def finish(self, parse_mode: str = 'HTML'):
+        """Flush everything, applying `parse_mode` to the final text of the last message"""
+        if not self.current.strip():
+            return
+        if self._current_id is None:
+            await self.ready()
+            result = await self.send(self.chat_id, self.current, parse_mode=parse_mode)
+            if result is None:
+                await self.send(self.chat_id, self.current, parse_mode=None)
+            return
+        if self._shown == len(self.current) and '<' not in self.current and '&' not in self.current:
+            return  # already shown in full, and without markup parse_mode would render it the same
+        # Partial edits are sent as plain text because half a reply can have unbalanced tags
+        if not await self._edit_current(self.current, parse_mode=parse_mode) and self._shown < len(self.current):
+            await self._edit_current(self.current)
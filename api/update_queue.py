@@ -0,0 +1,138 @@
+import os
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import Any, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+OVERFLOW_POLICIES = ('wait', 'drop_new', 'drop_oldest')
+
+
+class UpdateQueue:
+    """Bounded in-process work queue: concurrent across chats, strictly ordered within a chat"""
+
+    def __init__(self, handler: Callable[[Any], Awaitable[None]], workers: int = None,
+                 capacity: int = None, overflow: str = None):
+        self.handler = handler
+        self.workers = workers or int(os.getenv('UPDATE_WORKERS', '16'))
+        self.capacity = capacity or int(os.getenv('UPDATE_QUEUE_SIZE', '1000'))
+        self.overflow = overflow or os.getenv('UPDATE_OVERFLOW', 'wait')
+        if self.overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"UPDATE_OVERFLOW must be one of {OVERFLOW_POLICIES}, got {self.overflow!r}")
+
+        # Pending updates per chat; a chat key sits in _ready (or is being worked on) at most once,
+        # which is what keeps a single chat's updates in order.
+        self._pending: Dict[Hashable, Deque[Tuple[int, float, Any]]] = {}
+        self._scheduled = set()
+        self._ready: Optional[asyncio.Queue] = None
+        self._space: Optional[asyncio.Condition] = None
+        self._tasks: List[asyncio.Task] = []
+        self._size = 0
+        self._seq = 0
+        self._accepting = False
+        self._stats = {'enqueued': 0, 'processed': 0, 'failed': 0, 'dropped': 0, 'max_depth': 0,
+                       'queue_wait_seconds': 0.0}
+
+    @property
+    def running(self) -> bool:
+        return bool(self._tasks)
+
+    async def start(self):
+        """Spawn the worker pool"""
+        if self._tasks:
+            return
+        self._ready = asyncio.Queue()
+        self._space = asyncio.Condition()
+        self._accepting = True
+        self._tasks = [asyncio.create_task(self._worker(i)) for i in range(self.workers)]
+        logger.info(f"Update queue started: {self.workers} workers, capacity {self.capacity}, overflow={self.overflow}")
+
+    async def submit(self, key: Hashable, update: Any) -> bool:
+        """Queue an update for `key` (a chat id); returns False if it was dropped"""
+        if not self._accepting:
+            self._stats['dropped'] += 1
+            logger.warning(f"Update queue is not accepting work, dropping update for {key}")
+            return False
+
+        if self._size >= self.capacity:
+            if self.overflow == 'drop_new':
+                self._stats['dropped'] += 1
+                logger.warning(f"Update queue full ({self._size}), dropping new update for {key}")
+                return False
+            elif self.overflow == 'drop_oldest':
+                self._drop_oldest()
+            else:
+                # Backpressure: hold the webhook response until a worker frees a slot
+                async with self._space:
+                    await self._space.wait_for(lambda: self._size < self.capacity or not self._accepting)
+                if not self._accepting:
+                    self._stats['dropped'] += 1
+                    return False
+
+        self._seq += 1
+        self._pending.setdefault(key, deque()).append((self._seq, time.perf_counter(), update))
+        self._size += 1
+        self._stats['enqueued'] += 1
+        self._stats['max_depth'] = max(self._stats['max_depth'], self._size)
+        if key not in self._scheduled:
+            self._scheduled.add(key)
+            self._ready.put_nowait(key)
+        return True
+
+    def _drop_oldest(self):
+        key = min((k for k, items in self._pending.items() if items), key=lambda k: self._pending[k][0][0])
+        self._pending[key].popleft()
+        self._size -= 1
+        self._stats['dropped'] += 1
+        logger.warning(f"Update queue full, dropped oldest pending update for {key}")
+
+    async def _worker(self, index: int):
+        while True:
+            key = await self._ready.get()
+            try:
+                items = self._pending.get(key)
+                if items:
+                    _, queued_at, update = items.popleft()
+                    self._size -= 1
+                    self._stats['queue_wait_seconds'] += time.perf_counter() - queued_at
+                    async with self._space:
+                        self._space.notify()
+                    try:
+                        await self.handler(update)
+                        self._stats['processed'] += 1
+                    except Exception as e:
+                        self._stats['failed'] += 1
+                        logger.error(f"Worker {index} failed processing update for {key}: {e}")
+            finally:
+                if self._pending.get(key):
+                    # Go to the back of the line so one busy chat can't starve the others
+                    self._ready.put_nowait(key)
+                else:
+                    self._pending.pop(key, None)
+                    self._scheduled.discard(key)
+                self._ready.task_done()
+
+    async def drain(self, timeout: float = None):
+        """Stop accepting updates, finish what's queued (up to `timeout` seconds) and stop the workers"""
+        if not self._tasks:
+            return
+        self._accepting = False
+        async with self._space:
+            self._space.notify_all()
+        timeout = timeout if timeout is not None else float(os.getenv('UPDATE_DRAIN_TIMEOUT', '10'))
+        try:
+            await asyncio.wait_for(self._ready.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Update queue drain timed out with {self._size} updates still pending")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        logger.info(f"Update queue drained, stats: {self.stats()}")
+
+    def stats(self) -> Dict[str, Any]:
+        stats = dict(self._stats)
+        stats.update(depth=self._size, chats_pending=len(self._scheduled), workers=len(self._tasks))
+        return stats
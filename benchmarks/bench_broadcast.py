@@ -0,0 +1,110 @@
+"""Throughput and resume check for the broadcast fan-out (api/broadcast.py).
+
+Runs the real Broadcaster and SendScheduler in process against a simulated Telegram: every send
+takes --latency seconds and a few chats answer 403 (blocked). Partway through, the broadcast is
+stopped as if the server restarted, and a new Broadcaster picks the job up from the SQLite
+checkpoint. It checks that:
+- every reachable chat got the announcement,
+- repeats after the restart stay within the sends that were in flight,
+- blocked chats were pruned from the registry,
+and it reports throughput against the configured global rate, plus the projected time for 100k chats.
+
+Run from the repo root:  python benchmarks/bench_broadcast.py [--chats N] [--rate R] [--latency S]
+Exits non-zero if any check fails.
+"""
+import os
+import sys
+import time
+import asyncio
+import tempfile
+import argparse
+from collections import Counter
+
+import httpx
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.broadcast import Broadcaster, SqliteSubscriberRegistry  # noqa: E402
+from api.send_scheduler import SendScheduler, PRIORITY_BULK  # noqa: E402
+
+BLOCKED_EVERY = 50
+
+
+async def run(args, path: str) -> int:
+    registry = SqliteSubscriberRegistry(path)
+    for chat_id in range(1, args.chats + 1):
+        registry.add(chat_id)
+    blocked = {chat_id for chat_id in range(1, args.chats + 1) if chat_id % BLOCKED_EVERY == 0}
+
+    scheduler = SendScheduler(global_rate=args.rate)
+    delivered: Counter = Counter()
+    request = httpx.Request('POST', 'https://api.telegram.org/sendMessage')
+
+    async def send(chat_id, message):
+        async def post():
+            await asyncio.sleep(args.latency)
+            if chat_id in blocked:
+                return httpx.Response(403, json={'ok': False, 'description': 'Forbidden: bot was blocked by the user'},
+                                      request=request)
+            delivered[chat_id] += 1
+            return httpx.Response(200, json={'ok': True}, request=request)
+        return await scheduler.run(chat_id, post, PRIORITY_BULK)
+
+    started = time.perf_counter()
+    first = Broadcaster(registry, send, batch_size=args.batch_size, concurrency=args.concurrency)
+    first.start({'text': 'benchmark'})
+    await asyncio.sleep(args.restart_after)
+    await first.shutdown()
+    interrupted_at = first.progress()['done']
+
+    second = Broadcaster(SqliteSubscriberRegistry(path), send, batch_size=args.batch_size, concurrency=args.concurrency)
+    failures = 0
+    if not second.interrupted():
+        failures += 1
+        print("FAIL resume: the restarted broadcaster did not find the interrupted job")
+    second.resume()
+    while second.running:
+        await asyncio.sleep(0.1)
+    elapsed = time.perf_counter() - started
+    progress = second.progress()
+
+    reachable = args.chats - len(blocked)
+    missing = sum(1 for chat_id in range(1, args.chats + 1) if chat_id not in blocked and not delivered[chat_id])
+    repeats = sum(count - 1 for count in delivered.values())
+    if missing:
+        failures += 1
+        print(f"FAIL delivery: {missing} reachable chats got nothing")
+    if repeats > args.concurrency:
+        failures += 1
+        print(f"FAIL resume: {repeats} repeated sends, more than the {args.concurrency} that can be in flight")
+    if len(registry) != reachable:
+        failures += 1
+        print(f"FAIL prune: {len(registry)} chats left in the registry, expected {reachable}")
+    if progress['sent'] != reachable or progress['pruned'] != len(blocked):
+        failures += 1
+        print(f"FAIL counts: {progress}")
+
+    throughput = args.chats / elapsed
+    print(f"chats              : {args.chats} ({len(blocked)} blocked), restart after {interrupted_at} done")
+    print(f"elapsed            : {elapsed:.1f}s  ({throughput:,.0f} chats/s against a {args.rate:,.0f}/s budget)")
+    print(f"repeated sends     : {repeats} (concurrency {args.concurrency})")
+    print(f"100k chats at this : {100000 / throughput / 60:.1f} min")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--chats', type=int, default=20000)
+    parser.add_argument('--rate', type=float, default=1000.0, help='global sends per second (TELEGRAM_GLOBAL_RATE)')
+    parser.add_argument('--latency', type=float, default=0.05, help='simulated seconds per Telegram call')
+    parser.add_argument('--concurrency', type=int, default=100)
+    parser.add_argument('--batch-size', type=int, default=500)
+    parser.add_argument('--restart-after', type=float, default=3.0, help='seconds before the simulated restart')
+    args = parser.parse_args()
+    with tempfile.TemporaryDirectory() as tmp:
+        failures = asyncio.run(run(args, os.path.join(tmp, 'subscribers.sqlite3')))
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Benchmark and correctness check for the feeling classifier.
+
+Compares FeelingClassifier against the original chained any() substring scans.
+It checks that:
+- messages where the old code was right must classify the same way,
+- the known substring misfires ('hi' in "this", 'like' in "unlikely") must be fixed,
+- and it reports per-message time for both.
+
+Run from the repo root:  python benchmarks/bench_feelings.py [--iterations N]
+Exits non-zero if any expectation fails.
+"""
+import os
+import sys
+import time
+import random
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.feelings import FeelingClassifier, FEELING_KEYWORDS, SAI_KEYWORDS  # noqa: E402
+
+
+def legacy_classify(message_text):
+    """The original determine_feeling + sai_keywords scan from api/index.py"""
+    message_lower = message_text.lower()
+    feeling = None
+    for name, keywords in FEELING_KEYWORDS:
+        if any(word in message_lower for word in keywords):
+            feeling = name
+            break
+    return feeling, any(keyword in message_lower for keyword in SAI_KEYWORDS)
+
+
+# Messages the old scan classified correctly; both implementations must agree
+SAME_AS_LEGACY = [
+    "hello there!",
+    "Hi",
+    "hey sai, good morning",
+    "omg that's insane",
+    "wow, amazing work",
+    "that is so cool",
+    "I'm happy today",
+    "nice one",
+    "I love it",
+    "yes, exactly right",
+    "thank you so much",
+    "thanks!",
+    "aww so cute",
+    "what does he do?",
+    "how old is he",
+    "where does sai study?",
+    "I'm confused",
+    "I don't understand",
+    "can you help me",
+    "who is sai mahendra",
+    "Tell me about Sai",
+    "bejawada sai mahendra skills",
+    "mahendra's resume",
+    "ok",
+    "",
+    "Sai's projects look professional",
+]
+
+# Messages the old scan got wrong because of substring matches: (message, feeling, is_about_sai)
+FIXED_MISFIRES = [
+    ("this is unlikely", None, False),                 # 'hi' in "this", 'like' in "unlikely"
+    ("which one", None, False),                        # 'hi' in "which"
+    ("they went hiking", None, False),                 # 'hi' in "hiking"
+    ("something about the plane", None, False),        # 'hi' in "something"
+    ("I saw a mosaic", None, False),                   # 'sai' in "mosaic"
+    ("the network is slow", None, False),              # 'work' in "network"
+    ("WTF is this", 'wtf', False),                     # 'hi' in "this" outranked 'wtf'
+    ("tell me about his project", 'serious', False),   # 'hi' in "his"
+    ("show me", None, False),                          # 'how' in "show"
+    ("I liked his projects", 'happy', False),          # inflections still count
+]
+
+
+def check() -> int:
+    classifier = FeelingClassifier()
+    failures = 0
+    for message in SAME_AS_LEGACY:
+        expected = legacy_classify(message)
+        actual = classifier.classify(message)
+        if actual != expected:
+            failures += 1
+            print(f"FAIL parity   {message!r}: legacy={expected} new={actual}")
+    for message, feeling, about_sai in FIXED_MISFIRES:
+        actual = classifier.classify(message)
+        if actual != (feeling, about_sai):
+            failures += 1
+            print(f"FAIL misfire  {message!r}: expected={(feeling, about_sai)} new={actual}")
+        elif legacy_classify(message) == actual:
+            print(f"note          {message!r}: legacy already agreed")
+    total = len(SAME_AS_LEGACY) + len(FIXED_MISFIRES)
+    print(f"correctness: {total - failures}/{total} cases passed")
+    return failures
+
+
+def bench(iterations: int):
+    words = ("the quick brown fox said this is unlikely to work but maybe we should ask how "
+             "the project went and whether sai liked the network stack").split()
+    random.seed(7)
+    corpus = [' '.join(random.choices(words, k=random.randint(3, 60))) for _ in range(500)]
+    corpus += SAME_AS_LEGACY + [message for message, _, _ in FIXED_MISFIRES]
+    classifier = FeelingClassifier()
+
+    for name, fn in (('legacy any() scans', legacy_classify), ('compiled matcher', classifier.classify)):
+        start = time.perf_counter()
+        for _ in range(iterations):
+            for message in corpus:
+                fn(message)
+        elapsed = time.perf_counter() - start
+        per_message = elapsed / (iterations * len(corpus)) * 1e6
+        print(f"{name:>20}: {per_message:7.2f} us/message")
+
+    start = time.perf_counter()
+    FeelingClassifier()
+    print(f"{'build':>20}: {(time.perf_counter() - start) * 1e3:7.2f} ms (once per process)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--iterations', type=int, default=50)
+    args = parser.parse_args()
+    failures = check()
+    bench(args.iterations)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Cold-start benchmark for the serverless entry point.
+
+Each run is a fresh interpreter. It reports:
+- how long `import api.index` takes (what Vercel pays before the first request),
+- the time to the first `/` response,
+- the time to the first /help reply through /webhook, with Telegram stubbed by a local server,
+- and how long the first Gemini-backed message pays to import and configure the SDK.
+
+Run from the repo root:  python benchmarks/bench_startup.py [--runs N] [--max-import-ms MS] [--max-first-response-ms MS]
+Exits non-zero if a median exceeds the given limits.
+"""
+import os
+import sys
+import json
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METRICS = ('import', 'first_root', 'first_help', 'gemini_sdk')
+
+
+def child():
+    """One cold start; prints the timings (seconds) as JSON on stdout"""
+    import threading
+    from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+    class FakeTelegram(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('content-length') or 0))
+            body = b'{"ok": true, "result": {"message_id": 1}}'
+            self.send_response(200)
+            self.send_header('content-type', 'application/json')
+            self.send_header('content-length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeTelegram)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['TELEGRAM_API_BASE'] = f"http://127.0.0.1:{server.server_port}"
+
+    sys.path.insert(0, ROOT)
+    started = time.perf_counter()
+    import api.index as index
+    timings = {'import': time.perf_counter() - started}
+
+    import asyncio
+    import httpx
+
+    async def first_requests():
+        transport = httpx.ASGITransport(app=index.app)
+        async with httpx.AsyncClient(transport=transport, base_url='http://bench') as client:
+            begin = time.perf_counter()
+            (await client.get('/')).raise_for_status()
+            timings['first_root'] = time.perf_counter() - begin
+            begin = time.perf_counter()
+            update = {'update_id': 1, 'message': {'chat': {'id': 1}, 'text': '/help'}}
+            (await client.post('/webhook', json=update)).raise_for_status()
+            timings['first_help'] = time.perf_counter() - begin
+        await index.bot.http.close()
+
+    asyncio.run(first_requests())
+    begin = time.perf_counter()
+    index.bot.model
+    timings['gemini_sdk'] = time.perf_counter() - begin
+    print(json.dumps(timings))
+
+
+def run_once():
+    env = dict(os.environ)
+    env.setdefault('BOT_ID', 'bench-token')
+    env.setdefault('GEMINI_API', 'bench-key')
+    env.update(LOG_LEVEL='ERROR', TENOR_API='', MEDIA_CACHE_PATH='', DEDUPE_BACKEND='memory',
+               PYTHONWARNINGS='ignore')
+    out = subprocess.run([sys.executable, os.path.abspath(__file__), '--child'], cwd=ROOT, env=env,
+                         capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--max-import-ms', type=float, default=None)
+    parser.add_argument('--max-first-response-ms', type=float, default=None)
+    parser.add_argument('--child', action='store_true', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        child()
+        return
+
+    runs = [run_once() for _ in range(args.runs)]
+    medians = {}
+    for metric in METRICS:
+        values = [run[metric] * 1e3 for run in runs]
+        medians[metric] = statistics.median(values)
+        print(f"{metric:>12}: median {medians[metric]:8.1f} ms   min {min(values):8.1f} ms   max {max(values):8.1f} ms")
+    first_response = medians['import'] + medians['first_help']
+    print(f"{'cold /help':>12}: median {first_response:8.1f} ms (import + first reply)")
+
+    failed = False
+    if args.max_import_ms is not None and medians['import'] > args.max_import_ms:
+        print(f"FAIL import took {medians['import']:.1f} ms (limit {args.max_import_ms} ms)")
+        failed = True
+    if args.max_first_response_ms is not None and first_response > args.max_first_response_ms:
+        print(f"FAIL first response took {first_response:.1f} ms (limit {args.max_first_response_ms} ms)")
+        failed = True
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,130 @@
+"""Per-operation cost and multi-process correctness of the shared-state layer (api/state.py).
+
+It checks that:
+- both backends agree on get/set/add/incr/TTL semantics,
+- concurrent incr/add from several processes on one SQLite file lose no updates and admit each key once,
+- and it reports per-operation latency for each backend, plus aggregate ops/s under contention.
+
+Run from the repo root:  python benchmarks/bench_state.py [--ops N] [--procs N]
+Exits non-zero if any check fails.
+"""
+import os
+import sys
+import time
+import tempfile
+import argparse
+import statistics
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.state import MemoryState, SqliteState  # noqa: E402
+
+
+def check_semantics(state) -> int:
+    failures = []
+    state.set('a', {'x': 1})
+    if state.get('a') != {'x': 1}:
+        failures.append('set/get round trip')
+    if state.add('a', 2):
+        failures.append('add over a live key')
+    if not state.add('b', 2, ttl=0.05):
+        failures.append('add of a new key')
+    if [state.incr('n'), state.incr('n', 5)] != [1, 6]:
+        failures.append('incr')
+    state.incr('t', ttl=0.05)
+    time.sleep(0.06)
+    if state.get('b') is not None:
+        failures.append('TTL expiry')
+    if not state.add('b', 3):
+        failures.append('add over an expired key')
+    if state.incr('t') != 1:
+        failures.append('incr restarts an expired counter')
+    if state.count('') != 4:
+        failures.append(f'count (got {state.count("")})')
+    state.delete('a')
+    if state.get('a') is not None:
+        failures.append('delete')
+    for failure in failures:
+        print(f"FAIL {type(state).__name__}: {failure}")
+    return len(failures)
+
+
+def bench_ops(state, ops: int):
+    keys = [f"key:{i % 1000}" for i in range(ops)]
+    results = {}
+    for name, op in (
+        ('set', lambda key: state.set(key, 'file-id-AgADBAADr6cxGw', ttl=60)),
+        ('get', state.get),
+        ('add', lambda key: state.add(key + ':new', 1, ttl=60)),
+        ('incr', lambda key: state.incr(key + ':n', ttl=60)),
+    ):
+        samples = []
+        for key in keys:
+            start = time.perf_counter()
+            op(key)
+            samples.append(time.perf_counter() - start)
+        samples.sort()
+        results[name] = (statistics.mean(samples), samples[int(len(samples) * 0.99)])
+    return results
+
+
+def _worker(path: str, ops: int, adds: int, barrier, queue):
+    state = SqliteState(path)
+    barrier.wait()
+    start = time.perf_counter()
+    for _ in range(ops):
+        state.incr('shared:counter')
+    admitted = sum(state.add(f"shared:update:{i}", 1, ttl=60) for i in range(adds))
+    queue.put((ops + adds, time.perf_counter() - start, admitted))
+
+
+def check_contention(path: str, procs: int, ops: int) -> int:
+    adds = 500
+    barrier = multiprocessing.Barrier(procs)
+    queue = multiprocessing.Queue()
+    workers = [multiprocessing.Process(target=_worker, args=(path, ops, adds, barrier, queue)) for _ in range(procs)]
+    for worker in workers:
+        worker.start()
+    results = [queue.get() for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    failures = 0
+    total = SqliteState(path).get('shared:counter')
+    if total != procs * ops:
+        failures += 1
+        print(f"FAIL contention: counter is {total}, expected {procs * ops}")
+    admitted = sum(result[2] for result in results)
+    if admitted != adds:
+        failures += 1
+        print(f"FAIL contention: {admitted} adds succeeded for {adds} keys")
+    done = sum(result[0] for result in results)
+    elapsed = max(result[1] for result in results)
+    print(f"{procs} processes on one SQLite file: {done / elapsed:,.0f} ops/s total, "
+          f"{elapsed / (done / procs) * 1e6:.1f} us/op per process")
+    return failures
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--ops', type=int, default=20000, help='operations per benchmark pass')
+    parser.add_argument('--procs', type=int, default=4, help='processes in the contention check')
+    args = parser.parse_args()
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as tmp:
+        failures += check_semantics(MemoryState())
+        failures += check_semantics(SqliteState(os.path.join(tmp, 'semantics.sqlite3')))
+        print(f"semantics: {'ok' if not failures else f'{failures} failures'}")
+
+        for name, state in (('memory', MemoryState()), ('sqlite', SqliteState(os.path.join(tmp, 'bench.sqlite3')))):
+            for op, (mean, p99) in bench_ops(state, args.ops).items():
+                print(f"{name:>7} {op:>5}: {mean * 1e6:7.2f} us mean  {p99 * 1e6:7.2f} us p99")
+
+        failures += check_contention(os.path.join(tmp, 'contention.sqlite3'), args.procs, args.ops // args.procs)
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
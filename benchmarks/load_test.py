@@ -0,0 +1,341 @@
+"""Offline load test: the real app against local Telegram, Tenor and Gemini stand-ins.
+
+One stand-in server answers all three APIs:
+- Telegram Bot API calls (/bot<token>/<method>),
+- Tenor /v2/search,
+- Gemini REST generateContent / streamGenerateContent.
+Each has its own latency, error rate and 429 rate. The bot runs
+unmodified under uvicorn in a subprocess, pointed at the stand-ins through
+TELEGRAM_API_BASE, TENOR_API_BASE and GEMINI_API_ENDPOINT.
+
+Updates are POSTed to /webhook open-loop at --rate per second. They are either
+synthetic (a mix of commands and questions over --chats chats) or replayed from
+--replay, a JSONL file with one Telegram update per line. The report covers:
+- webhook throughput and ack latency,
+- reply latency (webhook POST to the first text reply the Telegram stand-in receives for that chat),
+- what the stand-ins served,
+- event-loop lag scraped from the bot's /metrics.
+
+Run from the repo root:
+    python benchmarks/load_test.py --rate 50 --duration 20 --mode queue --gemini-latency 0.8 --telegram-429-rate 0.02
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import defaultdict, deque
+from typing import Any, Deque, Dict, List, Optional
+
+import httpx
+import uvicorn
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+BOT_TOKEN = 'load-test-token'
+# Telegram methods that carry a reply's text (the first one per update marks the reply latency)
+REPLY_METHODS = {'sendMessage', 'sendDocument'}
+
+SYNTHETIC_TEXTS = [
+    '/start', '/help', '/about_sai', '/resume',
+    'hello!', 'who is sai?', 'what projects has sai built?', 'wow that is amazing',
+    'thanks a lot', 'how does skillcert work?', 'tell me about his skills', 'is he good at java?',
+]
+
+
+class ServiceConfig:
+    """Latency (mean seconds, +/-50% jitter) and failure rates for one stand-in API"""
+
+    def __init__(self, latency: float = 0.0, error_rate: float = 0.0, rate_limit_rate: float = 0.0,
+                 retry_after: int = 1):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+
+    async def delay(self):
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * random.uniform(0.5, 1.5))
+
+    def outcome(self) -> str:
+        roll = random.random()
+        if roll < self.rate_limit_rate:
+            return 'rate_limited'
+        if roll < self.rate_limit_rate + self.error_rate:
+            return 'error'
+        return 'ok'
+
+
+class StandIns:
+    """Starlette app imitating the three upstream APIs and recording what it served"""
+
+    def __init__(self, telegram: ServiceConfig, tenor: ServiceConfig, gemini: ServiceConfig,
+                 gemini_chunks: int = 4):
+        self.telegram = telegram
+        self.tenor = tenor
+        self.gemini = gemini
+        self.gemini_chunks = gemini_chunks
+        self.served: Dict[str, int] = defaultdict(int)
+        self.reply_listeners: List = []
+        self._message_id = 0
+        self.app = Starlette(routes=[
+            Route('/bot{token}/{method}', self.telegram_api, methods=['GET', 'POST']),
+            Route('/v2/search', self.tenor_search),
+            Route('/v1beta/models/{model_action:path}', self.gemini_generate, methods=['POST']),
+        ])
+
+    async def telegram_api(self, request: Request):
+        method = request.path_params['method']
+        body = await request.json() if method != 'getUpdates' else {}
+        await self.telegram.delay()
+        outcome = self.telegram.outcome()
+        self.served[f"telegram_{method}_{outcome}"] += 1
+        if outcome == 'rate_limited':
+            return JSONResponse({'ok': False, 'error_code': 429, 'description': 'Too Many Requests',
+                                 'parameters': {'retry_after': self.telegram.retry_after}},
+                                status_code=429, headers={'Retry-After': str(self.telegram.retry_after)})
+        if outcome == 'error':
+            return JSONResponse({'ok': False, 'error_code': 500, 'description': 'Internal Server Error'},
+                                status_code=500)
+        if method in REPLY_METHODS:
+            for listener in self.reply_listeners:
+                listener(body.get('chat_id'))
+        self._message_id += 1
+        result = {'message_id': self._message_id, 'chat': {'id': body.get('chat_id')}}
+        if method == 'sendAnimation':
+            result['animation'] = {'file_id': f"ANI-{hash(body.get('animation')) & 0xffff}"}
+        elif method == 'sendDocument':
+            result['document'] = {'file_id': 'DOC-resume'}
+        return JSONResponse({'ok': True, 'result': result})
+
+    async def tenor_search(self, request: Request):
+        await self.tenor.delay()
+        outcome = self.tenor.outcome()
+        self.served[f"tenor_search_{outcome}"] += 1
+        if outcome != 'ok':
+            return JSONResponse({'error': {'code': 429 if outcome == 'rate_limited' else 500}},
+                                status_code=429 if outcome == 'rate_limited' else 500)
+        query = request.query_params.get('q', 'gif').replace(' ', '-')
+        return JSONResponse({'results': [
+            {'media_formats': {'gif': {'url': f"https://media.example/{query}/{i}.gif"}}} for i in range(20)
+        ]})
+
+    def _candidate(self, text: str) -> Dict[str, Any]:
+        return {'candidates': [{'content': {'parts': [{'text': text}], 'role': 'model'},
+                                'finishReason': 'STOP', 'index': 0}]}
+
+    async def gemini_generate(self, request: Request):
+        streaming = request.path_params['model_action'].endswith(':streamGenerateContent')
+        await request.body()
+        outcome = self.gemini.outcome()
+        self.served[f"gemini_{'stream' if streaming else 'generate'}_{outcome}"] += 1
+        if outcome != 'ok':
+            await self.gemini.delay()
+            code = 429 if outcome == 'rate_limited' else 500
+            status = 'RESOURCE_EXHAUSTED' if code == 429 else 'INTERNAL'
+            return JSONResponse({'error': {'code': code, 'message': 'stand-in failure', 'status': status}},
+                                status_code=code)
+        words = ["Sai", "is", "a", "student", "developer", "who", "loves", "building", "things."] * 3
+        if not streaming:
+            await self.gemini.delay()
+            return JSONResponse(self._candidate(' '.join(words)))
+
+        async def chunks():
+            # The REST transport reads a streamed JSON array; spread the total latency over the chunks
+            per_chunk = len(words) // self.gemini_chunks
+            yield '['
+            for i in range(self.gemini_chunks):
+                await asyncio.sleep(self.gemini.latency * random.uniform(0.5, 1.5) / self.gemini_chunks)
+                part = words[i * per_chunk:] if i == self.gemini_chunks - 1 else words[i * per_chunk:(i + 1) * per_chunk]
+                yield (',' if i else '') + json.dumps(self._candidate(' '.join(part) + ' '))
+            yield ']'
+        return StreamingResponse(chunks(), media_type='application/json')
+
+
+def percentile(values: List[float], q: float) -> float:
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q / 100 * (len(ordered) - 1))))]
+
+
+def histogram_quantile(buckets: List[tuple], q: float) -> Optional[float]:
+    """Upper bound of the bucket holding quantile q, from cumulative (le, count) pairs"""
+    if not buckets or buckets[-1][1] == 0:
+        return None
+    target = q / 100 * buckets[-1][1]
+    for bound, count in buckets:
+        if count >= target:
+            return bound
+    return buckets[-1][0]
+
+
+def synthetic_updates(count: int, chats: int, seed: int = 1) -> List[Dict[str, Any]]:
+    rng = random.Random(seed)
+    return [{'update_id': 100000 + i,
+             'message': {'message_id': i, 'chat': {'id': rng.randint(1, chats), 'type': 'private'},
+                         'text': rng.choice(SYNTHETIC_TEXTS)}}
+            for i in range(count)]
+
+
+def load_replay(path: str) -> List[Dict[str, Any]]:
+    with open(path, encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+async def wait_until_up(client: httpx.AsyncClient, url: str, timeout: float = 30.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            if (await client.get(url)).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError(f"{url} did not come up within {timeout}s")
+
+
+async def run(args):
+    stand_ins = StandIns(
+        telegram=ServiceConfig(args.telegram_latency, args.telegram_error_rate, args.telegram_429_rate,
+                               args.telegram_retry_after),
+        tenor=ServiceConfig(args.tenor_latency, args.tenor_error_rate),
+        gemini=ServiceConfig(args.gemini_latency, args.gemini_error_rate, args.gemini_429_rate),
+    )
+    stub_server = uvicorn.Server(uvicorn.Config(stand_ins.app, host='127.0.0.1', port=args.stub_port,
+                                                log_level='warning', lifespan='off'))
+    stub_task = asyncio.create_task(stub_server.serve())
+    stub_url = f"http://127.0.0.1:{args.stub_port}"
+
+    env = dict(os.environ)
+    env.update(
+        BOT_ID=BOT_TOKEN, GEMINI_API='load-test-key', TENOR_API='load-test-key',
+        TELEGRAM_API_BASE=stub_url, TENOR_API_BASE=stub_url, GEMINI_API_ENDPOINT=stub_url,
+        WEBHOOK_MODE=args.mode, STREAM_REPLIES='1' if args.stream else '0',
+        LOG_LEVEL=args.log_level, MEDIA_CACHE_PATH='', DEDUPE_BACKEND='memory', GEMINI_PREWARM='1',
+        LOOP_LAG_INTERVAL=str(args.lag_interval), PYTHONWARNINGS='ignore',
+    )
+    bot_url = f"http://127.0.0.1:{args.bot_port}"
+    bot = subprocess.Popen([sys.executable, '-m', 'uvicorn', 'api.index:app', '--host', '127.0.0.1',
+                            '--port', str(args.bot_port), '--log-level', 'warning'], cwd=ROOT, env=env)
+
+    pending: Dict[Any, Deque[float]] = defaultdict(deque)
+    reply_latencies: List[float] = []
+
+    def on_reply(chat_id):
+        queue = pending.get(chat_id)
+        if queue:
+            reply_latencies.append(time.perf_counter() - queue.popleft())
+    stand_ins.reply_listeners.append(on_reply)
+
+    updates = load_replay(args.replay) if args.replay else synthetic_updates(int(args.rate * args.duration), args.chats)
+    ack_latencies: List[float] = []
+    failures: Dict[str, int] = defaultdict(int)
+    limits = httpx.Limits(max_connections=args.connections, max_keepalive_connections=args.connections)
+    try:
+        async with httpx.AsyncClient(limits=limits, timeout=args.request_timeout) as client:
+            await wait_until_up(client, bot_url + '/')
+            # Give the background Gemini SDK import a moment so it isn't charged to the first requests
+            await asyncio.sleep(args.warmup)
+
+            async def post(update):
+                chat_id = update.get('message', {}).get('chat', {}).get('id')
+                started = time.perf_counter()
+                pending[chat_id].append(started)
+                try:
+                    response = await client.post(bot_url + '/webhook', json=update)
+                    ack_latencies.append(time.perf_counter() - started)
+                    if response.status_code != 200 or response.json().get('status') != 'ok':
+                        failures[f"http_{response.status_code}"] += 1
+                except httpx.HTTPError as e:
+                    failures[type(e).__name__] += 1
+
+            print(f"Replaying {len(updates)} updates at {args.rate}/s against {bot_url} (mode={args.mode})")
+            began = time.perf_counter()
+            tasks = []
+            for i, update in enumerate(updates):
+                delay = began + i / args.rate - time.perf_counter()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                tasks.append(asyncio.create_task(post(update)))
+            send_elapsed = time.perf_counter() - began
+            await asyncio.gather(*tasks)
+            ack_elapsed = time.perf_counter() - began
+
+            # Let outstanding replies land (queue mode acks before the work is done)
+            settle_deadline = time.monotonic() + args.settle
+            while sum(len(q) for q in pending.values()) and time.monotonic() < settle_deadline:
+                await asyncio.sleep(0.2)
+            total_elapsed = time.perf_counter() - began
+
+            metrics_text = (await client.get(bot_url + '/metrics')).text
+    finally:
+        bot.terminate()
+        try:
+            bot.wait(timeout=15)
+        except subprocess.TimeoutExpired:
+            bot.kill()
+        stub_server.should_exit = True
+        await stub_task
+
+    lag_buckets, max_lag = [], None
+    for line in metrics_text.splitlines():
+        if line.startswith('sai_bot_stage_seconds_bucket{stage="event_loop_lag"'):
+            bound = line.split('le="', 1)[1].split('"', 1)[0]
+            lag_buckets.append((float('inf') if bound == '+Inf' else float(bound), int(line.rsplit(' ', 1)[1])))
+        elif line.startswith('sai_bot_loop_max_lag_seconds '):
+            max_lag = float(line.rsplit(' ', 1)[1])
+
+    ms = lambda seconds: f"{seconds * 1e3:8.1f} ms"
+    print()
+    print(f"offered rate       : {len(updates) / send_elapsed:8.1f} updates/s over {send_elapsed:.1f}s")
+    print(f"acked throughput   : {len(ack_latencies) / ack_elapsed:8.1f} updates/s ({len(ack_latencies)}/{len(updates)} acked)")
+    print(f"replied throughput : {len(reply_latencies) / total_elapsed:8.1f} updates/s ({len(reply_latencies)}/{len(updates)} replied)")
+    for name, values in (('webhook ack', ack_latencies), ('reply', reply_latencies)):
+        print(f"{name + ' latency':<19}: p50 {ms(percentile(values, 50))}  p95 {ms(percentile(values, 95))}  "
+              f"p99 {ms(percentile(values, 99))}  max {ms(max(values) if values else float('nan'))}")
+    if lag_buckets:
+        p50, p99 = histogram_quantile(lag_buckets, 50), histogram_quantile(lag_buckets, 99)
+        print(f"event loop lag     : p50 <= {ms(p50)}  p99 <= {ms(p99)}  max {ms(max_lag or 0.0)}")
+    if failures:
+        print(f"client failures    : {dict(failures)}")
+    print(f"stand-ins served   : {json.dumps(dict(sorted(stand_ins.served.items())))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rate', type=float, default=20, help="updates per second")
+    parser.add_argument('--duration', type=float, default=10, help="seconds of synthetic traffic")
+    parser.add_argument('--chats', type=int, default=100, help="distinct chats in synthetic traffic")
+    parser.add_argument('--replay', help="JSONL file of Telegram updates to replay instead")
+    parser.add_argument('--mode', choices=['sync', 'queue'], default='queue', help="bot WEBHOOK_MODE")
+    parser.add_argument('--stream', action='store_true', help="run the bot with STREAM_REPLIES=1")
+    parser.add_argument('--telegram-latency', type=float, default=0.05)
+    parser.add_argument('--telegram-error-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-429-rate', type=float, default=0.0)
+    parser.add_argument('--telegram-retry-after', type=int, default=1)
+    parser.add_argument('--tenor-latency', type=float, default=0.1)
+    parser.add_argument('--tenor-error-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-latency', type=float, default=0.8)
+    parser.add_argument('--gemini-error-rate', type=float, default=0.0)
+    parser.add_argument('--gemini-429-rate', type=float, default=0.0)
+    parser.add_argument('--bot-port', type=int, default=18080)
+    parser.add_argument('--stub-port', type=int, default=18081)
+    parser.add_argument('--connections', type=int, default=200, help="client connection pool size")
+    parser.add_argument('--request-timeout', type=float, default=60)
+    parser.add_argument('--warmup', type=float, default=2, help="seconds to wait after the bot is up")
+    parser.add_argument('--settle', type=float, default=30, help="max seconds to wait for outstanding replies")
+    parser.add_argument('--lag-interval', type=float, default=0.1, help="bot's LOOP_LAG_INTERVAL")
+    parser.add_argument('--log-level', default='ERROR', help="bot's LOG_LEVEL")
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+
+if __name__ == '__main__':
+    main()